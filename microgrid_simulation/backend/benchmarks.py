@@ -0,0 +1,344 @@
+"""
+benchmarks.py
+
+Reproducible performance benchmarks for the simulation core and the API. Every scenario
+is built from a fixed seed, so two runs on the same machine simulate identical sites,
+weather and demand and their numbers can be compared between commits.
+
+    python benchmarks.py                          # all scenarios, writes benchmark-results.json
+    python benchmarks.py --quick -s small         # short horizons, one scenario
+    python benchmarks.py -o new.json --compare benchmark-results.json
+
+Measured per scenario:
+    core      Environment.set_environment_values, get_realistic_demand and
+              MicrogridManager.step calls per second
+    run       MicrogridManager.run over the scenario horizon: steps/sec and peak memory
+    api       unified_api route latency (in-process test client) on a session
+              holding the scenario's site
+
+Throughputs are the median of --samples timed runs after an untimed warm-up, and API
+latencies are percentiles over many requests after a few warm-up requests, so --compare
+is not thrown by a single slow run.
+"""
+from datetime import datetime, timedelta
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+from environment_simulation import Environment, spawn_seeds
+from power_simulation import MicrogridManager, DemandGenerator, build_device, get_realistic_demand
+
+BENCHMARK_SEED = 20240101
+BENCHMARK_START = datetime(2024, 1, 1)
+RESULTS_FILE = "benchmark-results.json"
+# Longer horizons are run in chunks of this many steps, as simulation jobs are
+RUN_CHUNK_STEPS = 8760
+# Timed samples per throughput benchmark, after one untimed warm-up; results and
+# comparisons use the median
+BENCHMARK_SAMPLES = 5
+# Untimed requests per route before API latencies are recorded
+API_WARMUP_REQUESTS = 3
+
+# name: (devices, horizon in hourly steps)
+SCENARIOS = {
+    "small": (10, 24),
+    "medium": (1000, 365 * 24),
+    "mega": (10000, 5 * 365 * 24),
+}
+# --quick caps every horizon at one week
+QUICK_HORIZON_STEPS = 7 * 24
+
+# Share of each device type in a scenario's site; there is always one grid connection
+DEVICE_MIX = (("SolarPanel", 0.45), ("WindTurbine", 0.25), ("Battery", 0.15), ("DieselGenerator", 0.15))
+
+
+def build_site(device_count: int, seed=BENCHMARK_SEED) -> list:
+    """Device config dicts for a reproducible site of device_count devices"""
+    rng = np.random.default_rng(seed)
+    configs = [{"type": "GridConnection", "name": "grid", "import_price": 0.3, "export_price": 0.1}]
+    counts = [int((device_count - 1) * share) for _, share in DEVICE_MIX]
+    counts[0] += device_count - 1 - sum(counts)
+    for (device_type, _), count in zip(DEVICE_MIX, counts):
+        for i in range(count):
+            name = f"{device_type.lower()}_{i}"
+            if device_type == "SolarPanel":
+                configs.append({"type": device_type, "name": name, "rated_power": float(rng.uniform(50, 500))})
+            elif device_type == "WindTurbine":
+                configs.append({"type": device_type, "name": name, "rated_power": float(rng.uniform(100, 2000)),
+                                "direction": int(rng.integers(0, 360)), "cut_in_speed": 3.0,
+                                "rated_speed": 12.0, "cut_out_speed": 25.0})
+            elif device_type == "Battery":
+                capacity = float(rng.uniform(200, 5000))
+                configs.append({"type": device_type, "name": name, "capacity_kwh": capacity,
+                                "max_power_kw": capacity / 4})
+            else:
+                configs.append({"type": device_type, "name": name, "rated_power": float(rng.uniform(100, 1000))})
+    return configs
+
+
+def build_scenario(device_count: int, seed=BENCHMARK_SEED) -> tuple:
+    """Fresh (environment, microgrid, demand generator) for a scenario"""
+    environment_seed, demand_seed = spawn_seeds(seed, 2)
+    environment = Environment(environment_seed, BENCHMARK_START)
+    microgrid = MicrogridManager(environment, [build_device(c) for c in build_site(device_count, seed)])
+    # Scale demand with the site so dispatch has real work to do at every size
+    demand = DemandGenerator(max(5000.0, 600.0 * device_count), demand_seed)
+    return environment, microgrid, demand
+
+
+def _timed(prepare, repeat: int, samples: int) -> list:
+    """
+    Seconds for `repeat` calls of the function prepare() returns, once per sample after an
+    untimed warm-up run. prepare() is called before every run, so each starts from the
+    same state.
+    """
+    timings = []
+    for sample in range(samples + 1):
+        function = prepare()
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        if sample:
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _rate(name: str, scenario: str, calls: int, timings: list, unit: str = "calls") -> dict:
+    """Throughput from the median sample, which compare() checks; all samples are kept"""
+    seconds = float(np.median(timings))
+    return {"benchmark": name, "scenario": scenario, unit: calls, "seconds": seconds,
+            f"{unit}_per_sec": calls / seconds if seconds > 0 else None, "samples_seconds": timings}
+
+
+def bench_core(scenario: str, device_count: int, calls: int, samples: int = BENCHMARK_SAMPLES) -> list:
+    """Per-call throughput of the functions on the live-simulation path"""
+    times = [BENCHMARK_START + timedelta(hours=i) for i in range(calls)]
+    total_daily_kwh = build_scenario(device_count)[2].total_daily_kwh
+
+    def prepare_set_values():
+        environment = Environment(BENCHMARK_SEED, BENCHMARK_START)
+        moments = iter(times)
+
+        def set_values():
+            environment.current_time = next(moments)
+            environment.set_environment_values()
+        return set_values
+
+    def prepare_demand():
+        rng = np.random.default_rng(BENCHMARK_SEED)
+        moments = iter(times)
+        return lambda: get_realistic_demand(next(moments), total_daily_kwh, rng)
+
+    def prepare_step():
+        environment, microgrid, demand = build_scenario(device_count)
+        demands = iter(demand.series(BENCHMARK_START, calls).tolist())
+
+        def step():
+            microgrid.step(next(demands), 1.0)
+            environment.step(1.0)
+        return step
+
+    return [
+        _rate("Environment.set_environment_values", scenario, calls, _timed(prepare_set_values, calls, samples)),
+        _rate("get_realistic_demand", scenario, calls, _timed(prepare_demand, calls, samples)),
+        _rate("MicrogridManager.step", scenario, calls, _timed(prepare_step, calls, samples), unit="steps"),
+    ]
+
+
+def _run_horizon(device_count: int, horizon_steps: int):
+    environment, microgrid, demand = build_scenario(device_count)
+    done = 0
+    while done < horizon_steps:
+        steps = min(RUN_CHUNK_STEPS, horizon_steps - done)
+        microgrid.run(steps, demand.series(environment.current_time, steps), 1.0)
+        done += steps
+
+
+def bench_run(scenario: str, device_count: int, horizon_steps: int, samples: int = BENCHMARK_SAMPLES) -> list:
+    """Vectorized MicrogridManager.run over the horizon, timed then repeated under tracemalloc"""
+    timings = _timed(lambda: lambda: _run_horizon(device_count, horizon_steps), 1, samples)
+    result = _rate("MicrogridManager.run", scenario, horizon_steps, timings, unit="steps")
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _run_horizon(device_count, horizon_steps)
+        result["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+    return [result]
+
+
+def bench_api(scenario: str, device_count: int, repeat: int) -> list:
+    """Latency of unified_api routes for a session holding the scenario's site"""
+    from fastapi.testclient import TestClient
+    import unified_api
+
+    client = TestClient(unified_api.app)
+    response = client.post("/sessions", json={"seed": BENCHMARK_SEED, "start_time": BENCHMARK_START.isoformat(),
+                                              "site": {"devices": build_site(device_count)}})
+    response.raise_for_status()
+    session_id = response.json()["id"]
+    headers = {"X-Session-ID": session_id}
+    # Give /history and /stats some rows to read
+    for _ in range(24):
+        client.post("/simulate/realistic", headers=headers)
+
+    etag = client.get("/", headers=headers).headers.get("etag")
+    routes = [
+        ("GET", "/", {}),
+        ("GET", "/ (If-None-Match)", {"If-None-Match": etag}),
+        ("GET", "/environment", {}),
+        ("GET", "/devices", {}),
+        ("GET", "/batteries/status", {}),
+        ("GET", "/diesel/status", {}),
+        ("GET", "/history", {}),
+        ("GET", "/stats", {}),
+        ("POST", "/simulate/realistic", {}),
+    ]
+    results = []
+    try:
+        for method, route, extra_headers in routes:
+            path = route.split(" ")[0]
+            latencies = []
+            for request in range(API_WARMUP_REQUESTS + repeat):
+                start = time.perf_counter()
+                response = client.request(method, path, headers={**headers, **extra_headers})
+                if request >= API_WARMUP_REQUESTS:
+                    latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{method} {route} returned {response.status_code}: {response.text}")
+            latencies = np.array(latencies) * 1000
+            results.append({
+                "benchmark": f"{method} {route}", "scenario": scenario, "requests": repeat,
+                "mean_ms": float(latencies.mean()), "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)), "max_ms": float(latencies.max()),
+            })
+    finally:
+        client.delete(f"/sessions/{session_id}")
+    return results
+
+
+def _environment_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": BENCHMARK_SEED,
+    }
+
+
+def run_benchmarks(scenarios=None, suites=("core", "run", "api"), quick: bool = False,
+                   progress=None, samples: int = BENCHMARK_SAMPLES) -> dict:
+    """Run the selected suites for the selected scenarios; returns the results document"""
+    scenarios = list(scenarios or SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios {sorted(unknown)}. Use {list(SCENARIOS)}")
+    if samples < 1:
+        raise ValueError("samples must be at least 1")
+    results = []
+    for scenario in scenarios:
+        device_count, horizon_steps = SCENARIOS[scenario]
+        if quick:
+            horizon_steps = min(horizon_steps, QUICK_HORIZON_STEPS)
+        # Per-call suites do less work on bigger sites so every scenario finishes in seconds
+        calls = max(20, min(2000, 200000 // device_count))
+        for suite in suites:
+            if progress:
+                progress(f"{scenario}: {suite}")
+            if suite == "core":
+                results += bench_core(scenario, device_count, calls, samples)
+            elif suite == "run":
+                results += bench_run(scenario, device_count, horizon_steps, samples)
+            elif suite == "api":
+                results += bench_api(scenario, device_count, repeat=max(5, calls // 20))
+            else:
+                raise ValueError(f"Unknown suite '{suite}'. Use core, run or api")
+    return {"environment": _environment_info(), "quick": quick, "samples": samples, "results": results}
+
+
+# Per-result metric compared between runs, and whether higher is better
+_COMPARED = (("steps_per_sec", True), ("calls_per_sec", True), ("p50_ms", False))
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10) -> list:
+    """(benchmark, scenario, metric, baseline, current, change) for every result worse by more than threshold"""
+    previous = {(r["benchmark"], r["scenario"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get((result["benchmark"], result["scenario"]))
+        if old is None:
+            continue
+        for metric, higher_is_better in _COMPARED:
+            if result.get(metric) and old.get(metric):
+                change = result[metric] / old[metric] - 1
+                if (-change if higher_is_better else change) > threshold:
+                    regressions.append((result["benchmark"], result["scenario"], metric,
+                                        old[metric], result[metric], change))
+    return regressions
+
+
+def _summary(result: dict) -> str:
+    if "p50_ms" in result:
+        return f"p50 {result['p50_ms']:.2f} ms  p95 {result['p95_ms']:.2f} ms"
+    unit = "steps" if "steps" in result else "calls"
+    line = f"{result[f'{unit}_per_sec']:,.0f} {unit}/s"
+    if "peak_memory_mb" in result:
+        line += f"  peak {result['peak_memory_mb']:.1f} MB"
+    return line
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Microgrid simulation benchmarks")
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run (repeatable; default all)")
+    parser.add_argument("--suite", action="append", choices=["core", "run", "api"],
+                        help="suite to run (repeatable; default all)")
+    parser.add_argument("--quick", action="store_true", help=f"cap horizons at {QUICK_HORIZON_STEPS} steps")
+    parser.add_argument("--samples", type=int, default=BENCHMARK_SAMPLES,
+                        help=f"timed samples per benchmark after a warm-up; the median is reported "
+                             f"(default {BENCHMARK_SAMPLES})")
+    parser.add_argument("-o", "--output", default=RESULTS_FILE, help="results file (JSON)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown reported as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    document = run_benchmarks(args.scenario, args.suite or ("core", "run", "api"), args.quick,
+                              progress=lambda message: print(f"... {message}", file=sys.stderr),
+                              samples=args.samples)
+    for result in document["results"]:
+        print(f"{result['scenario']:<8} {result['benchmark']:<40} {_summary(result)}")
+    with open(args.output, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), document, args.threshold)
+        for benchmark, scenario, metric, old, new, change in regressions:
+            print(f"REGRESSION {scenario} {benchmark} {metric}: {old:,.2f} -> {new:,.2f} ({change:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
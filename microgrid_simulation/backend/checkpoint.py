@@ -0,0 +1,120 @@
+"""
+checkpoint.py
+
+Binary snapshots of the live simulation, so a restarted or redeployed server can pick up
+where it left off instead of replaying the run. A checkpoint is one pickle of the
+simulation objects (environment, microgrid with its devices and control settings, RNG
+streams, history and rolling statistics); NumPy arrays are written as raw buffers.
+Files are replaced atomically, so a crash mid-write leaves the previous checkpoint intact.
+"""
+from contextlib import nullcontext
+from datetime import datetime
+import os
+import pickle
+import tempfile
+import threading
+
+CHECKPOINT_FORMAT = 1
+CHECKPOINT_INTERVAL_SECONDS = 300.0
+
+
+def dump_checkpoint(state: dict) -> bytes:
+    """The checkpoint file contents for state"""
+    return pickle.dumps({"format": CHECKPOINT_FORMAT, "saved_at": datetime.now(), "state": state},
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_checkpoint(path: str, state) -> int:
+    """Atomically write state (a dict, or bytes from dump_checkpoint) to path; returns the size in bytes"""
+    data = state if isinstance(state, bytes) else dump_checkpoint(state)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".checkpoint-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return len(data)
+
+
+def read_checkpoint(path: str) -> tuple:
+    """(state, saved_at) from a checkpoint file. Only read checkpoints this server wrote."""
+    with open(path, "rb") as f:
+        try:
+            checkpoint = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            raise ValueError(f"{path} is not a readable checkpoint: {e}")
+    if not isinstance(checkpoint, dict) or checkpoint.get("format") != CHECKPOINT_FORMAT:
+        raise ValueError(f"{path} is not a format {CHECKPOINT_FORMAT} checkpoint")
+    return checkpoint["state"], checkpoint["saved_at"]
+
+
+class Checkpointer:
+    """
+    Saves checkpoints to `path` on demand and, once started, every interval_seconds from
+    a background thread. capture() returns the state dict to save; state_lock, if given,
+    is held while it is captured and serialized, so the state is not changed mid-save.
+    """
+    def __init__(self, path: str, capture, interval_seconds: float = CHECKPOINT_INTERVAL_SECONDS,
+                 state_lock=None):
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds must be positive")
+        self.path = path
+        self.capture = capture
+        self.interval_seconds = interval_seconds
+        self.state_lock = state_lock if state_lock is not None else nullcontext()
+        self.last_saved_at = None
+        self.last_size_bytes = None
+        self.last_error = None
+        self.saves = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save(self) -> dict:
+        """Write a checkpoint now"""
+        with self._lock:
+            with self.state_lock:
+                data = dump_checkpoint(self.capture())
+            self.last_size_bytes = write_checkpoint(self.path, data)
+            self.last_saved_at = datetime.now()
+            self.last_error = None
+            self.saves += 1
+        return self.to_dict()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.save()
+            except Exception as e:
+                # Keep the previous checkpoint and try again next interval
+                self.last_error = str(e)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="checkpointer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "interval_seconds": self.interval_seconds,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "saves": self.saves,
+            "last_saved_at": self.last_saved_at.isoformat() if self.last_saved_at else None,
+            "last_size_bytes": self.last_size_bytes,
+            "last_error": self.last_error,
+        }
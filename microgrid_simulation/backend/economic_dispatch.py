@@ -0,0 +1,199 @@
+"""
+economic_dispatch.py
+
+Rolling-horizon economic dispatch for the "economic_dispatch" diesel strategy. Over the
+next N steps of forecast net demand, a dynamic programme over a discretized battery state
+of charge picks the battery schedule that minimises diesel fuel plus grid cost; diesel
+and grid then cover whatever the battery does not, cheapest source first. Live stepping
+executes only the first step of each plan and re-plans every step against a fresh
+forecast; batch dispatch, whose forecast is exact, follows each plan for a few steps.
+"""
+from dataclasses import dataclass
+import numpy as np
+
+DISPATCH_HORIZON_STEPS = 48
+# Steps of each plan that batch dispatch (MicrogridManager.dispatch_series) follows before
+# re-planning; its forecast is exact, so later steps of a plan stay close to optimal
+DISPATCH_REPLAN_STEPS = 8
+# Re-plan sooner when total battery charge ends a step further than this fraction of
+# capacity from the planned level
+DISPATCH_REPLAN_SOC_TOLERANCE = 0.01
+# Battery state of charge levels in the DP grid
+DISPATCH_SOC_LEVELS = 41
+# Upper bound when low battery power limits call for a finer grid
+DISPATCH_MAX_SOC_LEVELS = 161
+# Diesel price ($/litre) used to turn fuel use into cost
+DIESEL_PRICE_PER_LITRE = 1.8
+# Cost ($/kWh) of demand that cannot be met; large enough to always be avoided if possible
+UNSERVED_PENALTY_PER_KWH = 10.0
+
+
+@dataclass
+class DispatchPlan:
+    """Per-step schedule over the horizon. battery_kw is positive when discharging."""
+    battery_kw: np.ndarray
+    diesel_kw: np.ndarray
+    grid_kw: np.ndarray
+    soc_kwh: np.ndarray
+    cost: float
+
+
+class EconomicDispatcher:
+    """
+    Batteries are treated as one aggregate store (total capacity and power, capacity-
+    weighted efficiency). The transition table between SOC levels depends only on the
+    battery fleet and timestep, so it is built once and reused by every re-plan until
+    either changes; each plan is then a handful of array operations per horizon step.
+    """
+    def __init__(self, horizon_steps: int = DISPATCH_HORIZON_STEPS, soc_levels: int = DISPATCH_SOC_LEVELS,
+                 diesel_price_per_litre: float = DIESEL_PRICE_PER_LITRE,
+                 unserved_penalty_per_kwh: float = UNSERVED_PENALTY_PER_KWH):
+        if horizon_steps < 1:
+            raise ValueError("horizon_steps must be at least 1")
+        if soc_levels < 2:
+            raise ValueError("soc_levels must be at least 2")
+        self.horizon_steps = horizon_steps
+        self.soc_levels = soc_levels
+        self.diesel_price_per_litre = diesel_price_per_litre
+        self.unserved_penalty_per_kwh = unserved_penalty_per_kwh
+        self._transitions_key = None
+        self._transitions = None
+
+    def _transition_table(self, capacity: float, max_power: float, efficiency: float, timestep_hours: float):
+        """
+        SOC levels and the battery output (kW, discharge positive) for moving between any
+        two of them in one step, with NaN for moves beyond the power limit.
+        """
+        key = (capacity, max_power, efficiency, timestep_hours, self.soc_levels)
+        if key != self._transitions_key:
+            if capacity > 0 and max_power > 0:
+                # Fine enough that one step at full power crosses at least one level
+                spacing = min(capacity / (self.soc_levels - 1), max_power * timestep_hours * efficiency)
+                count = min(int(np.ceil(capacity / spacing)) + 1, DISPATCH_MAX_SOC_LEVELS)
+                levels = np.linspace(0.0, capacity, count)
+            else:
+                levels = np.zeros(1)
+            self._transitions = (levels, self._battery_output(levels[:, None], levels[None, :], max_power,
+                                                              efficiency, timestep_hours))
+            self._transitions_key = key
+        return self._transitions
+
+    @staticmethod
+    def _battery_output(soc_from, soc_to, max_power, efficiency, timestep_hours):
+        delta = soc_to - soc_from
+        # Charging stores efficiency * input; discharging delivers efficiency * stored energy
+        output = np.where(delta > 0, -delta / efficiency, -delta * efficiency) / timestep_hours
+        return np.where(np.abs(output) <= max_power * (1 + 1e-9), output, np.nan)
+
+    def _supply_segments(self, diesel_rated: np.ndarray, diesel_usage: np.ndarray, import_price,
+                         timestep_hours: float) -> tuple:
+        """Supply options as (capacity kW, cost $ per kW for the step), cheapest first"""
+        capacity = list(diesel_rated)
+        cost = list(diesel_usage * self.diesel_price_per_litre * timestep_hours)
+        if import_price is not None:
+            capacity.append(np.inf)
+            cost.append(import_price * timestep_hours)
+        capacity.append(np.inf)
+        cost.append(self.unserved_penalty_per_kwh * timestep_hours)
+        order = np.argsort(cost, kind="stable")
+        return np.asarray(capacity, dtype=float)[order], np.asarray(cost, dtype=float)[order]
+
+    @staticmethod
+    def _supply(residual, capacity: np.ndarray) -> np.ndarray:
+        """kW taken from each supply segment to cover the positive part of residual"""
+        before = np.concatenate(([0.0], np.cumsum(capacity)[:-1]))
+        return np.clip(np.maximum(residual, 0.0)[..., None] - before, 0.0, capacity)
+
+    @staticmethod
+    def _cost_curve(segments: tuple) -> tuple:
+        """
+        Supply cost as a convex piecewise-linear function of the shortfall: breakpoints,
+        cost at each breakpoint and the slope past the last one. Segments after the first
+        unlimited one are never used.
+        """
+        capacity, cost = segments
+        unlimited = int(np.argmax(np.isinf(capacity)))
+        breakpoints = np.concatenate(([0.0], np.cumsum(capacity[:unlimited])))
+        costs = np.concatenate(([0.0], np.cumsum(capacity[:unlimited] * cost[:unlimited])))
+        return breakpoints, costs, cost[unlimited]
+
+    def _step_cost(self, residual, curve: tuple, export_price, timestep_hours: float):
+        breakpoints, costs, slope = curve
+        demand = np.maximum(residual, 0.0)
+        supply_cost = np.interp(demand, breakpoints, costs) + slope * np.maximum(demand - breakpoints[-1], 0.0)
+        # Surplus is exported if there is a grid, otherwise curtailed at no cost
+        export_value = 0.0 if export_price is None else export_price * timestep_hours
+        return supply_cost + np.minimum(residual, 0.0) * export_value
+
+    def plan(self, net_demand, soc_kwh: float, capacity_kwh: float, max_power_kw: float, efficiency: float,
+             diesel_rated, diesel_usage, import_price, export_price, timestep_hours: float) -> DispatchPlan:
+        """
+        Cheapest schedule for net_demand (demand minus renewables, kW per step).
+
+        efficiency: one-way battery efficiency. diesel_rated / diesel_usage: per-generator
+        rated power and litres per kWh. import_price / export_price: $/kWh, or None when
+        there is no grid connection.
+        """
+        net_demand = np.asarray(net_demand, dtype=float)
+        steps = len(net_demand)
+        if steps == 0:
+            raise ValueError("net_demand must have at least one step")
+        levels, transitions = self._transition_table(capacity_kwh, max_power_kw, efficiency, timestep_hours)
+        segments = self._supply_segments(np.asarray(diesel_rated, dtype=float), np.asarray(diesel_usage, dtype=float),
+                                         import_price, timestep_hours)
+        curve = self._cost_curve(segments)
+
+        # Stored energy left at the end of the horizon is worth what it would cost to
+        # replace from the cheapest non-penalty source
+        replacement = [c for c in segments[1] if c < self.unserved_penalty_per_kwh * timestep_hours]
+        terminal = -levels * efficiency * (min(replacement) / timestep_hours if replacement else 0.0)
+
+        # Backward pass over steps 1..N-1, all stage costs evaluated in one go
+        first_output = self._battery_output(soc_kwh, levels, max_power_kw, efficiency, timestep_hours)
+        value = terminal
+        policy = []
+        if steps > 1:
+            stage_cost = self._step_cost(net_demand[1:, None, None] - transitions, curve, export_price,
+                                         timestep_hours)
+            stage_cost = np.where(np.isnan(stage_cost), np.inf, stage_cost)
+            for t in range(steps - 2, -1, -1):
+                total = stage_cost[t] + value[None, :]
+                best = total.argmin(axis=1)
+                policy.append(best)
+                value = total[np.arange(len(levels)), best]
+            policy.reverse()
+
+        first_cost = self._step_cost(net_demand[0] - first_output, curve, export_price, timestep_hours)
+        first_cost = np.where(np.isnan(first_cost), np.inf, first_cost)
+        total = first_cost + value
+        if not np.isfinite(total).any():
+            # The current charge is off the grid and no level is reachable: hold still
+            target = [int(np.abs(levels - soc_kwh).argmin())]
+            battery = [0.0]
+        else:
+            target = [int(total.argmin())]
+            battery = [float(first_output[target[0]])]
+        for best in policy:
+            target.append(int(best[target[-1]]))
+            battery.append(float(transitions[target[-2], target[-1]]))
+
+        battery = np.array(battery)
+        residual = net_demand - battery
+        capacity, _ = segments
+        diesel = self._supply(residual, capacity)[:, np.isfinite(capacity)].sum(axis=1)
+        return DispatchPlan(
+            battery_kw=battery,
+            diesel_kw=diesel,
+            grid_kw=residual - diesel if import_price is not None else np.zeros(steps),
+            soc_kwh=levels[target],
+            cost=float(self._step_cost(residual, curve, export_price, timestep_hours).sum()),
+        )
+
+
+def diesel_setpoints(total_kw: float, rated, usage) -> np.ndarray:
+    """Split a total diesel output across generators, most fuel-efficient first"""
+    rated = np.asarray(rated, dtype=float)
+    order = np.argsort(usage, kind="stable")
+    setpoints = np.zeros(len(rated))
+    setpoints[order] = EconomicDispatcher._supply(total_kw, rated[order])
+    return setpoints
@@ -0,0 +1,173 @@
+"""
+encoding.py
+
+Response encodings chosen from the request's Accept header. JSON stays the default;
+clients can opt in to MessagePack for any payload, or to an Arrow IPC stream for the
+tabular endpoints (history, sweeps, job results). Payloads may hold NumPy arrays as-is:
+orjson (when installed) writes them straight from their buffers, and Arrow columns are
+built over the arrays without copying numeric data.
+
+msgpack, pyarrow and orjson are optional; a missing library only disables its encoding
+(orjson falls back to the standard json module).
+"""
+from datetime import date, datetime
+import json
+import time
+import numpy as np
+
+from metrics import REGISTRY
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+_MEDIA_TYPES = {
+    "application/json": JSON,
+    "application/*": JSON,
+    "*/*": JSON,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    ARROW: ARROW,
+}
+_LIBRARIES = {MSGPACK: "msgpack", ARROW: "pyarrow"}
+
+ENCODE_SECONDS = REGISTRY.histogram(
+    "microgrid_response_encode_seconds", "Time to serialize a response body, by media type.", ("media_type",))
+
+
+def _accepted(accept: str) -> list:
+    """Media types from an Accept header, highest quality first (ties keep header order)"""
+    ranked = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            ranked.append((-quality, position, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(ranked)]
+
+
+def _available(media_type: str) -> bool:
+    if media_type not in _LIBRARIES:
+        return True
+    try:
+        __import__(_LIBRARIES[media_type])
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate(accept: str = None, tabular: bool = False) -> str:
+    """
+    Media type to respond with. No Accept header means JSON. Raises ValueError when
+    nothing acceptable can be produced, naming the library a requested encoding needs.
+    """
+    if not accept:
+        return JSON
+    missing = []
+    for requested in _accepted(accept):
+        media_type = _MEDIA_TYPES.get(requested)
+        if media_type is None or (media_type == ARROW and not tabular):
+            continue
+        if _available(media_type):
+            return media_type
+        missing.append(f"{media_type} requires {_LIBRARIES[media_type]} (pip install {_LIBRARIES[media_type]})")
+    if missing:
+        raise ValueError("; ".join(missing))
+    supported = [JSON, MSGPACK] + ([ARROW] if tabular else [])
+    raise ValueError(f"Cannot produce '{accept}'. Supported: {supported}")
+
+
+def _plain_array(values: np.ndarray) -> list:
+    """Array as a list of builtins: NaN as None, datetimes as ISO strings"""
+    if np.issubdtype(values.dtype, np.datetime64):
+        return [None if np.isnat(t) else t.item().isoformat() for t in values]
+    if np.issubdtype(values.dtype, np.floating):
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+
+def _plain(value):
+    """Fallback for values the encoders cannot write natively"""
+    if isinstance(value, np.ndarray):
+        return _plain_array(value)
+    if isinstance(value, np.datetime64):
+        return _plain_array(np.asarray([value]))[0]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not serializable")
+
+
+def _finite(value):
+    """value with every non-finite float replaced by None, as orjson writes them"""
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if isinstance(value, np.ndarray) and np.issubdtype(value.dtype, np.floating):
+        return np.where(np.isfinite(value), value, None).tolist()
+    return value
+
+
+def _encode_json(payload) -> bytes:
+    try:
+        import orjson
+    except ImportError:
+        # The standard library would write NaN and Infinity, which are not valid JSON
+        return json.dumps(_finite(payload), default=_plain, allow_nan=False).encode()
+    return orjson.dumps(payload, default=_plain, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def _encode_msgpack(payload) -> bytes:
+    import msgpack
+    return msgpack.packb(payload, default=_plain)
+
+
+def _encode_arrow(table: dict, metadata: dict = None) -> bytes:
+    """
+    table: {column name: array or list}, all the same length. metadata values are
+    JSON-encoded into the schema metadata.
+    """
+    import pyarrow as pa
+    columns = {}
+    for name, values in table.items():
+        if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.floating):
+            # NaN marks a missing value everywhere else in the API
+            columns[name] = pa.array(values, mask=np.isnan(values)) if np.isnan(values).any() else pa.array(values)
+        else:
+            columns[name] = pa.array(values)
+    schema_metadata = {key: json.dumps(value, default=_plain) for key, value in (metadata or {}).items()}
+    batch = pa.RecordBatch.from_pydict(columns, metadata=schema_metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(payload, media_type: str = JSON, table: dict = None, metadata: dict = None) -> bytes:
+    """
+    Serialize payload as media_type. For Arrow, `table` holds the columns to send and
+    `metadata` whatever else the JSON payload would have carried.
+    """
+    start = time.perf_counter()
+    if media_type == MSGPACK:
+        body = _encode_msgpack(payload)
+    elif media_type == ARROW:
+        if table is None:
+            raise ValueError("Arrow encoding needs a table")
+        body = _encode_arrow(table, metadata)
+    else:
+        body = _encode_json(payload)
+    ENCODE_SECONDS.observe(time.perf_counter() - start, media_type)
+    return body
@@ -4,145 +4,232 @@ environment_simulation.py
 This class represents the physical world and properties related to microgrid power generation.
 """
 from datetime import datetime, timedelta
-import random
-import math
+import copy
+import numpy as np
+
+# Monthly climate tables for Perth (approx. 32° S), indexed by month - 1
+CLOUD_COVER_MEAN = np.array([0, 1, 3, 4, 4, 5.5, 6, 4.5, 3, 2, 0, 0])
+TEMPERATURE_AVG_MIN = np.array([18, 18, 16, 13, 10, 8, 8, 9, 10, 12, 15, 17])
+TEMPERATURE_AVG_MAX = np.array([32, 31, 29, 25, 22, 19, 18, 19, 21, 24, 27, 30])
+# Solar potential by month
+SOLAR_SEASONAL_FACTOR = np.array([0.95, 0.90, 0.80, 0.70, 0.60, 0.50, 0.55, 0.65, 0.75, 0.85, 0.90, 0.95])
+SUNRISE_HOUR = np.array([5.5, 6.0, 6.5, 7.0, 7.2, 7.5, 7.5, 7.0, 6.5, 6.0, 5.5, 5.2])
+SUNSET_HOUR = np.array([19.5, 19.0, 18.5, 17.8, 17.3, 17.2, 17.3, 17.8, 18.0, 18.5, 19.0, 19.5])
+# Increased monthly average speeds for an industrial/mine site
+WIND_SPEED_MEAN = np.array([7.0, 6.8, 6.9, 6.5, 6.2, 6.0, 6.2, 6.5, 6.8, 7.1, 7.3, 7.5])
+
+# Number of timesteps generated at a time when the environment extends its trajectory
+TRAJECTORY_BLOCK_STEPS = 256
+
+WEATHER_KEYS = ("cloud_cover", "wind_speed", "wind_direction", "temperature", "solar_radiation")
+
+
+def spawn_seeds(seed, count: int) -> list:
+    """
+    Derive `count` independent child seeds from one root seed. Each child can seed an
+    Environment or DemandGenerator, so parallel scenarios never share a random stream
+    and the whole set can be replayed from the root seed.
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return root.spawn(count)
 
 
 class Environment:
     __instance = None
-    
-    def __init__(self):
-        self.current_time: datetime = datetime.now()
+
+    def __init__(self, seed=None, start_time: datetime = None):
+        """
+        seed: anything np.random.default_rng accepts. The environment draws all of its
+        weather from this one generator, so equal seeds and start times replay identically.
+        """
+        self.current_time: datetime = start_time or datetime.now()
+        self.rng = np.random.default_rng(seed)
+        # Bumped on every change to the weather or clock, so readers can cache derived views
+        self.state_version = 0
+        self._trajectory = None
+        self._trajectory_index = 0
+        self._trajectory_timestep = 1.0
         self.set_environment_values()
-        
+
     @staticmethod
-    def get_instance():
+    def get_instance(seed=None):
         if Environment.__instance is None:
-            Environment.__instance = Environment()
+            Environment.__instance = Environment(seed)
         return Environment.__instance
 
+    @staticmethod
+    def generate_trajectory(start: datetime, steps: int, timestep_hours: float, seed=None) -> dict:
+        """
+        Generate weather for `steps` timesteps from `start` in one vectorized pass.
+
+        Returns a dict of NumPy arrays keyed by "time" (datetime64) and each of WEATHER_KEYS.
+        `seed` is anything np.random.default_rng accepts, including an existing Generator.
+        """
+        rng = np.random.default_rng(seed)
+        step = np.timedelta64(timedelta(hours=timestep_hours), "us")
+        times = np.datetime64(start, "us") + np.arange(steps) * step
+        month = times.astype("datetime64[M]").astype(np.int64) % 12
+        hour = ((times - times.astype("datetime64[D]")) // np.timedelta64(1, "h")).astype(float)
+
+        cloud_cover = np.clip(rng.normal(CLOUD_COVER_MEAN[month], 0.8), 0, 9)
+
+        avg_min = TEMPERATURE_AVG_MIN[month]
+        avg_max = TEMPERATURE_AVG_MAX[month]
+        base = (avg_min + avg_max) / 2
+        amplitude = (avg_max - avg_min) / 2
+        temperature = base + amplitude * np.sin((hour - 6) / 24 * 2 * np.pi)
+        temperature = np.round(temperature + rng.normal(0, 1, steps), 1)
+
+        # Sine curve over the actual daylight hours, zero outside them
+        sunrise = SUNRISE_HOUR[month]
+        sunset = SUNSET_HOUR[month]
+        daylight = (sunrise <= hour) & (hour <= sunset)
+        time_of_day_factor = np.where(daylight, np.sin(np.pi * (hour - sunrise) / (sunset - sunrise)), 0.0)
+        radiation = 1000 * SOLAR_SEASONAL_FACTOR[month] * (1 - cloud_cover / 9) * time_of_day_factor
+        solar_radiation = np.maximum(0, np.round(radiation, 1))
+
+        diurnal_boost = np.where((10 <= hour) & (hour <= 19), 1.1, 0.9)
+        wind_speed = np.round(np.maximum(0, rng.normal(WIND_SPEED_MEAN[month] * diurnal_boost, 0.8)), 1)
+        wind_direction = np.round(rng.normal(220, 45, steps))
+
+        return {
+            "time": times,
+            "cloud_cover": cloud_cover,
+            "wind_speed": wind_speed,
+            "wind_direction": wind_direction,
+            "temperature": temperature,
+            "solar_radiation": solar_radiation,
+        }
+
+    def _draw_blocks(self, start, steps: int, timestep_hours: float, rng: np.random.Generator) -> dict:
+        """Whole blocks of trajectory from `start`, at least one and enough for `steps` rows"""
+        step = np.timedelta64(timedelta(hours=timestep_hours), "us")
+        blocks = [self.generate_trajectory(start, TRAJECTORY_BLOCK_STEPS, timestep_hours, rng)]
+        while len(blocks) * TRAJECTORY_BLOCK_STEPS < steps:
+            blocks.append(self.generate_trajectory(blocks[-1]["time"][-1] + step, TRAJECTORY_BLOCK_STEPS,
+                                                   timestep_hours, rng))
+        if len(blocks) == 1:
+            return blocks[0]
+        return {key: np.concatenate([block[key] for block in blocks]) for key in blocks[0]}
+
+    def _buffer_trajectory(self, timestep_hours: float, steps: int):
+        """
+        Make sure the buffered trajectory uses timestep_hours and holds at least `steps`
+        values from the current one. The buffer is always extended in whole blocks, so
+        looking ahead does not change the weather that is eventually stepped through.
+        """
+        if self._trajectory is None or self._trajectory_timestep != timestep_hours:
+            self._trajectory = self._draw_blocks(self.current_time, steps, timestep_hours, self.rng)
+            self._trajectory_index = 0
+            self._trajectory_timestep = timestep_hours
+
+        missing = steps - (len(self._trajectory["time"]) - self._trajectory_index)
+        if missing > 0:
+            next_start = self._trajectory["time"][-1] + np.timedelta64(timedelta(hours=timestep_hours), "us")
+            blocks = self._draw_blocks(next_start, missing, timestep_hours, self.rng)
+            self._trajectory = {
+                key: np.concatenate((column[self._trajectory_index:], blocks[key]))
+                for key, column in self._trajectory.items()
+            }
+            self._trajectory_index = 0
+
+    def _apply_trajectory(self):
+        i = self._trajectory_index
+        self.cloud_cover = float(self._trajectory["cloud_cover"][i])
+        self.wind_speed = float(self._trajectory["wind_speed"][i])
+        self.wind_direction = int(self._trajectory["wind_direction"][i])
+        self.temperature = float(self._trajectory["temperature"][i])
+        self.solar_radiation = float(self._trajectory["solar_radiation"][i])
+        self.state_version += 1
 
     def set_environment_values(self):
-        self.cloud_cover: float = self.get_cloud_cover()
-        self.wind_speed, self.wind_direction = self.get_wind()
-        self.temperature: float = self.get_temperature()
-        self.solar_radiation: float = self.get_solar_radiation()
+        """Draw fresh weather for the current time, discarding any buffered trajectory"""
+        self._trajectory = None
+        self._buffer_trajectory(self._trajectory_timestep, 1)
+        self._apply_trajectory()
 
 
     def step(self, timestep_hours):
+        """
+        Move forward one timestep through the buffered trajectory. The buffer holds one
+        timestep only: a call with a different timestep_hours discards it and draws a new
+        block of TRAJECTORY_BLOCK_STEPS rows from the current time, as forecast() and
+        advance() expect. Alternating timesteps therefore redraws a block on every switch,
+        and the weather is reproducible from the seed only for the same sequence of
+        timesteps; keep one timestep per environment where that matters.
+        """
+        self._buffer_trajectory(timestep_hours, 2)
         self.current_time += timedelta(hours=timestep_hours)
-        self.set_environment_values()
-
-    def get_cloud_cover(self) -> float:
-        current_month = self.current_time.month
-        months = {
-            1: 0, 2: 1, 3: 3, 4: 4, 5: 4, 6: 5.5,
-            7: 6, 8: 4.5, 9: 3, 10: 2, 11: 0, 12: 0
-        }
-        return max(0, min(9, random.normalvariate(months[current_month], 0.8)))
+        self._trajectory_index += 1
+        self._apply_trajectory()
+
+    def forecast(self, steps: int, timestep_hours: float) -> dict:
+        """
+        The weather advance() would return, without moving or otherwise changing the
+        environment. Row 0 holds the current values; later rows are the weather that will
+        actually be stepped through at this timestep. Rows beyond the buffered lookahead
+        are drawn from a copy of the generator, as the buffer will later be extended.
+        """
+        if self._trajectory is not None and self._trajectory_timestep == timestep_hours:
+            trajectory = {key: column[self._trajectory_index:] for key, column in self._trajectory.items()}
+            missing = steps - len(trajectory["time"])
+            if missing > 0:
+                next_start = trajectory["time"][-1] + np.timedelta64(timedelta(hours=timestep_hours), "us")
+                blocks = self._draw_blocks(next_start, missing, timestep_hours, copy.deepcopy(self.rng))
+                trajectory = {key: np.concatenate((column, blocks[key])) for key, column in trajectory.items()}
+        else:
+            # Stepping at a new timestep redraws the trajectory from the current time
+            trajectory = self._draw_blocks(self.current_time, steps, timestep_hours, copy.deepcopy(self.rng))
+
+        weather = {key: column[:steps].copy() for key, column in trajectory.items()}
+        if steps:
+            for key in WEATHER_KEYS:
+                weather[key][0] = getattr(self, key)
+        return weather
+
+    def advance(self, steps: int, timestep_hours: float) -> dict:
+        """
+        Return the weather for the current timestep and the next steps - 1, then move the
+        environment forward by `steps` timesteps. The first row holds the current values,
+        including any set manually. Like step(), a timestep other than the buffered one
+        discards the lookahead and redraws it from the current time.
+        """
+        self._buffer_trajectory(timestep_hours, steps + 1)
+        weather = self.forecast(steps, timestep_hours)
+        self.current_time += steps * timedelta(hours=timestep_hours)
+        self._trajectory_index += steps
+        self._apply_trajectory()
+        return weather
 
     def set_cloud_cover(self, cloud_cover: float):
         if 0 <= cloud_cover <= 9:
             self.cloud_cover = cloud_cover
+            self.state_version += 1
         else:
             raise ValueError("Illegal cloud cover value. Use 0-9.")
 
-    def get_temperature(self) -> float:
-        current_month = self.current_time.month
-        current_hour = self.current_time.hour
-        avg_min = {
-            1: 18, 2: 18, 3: 16, 4: 13, 5: 10, 6: 8,
-            7: 8, 8: 9, 9: 10, 10: 12, 11: 15, 12: 17
-        }[current_month]
-        avg_max = {
-            1: 32, 2: 31, 3: 29, 4: 25, 5: 22, 6: 19,
-            7: 18, 8: 19, 9: 21, 10: 24, 11: 27, 12: 30
-        }[current_month]
-
-        base = (avg_min + avg_max) / 2
-        amplitude = (avg_max - avg_min) / 2
-        temp = base + amplitude * math.sin((current_hour - 6) / 24 * 2 * math.pi)
-        return round(temp + random.normalvariate(0, 1), 1)
-
     def set_temperature(self, temperature: int):
         if -50 <= temperature <= 50:
             self.temperature = temperature
+            self.state_version += 1
         else:
             raise ValueError("Illegal temperature value. Use -50 to 50c.")
 
-    def get_solar_radiation(self) -> float:
-        current_month = self.current_time.month
-        current_hour = self.current_time.hour
-
-        # 1. Seasonal factor (solar potential by month for Perth)
-        seasonal_factor = {
-            1: 0.95,  2: 0.90,  3: 0.80, 4: 0.70,  5: 0.60,  6: 0.50,
-            7: 0.55,  8: 0.65,  9: 0.75, 10: 0.85, 11: 0.90, 12: 0.95
-        }.get(current_month)
-
-        # 2. Cloud factor (0 = overcast, 1 = clear)
-        cloud_factor = 1 - (self.cloud_cover / 9)
-
-        # 3. Time-of-day factor with realistic day length
-        # Realistic sunrise/sunset times for Perth (approx. 32° S)
-        sunrise_hour = {
-            1: 5.5, 2: 6.0, 3: 6.5, 4: 7.0, 5: 7.2, 6: 7.5,
-            7: 7.5, 8: 7.0, 9: 6.5, 10: 6.0, 11: 5.5, 12: 5.2
-        }[current_month]
-        sunset_hour = {
-            1: 19.5, 2: 19.0, 3: 18.5, 4: 17.8, 5: 17.3, 6: 17.2,
-            7: 17.3, 8: 17.8, 9: 18.0, 10: 18.5, 11: 19.0, 12: 19.5
-        }[current_month]
-
-        daylight_hours = sunset_hour - sunrise_hour
-        
-        # CHANGED: Use dynamic sunrise/sunset instead of fixed 6 AM to 6 PM
-        if sunrise_hour <= current_hour <= sunset_hour:
-            # Sine curve over the actual daylight hours
-            time_of_day_factor = math.sin(math.pi * (current_hour - sunrise_hour) / daylight_hours)
-        else:
-            time_of_day_factor = 0.0
-
-        # 4. Final solar radiation (in W/m²)
-        base_radiation = 1000  # Max theoretical radiation
-        radiation = base_radiation * seasonal_factor * cloud_factor * time_of_day_factor
-
-        return max(0, round(radiation, 1))
-
     def set_solar_radiation(self, solar_radiation: float):
         if 0 <= solar_radiation <= 1000:
             self.solar_radiation = solar_radiation
+            self.state_version += 1
         else:
             raise ValueError("Illegal solar radiation value. Use 0-1000 (W/m²).")
 
-    def get_wind(self) -> tuple:
-        current_month = self.current_time.month
-        current_hour = self.current_time.hour
-
-        # Increased monthly average speeds for an industrial/mine site
-        monthly_avg_speed = {
-            1: 7.0,  2: 6.8,  3: 6.9,  4: 6.5, 5: 6.2,  6: 6.0,
-            7: 6.2,  8: 6.5,  9: 6.8, 10: 7.1, 11: 7.3, 12: 7.5
-        }[current_month]
-
-        # Reduced diurnal variation for a steadier wind profile
-        diurnal_boost = 1.1 if 10 <= current_hour <= 19 else 0.9
-        mean_speed = monthly_avg_speed * diurnal_boost
-        
-        # Reduced standard deviation for less randomness (steadier wind)
-        wind_speed = max(0, random.normalvariate(mean_speed, 0.8))
-
-        wind_direction = random.normalvariate(220, 45)
-            
-
-        return round(wind_speed, 1), round(wind_direction)
-
     def set_wind_speed(self, wind_speed: float):
         if not 0 <= wind_speed <= 100:
             raise ValueError("Wind speed must be between 0 and 100 m/s.")
         self.wind_speed = wind_speed
+        self.state_version += 1
 
     def set_wind_direction(self, wind_direction: float):
         if not (0 <= wind_direction < 360):
             raise ValueError("Wind direction must be between 0 and less than 360 degrees.")
-        self.wind_direction = wind_direction
\ No newline at end of file
+        self.wind_direction = wind_direction
+        self.state_version += 1
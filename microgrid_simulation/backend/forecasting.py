@@ -0,0 +1,141 @@
+"""
+forecasting.py
+
+Side-effect-free weather and demand forecasts, for predictive control and "next 24h"
+views, in two kinds:
+
+- session_forecast: what a session will actually step through. Weather is its
+  environment's own seeded trajectory (Environment.forecast) and demand is drawn from a
+  copy of its demand stream, so neither the session nor anything it draws later changes.
+- ForecastCache.forecast: a climatological scenario, a seeded draw from the same climate
+  and demand models that is independent of any session. Scenarios are assembled from
+  blocks of TRAJECTORY_BLOCK_STEPS rows on a fixed grid, each seeded from (seed, block
+  index), so a scenario depends only on its start time, timestep and seed. Recently used
+  blocks are kept in LRU order: as the live simulation advances along the grid, the next
+  scenario reuses the blocks it overlaps and generates only the new ones at the end.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import copy
+import threading
+import numpy as np
+
+from environment_simulation import Environment, TRAJECTORY_BLOCK_STEPS, WEATHER_KEYS
+from power_simulation import expected_demand
+from metrics import REGISTRY
+
+# Blocks held by the shared cache; about 14 kB each, enough for a year at 5-minute steps
+FORECAST_CACHE_BLOCKS = 1024
+FORECAST_MAX_STEPS = 366 * 24 * 12
+
+FORECAST_BLOCKS = REGISTRY.counter(
+    "microgrid_forecast_blocks_total", "Forecast blocks served, by cache result.", ("result",))
+
+_EPOCH = np.datetime64(0, "us")
+
+
+def _validate(steps: int, timestep_hours: float):
+    if not 0 <= steps <= FORECAST_MAX_STEPS:
+        raise ValueError(f"steps must be 0-{FORECAST_MAX_STEPS}")
+    if timestep_hours <= 0:
+        raise ValueError("timestep_hours must be positive")
+
+
+def session_forecast(environment: Environment, demand_rng: np.random.Generator, steps: int,
+                     timestep_hours: float = 1.0, total_daily_kwh: float = 50000.0) -> dict:
+    """
+    Weather and demand for `steps` timesteps from the environment's current time, as a
+    session stepping at timestep_hours will see them: row 0 holds the current weather,
+    and demand is what get_realistic_demand will draw from demand_rng for each step at
+    total_daily_kwh. Returns a dict of arrays like ForecastCache.forecast.
+    """
+    _validate(steps, timestep_hours)
+    forecast = environment.forecast(steps, timestep_hours)
+    demand = expected_demand(environment.current_time, steps, timestep_hours, total_daily_kwh)
+    # One draw per step, as get_realistic_demand makes them, from a copy of the stream
+    noise = copy.deepcopy(demand_rng).uniform(-0.05, 0.05, steps)
+    forecast["demand"] = np.maximum(total_daily_kwh / 24.0 * 0.7, demand + noise * demand)
+    return forecast
+
+
+class ForecastCache:
+    """
+    Forecast blocks keyed by (seed, timestep, grid phase, block index), least recently
+    used evicted first. The grid phase is the start time's offset within one timestep,
+    so forecasts from any time reachable by stepping share blocks.
+    """
+    def __init__(self, max_blocks: int = FORECAST_CACHE_BLOCKS):
+        if max_blocks < 1:
+            raise ValueError("max_blocks must be at least 1")
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+    @staticmethod
+    def _block(seed: int, timestep_hours: float, step: np.timedelta64, origin: np.datetime64,
+               index: int) -> dict:
+        # Weather first, then the demand noise, from one generator per block
+        rng = np.random.default_rng([seed, index])
+        block = Environment.generate_trajectory(
+            (origin + index * TRAJECTORY_BLOCK_STEPS * step).item(), TRAJECTORY_BLOCK_STEPS, timestep_hours, rng)
+        block["demand_noise"] = rng.uniform(-0.05, 0.05, TRAJECTORY_BLOCK_STEPS)
+        return block
+
+    def forecast(self, start: datetime, steps: int, timestep_hours: float = 1.0, seed: int = 0,
+                 total_daily_kwh: float = 50000.0) -> dict:
+        """
+        A climatological scenario for `steps` timesteps from `start`, unrelated to the
+        weather any session will see: a dict of arrays keyed by "time", each of WEATHER_KEYS
+        and "demand" (kW, the get_realistic_demand model). Returned arrays are new; cached
+        blocks are never exposed.
+        """
+        _validate(steps, timestep_hours)
+        if seed < 0:
+            raise ValueError("seed must not be negative")
+        step = np.timedelta64(timedelta(hours=timestep_hours), "us")
+        if step <= np.timedelta64(0, "us"):
+            raise ValueError("timestep_hours must be at least one microsecond")
+        start = np.datetime64(start, "us")
+        if start < _EPOCH:
+            raise ValueError("start must not be before 1970")
+
+        # Row r of the grid is origin + r * step; the forecast covers rows first..first+steps-1
+        first, phase = divmod(start - _EPOCH, step)
+        origin = _EPOCH + phase
+        first_block = int(first) // TRAJECTORY_BLOCK_STEPS
+        last_block = (int(first) + max(steps, 1) - 1) // TRAJECTORY_BLOCK_STEPS
+        blocks = []
+        for index in range(first_block, last_block + 1):
+            key = (seed, int(step.astype(np.int64)), int(phase.astype(np.int64)), index)
+            with self._lock:
+                block = self._blocks.get(key)
+                if block is not None:
+                    self._blocks.move_to_end(key)
+            FORECAST_BLOCKS.inc("hit" if block is not None else "miss")
+            if block is None:
+                # Generated outside the lock; a concurrent miss on the same key builds an equal block
+                block = self._block(seed, timestep_hours, step, origin, index)
+                with self._lock:
+                    self._blocks[key] = block
+                    while len(self._blocks) > self.max_blocks:
+                        self._blocks.popitem(last=False)
+            blocks.append(block)
+
+        window = slice(int(first) - first_block * TRAJECTORY_BLOCK_STEPS,
+                       int(first) - first_block * TRAJECTORY_BLOCK_STEPS + steps)
+        forecast = {key: np.concatenate([block[key] for block in blocks])[window]
+                    for key in ("time",) + WEATHER_KEYS + ("demand_noise",)}
+
+        # The noise-free profile scaled per call, so total_daily_kwh is not part of the key
+        demand = expected_demand(start.item(), steps, timestep_hours, total_daily_kwh)
+        noise = forecast.pop("demand_noise")
+        forecast["demand"] = np.maximum(total_daily_kwh / 24.0 * 0.7, demand + noise * demand)
+        return forecast
+
@@ -0,0 +1,229 @@
+"""
+history_store.py
+
+Columnar, append-only store for simulation history. Each step is one row of typed
+columns: the step timestamp, the totals from MicrogridManager.step and the power output
+of every device. Rows are kept in fixed-size chunks of preallocated arrays; once more
+than max_memory_chunks are full, the oldest are written to disk and read back through
+memory maps, so a long run's history does not have to fit in RAM.
+"""
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+# Result keys from MicrogridManager.step stored as columns, and their short column names
+RESULT_COLUMNS = {
+    "Demand (kW)": "demand_kw",
+    "Renewable Generation (kW)": "renewable_kw",
+    "Diesel Generation (kW)": "diesel_kw",
+    "Battery Flow (kW)": "battery_kw",
+    "Grid Flow (kW)": "grid_kw",
+    "Total Battery SOC (kWh)": "battery_soc_kwh",
+    "Total Diesel Usage (L/h)": "diesel_usage_lph",
+    "Total Grid Cost ($)": "grid_cost",
+}
+METRIC_COLUMNS = ("timestep_hours",) + tuple(RESULT_COLUMNS.values())
+
+HISTORY_CHUNK_ROWS = 1024
+HISTORY_MEMORY_CHUNKS = 8
+
+
+class _Chunk:
+    """Up to `capacity` rows: timestamps, a metrics matrix and a per-device output matrix"""
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rows = 0
+        self.timestamps = np.empty(capacity, dtype="datetime64[us]")
+        self.metrics = np.empty((capacity, len(METRIC_COLUMNS)))
+        self.device_index = {}
+        self.device_outputs = np.full((capacity, 0), np.nan, dtype=np.float64)
+        self.ordered = True
+        self.path = None
+
+    @property
+    def full(self) -> bool:
+        return self.rows == self.capacity
+
+    def _device_columns(self, names: list) -> list:
+        new = [name for name in names if name not in self.device_index]
+        if new:
+            for name in new:
+                self.device_index[name] = len(self.device_index)
+            grown = np.full((self.capacity, len(self.device_index)), np.nan, dtype=np.float64)
+            grown[:, :self.device_outputs.shape[1]] = self.device_outputs
+            self.device_outputs = grown
+        return [self.device_index[name] for name in names]
+
+    def append(self, timestamp: np.datetime64, metrics: list, names: list, outputs: list):
+        row = self.rows
+        if row and timestamp < self.timestamps[row - 1]:
+            self.ordered = False
+        self.timestamps[row] = timestamp
+        self.metrics[row] = metrics
+        if names:
+            columns = self._device_columns(names)
+            self.device_outputs[row, columns] = outputs
+        self.rows += 1
+
+    def __getstate__(self) -> dict:
+        # Only the filled rows, read into memory if the chunk was spilled
+        state = dict(self.__dict__, path=None)
+        for attr in ("timestamps", "metrics", "device_outputs"):
+            state[attr] = np.array(getattr(self, attr)[:self.rows])
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        # Device outputs are widened from the float32 of older checkpoints
+        for attr, fill, dtype in (("timestamps", None, None), ("metrics", None, None),
+                                  ("device_outputs", np.nan, np.float64)):
+            filled = getattr(self, attr)
+            array = np.empty((self.capacity,) + filled.shape[1:], dtype=dtype or filled.dtype)
+            if fill is not None:
+                array.fill(fill)
+            array[:self.rows] = filled
+            setattr(self, attr, array)
+
+    def spill(self, directory: str):
+        """Move the arrays to .npy files and reopen them as read-only memory maps"""
+        self.path = directory
+        os.makedirs(directory, exist_ok=True)
+        for attr in ("timestamps", "metrics", "device_outputs"):
+            file = os.path.join(directory, f"{attr}.npy")
+            np.save(file, getattr(self, attr)[:self.rows])
+            setattr(self, attr, np.load(file, mmap_mode="r"))
+
+    def select(self, start: np.datetime64, end: np.datetime64):
+        """Row indices with start <= timestamp < end (either bound may be None)"""
+        timestamps = self.timestamps[:self.rows]
+        if self.ordered:
+            lo = 0 if start is None else np.searchsorted(timestamps, start, side="left")
+            hi = self.rows if end is None else np.searchsorted(timestamps, end, side="left")
+            return slice(lo, hi)
+        mask = np.ones(self.rows, dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps < end
+        return np.flatnonzero(mask)
+
+
+class HistoryStore:
+    """
+    spill_dir: directory for spilled chunks. None keeps everything in memory; "temp"
+    uses a private temporary directory that is removed with the store.
+
+    Stores pickle with their rows (spilled chunks included) and unpickle with the same
+    spill setting, spilling into a fresh directory of their own.
+    """
+    def __init__(self, chunk_rows: int = HISTORY_CHUNK_ROWS, max_memory_chunks: int = HISTORY_MEMORY_CHUNKS,
+                 spill_dir: str = None):
+        self.chunk_rows = chunk_rows
+        self.max_memory_chunks = max_memory_chunks
+        self._use_spill_dir(spill_dir)
+        self._chunks = []
+        self._spilled = 0
+        self._rows = 0
+
+    def _use_spill_dir(self, spill_dir: str):
+        self.spill_setting = spill_dir
+        if spill_dir == "temp":
+            spill_dir = tempfile.mkdtemp(prefix="microgrid-history-")
+            weakref.finalize(self, shutil.rmtree, spill_dir, True)
+        self.spill_dir = spill_dir
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        del state["spill_dir"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        spill_dir = self.spill_setting
+        if spill_dir not in (None, "temp"):
+            # Never reuse the original store's chunk files
+            os.makedirs(spill_dir, exist_ok=True)
+            spill_dir = tempfile.mkdtemp(prefix="restored-", dir=spill_dir)
+        self._use_spill_dir(spill_dir)
+        self.spill_setting = state["spill_setting"]
+        self._spilled = 0
+        self._spill_old_chunks()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __bool__(self) -> bool:
+        return self._rows > 0
+
+    def append(self, timestamp: datetime, results: dict, devices: list = (), timestep_hours: float = 1.0):
+        """Record one step's results and the current output of each device"""
+        if not self._chunks or self._chunks[-1].full:
+            self._chunks.append(_Chunk(self.chunk_rows))
+            self._spill_old_chunks()
+        metrics = [timestep_hours] + [results.get(key, np.nan) for key in RESULT_COLUMNS]
+        names = [device.name for device in devices]
+        outputs = [device.get_power_output() for device in devices]
+        self._chunks[-1].append(np.datetime64(timestamp, "us"), metrics, names, outputs)
+        self._rows += 1
+
+    def _spill_old_chunks(self):
+        if self.spill_dir is None:
+            return
+        in_memory = len(self._chunks) - self._spilled
+        while in_memory > self.max_memory_chunks:
+            chunk = self._chunks[self._spilled]
+            chunk.spill(os.path.join(self.spill_dir, f"chunk_{self._spilled:06d}"))
+            self._spilled += 1
+            in_memory -= 1
+
+    def query(self, start: datetime = None, end: datetime = None, devices=None, last: int = None) -> dict:
+        """
+        Rows with start <= timestamp < end, or only the `last` rows. Returns
+        {"timestamps": datetime64 array, "columns": {name: array}, "devices": {name: array}};
+        devices is a list of device names, or "*" for every device seen. Device series are
+        NaN for rows recorded while the device was absent.
+        """
+        start = None if start is None else np.datetime64(start, "us")
+        end = None if end is None else np.datetime64(end, "us")
+
+        selections = []
+        if last is not None:
+            remaining = last
+            for chunk in reversed(self._chunks):
+                if remaining <= 0:
+                    break
+                take = min(remaining, chunk.rows)
+                selections.append((chunk, slice(chunk.rows - take, chunk.rows)))
+                remaining -= take
+            selections.reverse()
+        else:
+            selections = [(chunk, chunk.select(start, end)) for chunk in self._chunks]
+
+        if devices == "*":
+            devices = list(dict.fromkeys(name for chunk in self._chunks for name in chunk.device_index))
+        devices = devices or []
+
+        timestamps = [chunk.timestamps[rows] for chunk, rows in selections]
+        metrics = [chunk.metrics[rows] for chunk, rows in selections]
+        device_series = {name: [] for name in devices}
+        for chunk, rows in selections:
+            count = len(chunk.timestamps[rows])
+            for name in devices:
+                column = chunk.device_index.get(name)
+                device_series[name].append(
+                    chunk.device_outputs[rows, column] if column is not None else np.full(count, np.nan, np.float64))
+
+        metrics = np.concatenate(metrics) if metrics else np.empty((0, len(METRIC_COLUMNS)))
+        return {
+            "timestamps": np.concatenate(timestamps) if timestamps else np.empty(0, dtype="datetime64[us]"),
+            "columns": {name: metrics[:, i] for i, name in enumerate(METRIC_COLUMNS)},
+            "devices": {name: np.concatenate(parts) if parts else np.empty(0, np.float64)
+                        for name, parts in device_series.items()},
+        }
+
+    def tail(self, rows: int) -> dict:
+        """The last `rows` rows, as returned by query()"""
+        return self.query(last=rows)
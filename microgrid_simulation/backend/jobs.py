@@ -0,0 +1,187 @@
+"""
+jobs.py
+
+Long-running simulation jobs. A job simulates a fresh copy of a microgrid over a whole
+horizon in a pool of worker processes, in chunks, so progress can be reported while it
+runs and the API event loop is never blocked.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import multiprocessing
+import threading
+import uuid
+import numpy as np
+
+from environment_simulation import Environment, spawn_seeds
+from power_simulation import MicrogridManager, DemandGenerator, build_device
+from replay import RecordedSeries, ReplayEnvironment, ReplayDemand
+
+# Steps simulated per worker round trip; progress is reported at this granularity
+JOB_CHUNK_STEPS = 720
+# Finished jobs kept for result retrieval before the oldest are dropped
+MAX_FINISHED_JOBS = 100
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+
+
+def build_job_state(config: dict) -> tuple:
+    """Fresh (environment, microgrid, demand generator) for a job config"""
+    environment_seed, demand_seed = spawn_seeds(config.get("seed"), 2)
+    replay = config.get("replay") or {}
+    if replay.get("weather"):
+        environment = ReplayEnvironment(_recording(replay["weather"]), environment_seed, config.get("start_time"))
+    else:
+        environment = Environment(environment_seed, config["start_time"])
+    microgrid = MicrogridManager(environment, [build_device(c) for c in config["devices"]])
+    microgrid.set_diesel_strategy(config.get("diesel_strategy", "demand_following"))
+    if replay.get("demand"):
+        demand = ReplayDemand(_recording(replay["demand"]))
+        microgrid.demand_forecaster = demand
+    else:
+        demand = DemandGenerator(config.get("total_daily_kwh", 50000.0), demand_seed)
+    return environment, microgrid, demand
+
+
+def _recording(config: dict) -> RecordedSeries:
+    """RecordedSeries from {"path", "columns", "time_column"?}"""
+    if not isinstance(config, dict) or "path" not in config or "columns" not in config:
+        raise ValueError("Replay recordings need a path and a columns mapping")
+    return RecordedSeries(config["path"], config["columns"], config.get("time_column", "time"))
+
+
+def run_job_chunk(state: tuple, steps: int, timestep_hours: float) -> tuple:
+    """Advance a job's state by `steps` timesteps in a worker process"""
+    environment, microgrid, demand = state
+    demand_series = demand.series(environment.current_time, steps, timestep_hours)
+    results = microgrid.run(steps, demand_series, timestep_hours)
+    return (environment, microgrid, demand), results
+
+
+class SimulationJob:
+    def __init__(self, config: dict):
+        self.id = uuid.uuid4().hex
+        self.config = config
+        self.status = QUEUED
+        self.completed_steps = 0
+        self.submitted_at = datetime.now()
+        self.finished_at = None
+        self.error = None
+        self.results = None
+        self._chunks = []
+        self._cancelled = threading.Event()
+
+    @property
+    def horizon_steps(self) -> int:
+        return self.config["horizon_steps"]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "completed_steps": self.completed_steps,
+            "horizon_steps": self.horizon_steps,
+            "progress_percent": self.completed_steps / self.horizon_steps * 100 if self.horizon_steps else 100.0,
+            "submitted_at": self.submitted_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on a shared process pool. Each job has a lightweight driver thread that
+    ships its state to a worker one chunk at a time, so many jobs interleave fairly.
+    """
+    def __init__(self, max_workers: int = None, chunk_steps: int = JOB_CHUNK_STEPS):
+        self.max_workers = max_workers
+        self.chunk_steps = chunk_steps
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = None
+        self._drivers = None
+
+    def _pools(self):
+        if self._workers is None:
+            # spawn rather than fork: the API process is multi-threaded
+            self._workers = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            self._drivers = ThreadPoolExecutor(thread_name_prefix="simulation-job")
+        return self._workers, self._drivers
+
+    def submit(self, config: dict) -> SimulationJob:
+        """
+        config: horizon_steps, timestep_hours, start_time, devices (config dicts) and
+        optionally seed, total_daily_kwh and diesel_strategy. replay: optional {"weather",
+        "demand"} recordings, each {"path", "columns", "time_column"}, replayed in place of
+        the synthetic weather and demand; start_time may then be None for the start of
+        the weather recording.
+        """
+        build_job_state(config)  # fail fast on bad devices or strategy
+        job = SimulationJob(config)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        _, drivers = self._pools()
+        drivers.submit(self._drive, job)
+        return job
+
+    def _drive(self, job: SimulationJob):
+        workers, _ = self._pools()
+        job.status = RUNNING
+        try:
+            state = build_job_state(job.config)
+            while job.completed_steps < job.horizon_steps:
+                if job._cancelled.is_set():
+                    job.status = CANCELLED
+                    return
+                steps = min(self.chunk_steps, job.horizon_steps - job.completed_steps)
+                state, chunk = workers.submit(run_job_chunk, state, steps, job.config["timestep_hours"]).result()
+                job._chunks.append(chunk)
+                job.completed_steps += steps
+            job.results = _concatenate(job._chunks)
+            job._chunks = []
+            job.status = COMPLETED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = datetime.now()
+
+    def get(self, job_id: str) -> SimulationJob:
+        with self._lock:
+            return self._jobs[job_id]
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> SimulationJob:
+        job = self.get(job_id)
+        if job.status in (QUEUED, RUNNING):
+            job._cancelled.set()
+        return job
+
+    def shutdown(self):
+        """Cancel unfinished jobs and stop the pools; waits for at most one chunk per job"""
+        for job in self.list():
+            if job.status in (QUEUED, RUNNING):
+                job._cancelled.set()
+        if self._workers is not None:
+            self._drivers.shutdown(wait=True)
+            self._workers.shutdown(wait=True)
+            self._workers = self._drivers = None
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+
+def _concatenate(chunks: list) -> dict:
+    """Join per-chunk result columns into one column per key"""
+    columns = {}
+    for key in chunks[0]:
+        if isinstance(chunks[0][key], np.ndarray):
+            columns[key] = np.concatenate([chunk[key] for chunk in chunks])
+        else:
+            columns[key] = [value for chunk in chunks for value in chunk[key]]
+    return columns
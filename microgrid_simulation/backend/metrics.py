@@ -0,0 +1,231 @@
+"""
+metrics.py
+
+In-process counters and histograms for the simulation hot paths and the API, rendered in
+the Prometheus text format at /metrics. Hot paths time phases with a PhaseTimer, one
+clock read per phase boundary; with metrics disabled (MICROGRID_METRICS=0) timer()
+returns None and every instrumentation point reduces to an `if timer:` check.
+"""
+from bisect import bisect_left
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.environ.get("MICROGRID_METRICS", "1").lower() not in ("0", "false", "no", "off")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; spans a vectorized device update (~10 µs) to a multi-year run
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Counter:
+    def __init__(self, registry, name: str, documentation: str, labelnames: tuple = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, registry, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels: [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def timer(self, *labels):
+        """A PhaseTimer observing into this histogram, or None while metrics are disabled"""
+        return PhaseTimer(self, labels) if self.registry.enabled else None
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(series[0]), series[1], series[2])) for labels, series in self._series.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class PhaseTimer:
+    """
+    Times consecutive phases of one operation: lap(phase) records the time since the
+    previous lap (or since creation) under the phase label, done() the whole operation.
+    """
+    __slots__ = ("histogram", "labels", "start", "last")
+
+    def __init__(self, histogram: Histogram, labels: tuple = ()):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.histogram.observe(now - self.last, *self.labels, phase)
+        self.last = now
+
+    def done(self, phase: str = "total") -> float:
+        elapsed = time.perf_counter() - self.start
+        self.histogram.observe(elapsed, *self.labels, phase)
+        return elapsed
+
+
+class Registry:
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, documentation: str, labelnames: tuple, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric '{name}' is already registered with a different type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._get(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+def _parse_number(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def merge_text(texts: list) -> str:
+    """
+    Several registries' render() output as one, with equal series summed. Counters and
+    histogram buckets, sums and counts are all additive, so the result reads as if every
+    registry had counted into one.
+    """
+    families = {}  # name: [HELP line, TYPE line, {series: value}], in first-seen order
+    for text in texts:
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                name = line.split(" ", 3)[2]
+                family = families.setdefault(name, [None, None, {}])
+                slot = 0 if line.startswith("# HELP ") else 1
+                family[slot] = family[slot] or line
+            elif line and family is not None:
+                series, _, value = line.rpartition(" ")
+                samples = family[2]
+                samples[series] = samples.get(series, 0) + _parse_number(value)
+    lines = []
+    for help_line, type_line, samples in families.values():
+        lines += [line for line in (help_line, type_line) if line]
+        lines += [f"{series} {_number(value) if isinstance(value, float) else value}"
+                  for series, value in samples.items()]
+    return "\n".join(lines) + "\n"
+
+
+# Shared by the simulation core and the API
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "microgrid_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "microgrid_http_request_duration_seconds", "Time to handle an HTTP request, including the response body.",
+    ("method", "route"))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording HTTP_REQUESTS and HTTP_REQUEST_SECONDS per route template"""
+    def __init__(self, app, registry: Registry = REGISTRY):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Templates, not raw paths, so session and job IDs do not become label values
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], route)
+            HTTP_REQUESTS.inc(scope["method"], route, str(status[0]))
@@ -0,0 +1,137 @@
+"""
+monte_carlo.py
+
+Monte Carlo sizing runs: one microgrid configuration simulated under many independent
+weather and demand draws. Each run gets its own Environment and MicrogridManager in a
+worker process, so runs scale across cores and never touch the live simulation.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+
+from environment_simulation import Environment, spawn_seeds
+from power_simulation import MicrogridManager, DemandGenerator, build_device
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Shortfalls below this (kW) are floating-point residue, not unserved load
+UNSERVED_TOLERANCE_KW = 1e-6
+
+# Per-run summary metrics aggregated across the scenario set
+METRICS = (
+    "diesel_litres",
+    "grid_cost",
+    "unserved_energy_kwh",
+    "min_battery_soc_percent",
+    "mean_battery_soc_percent",
+    "final_battery_soc_percent",
+)
+
+
+def summarize_run(results: dict, timestep_hours: float, battery_capacity_kwh: float) -> dict:
+    """Reduce the per-step columns from MicrogridManager.run to one value per metric"""
+    demand = results["Demand (kW)"]
+    supplied = (results["Renewable Generation (kW)"] + results["Diesel Generation (kW)"] +
+                results["Battery Flow (kW)"] + results["Grid Flow (kW)"])
+    shortfall = demand - supplied
+    shortfall[shortfall < UNSERVED_TOLERANCE_KW] = 0.0
+    soc = results["Total Battery SOC (kWh)"]
+    soc_percent = soc / battery_capacity_kwh * 100 if battery_capacity_kwh > 0 else np.zeros(len(soc))
+
+    return {
+        "diesel_litres": float(results["Total Diesel Usage (L/h)"].sum() * timestep_hours),
+        "grid_cost": float(results["Total Grid Cost ($)"].sum()),
+        "unserved_energy_kwh": float(shortfall.sum() * timestep_hours),
+        "min_battery_soc_percent": float(soc_percent.min()) if len(soc) else 0.0,
+        "mean_battery_soc_percent": float(soc_percent.mean()) if len(soc) else 0.0,
+        "final_battery_soc_percent": float(soc_percent[-1]) if len(soc) else 0.0,
+    }
+
+
+def simulate_scenario(device_configs: list, seed, horizon_steps: int, timestep_hours: float = 1.0,
+                      total_daily_kwh: float = 50000.0, start_time: datetime = None,
+                      diesel_strategy: str = "demand_following") -> dict:
+    """
+    Build a fresh microgrid from device_configs and run it for one seed. Runs in worker
+    processes, so everything it needs comes in through its (picklable) arguments.
+    """
+    start_time = start_time or datetime(datetime.now().year, 1, 1)
+    environment_seed, demand_seed = spawn_seeds(seed, 2)
+    environment = Environment(environment_seed, start_time)
+    microgrid = MicrogridManager(environment, [build_device(config) for config in device_configs])
+    microgrid.set_diesel_strategy(diesel_strategy)
+
+    demand = DemandGenerator(total_daily_kwh, demand_seed).series(start_time, horizon_steps, timestep_hours)
+    results = microgrid.run(horizon_steps, demand, timestep_hours)
+
+    battery_capacity = sum(c["capacity_kwh"] for c in device_configs if c.get("type") == "Battery")
+    return summarize_run(results, timestep_hours, battery_capacity)
+
+
+class MonteCarloAggregate:
+    """Per-metric samples collected so far, with percentile summaries"""
+    def __init__(self, total_runs: int):
+        self.total_runs = total_runs
+        self.completed = 0
+        self._samples = {metric: np.empty(total_runs) for metric in METRICS}
+        self._done = np.zeros(total_runs, dtype=bool)
+
+    def add(self, run_index: int, summary: dict):
+        """Record one run. Samples are stored by run index so the result does not depend on completion order."""
+        for metric in METRICS:
+            self._samples[metric][run_index] = summary[metric]
+        self._done[run_index] = True
+        self.completed += 1
+
+    def percentiles(self) -> dict:
+        if not self.completed:
+            return {}
+        summary = {}
+        for metric, samples in self._samples.items():
+            values = samples[self._done]
+            summary[metric] = {
+                "mean": float(values.mean()),
+                **{f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))},
+            }
+        return summary
+
+    def to_dict(self) -> dict:
+        return {
+            "completed_runs": self.completed,
+            "total_runs": self.total_runs,
+            "metrics": self.percentiles(),
+        }
+
+
+def iter_monte_carlo(device_configs: list, seeds: list, horizon_steps: int, timestep_hours: float = 1.0,
+                     total_daily_kwh: float = 50000.0, start_time: datetime = None,
+                     diesel_strategy: str = "demand_following", max_workers: int = None,
+                     report_every: int = 1):
+    """
+    Run one scenario per seed across a process pool, yielding the running aggregate
+    (MonteCarloAggregate.to_dict()) every report_every completed runs and once at the end.
+    Each run depends only on its own seed, so the final percentiles are reproducible
+    whatever the worker count.
+    """
+    start_time = start_time or datetime(datetime.now().year, 1, 1)
+    seeds = list(seeds)
+    aggregate = MonteCarloAggregate(len(seeds))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(simulate_scenario, device_configs, seed, horizon_steps, timestep_hours,
+                            total_daily_kwh, start_time, diesel_strategy): run_index
+            for run_index, seed in enumerate(seeds)
+        }
+        for future in as_completed(futures):
+            aggregate.add(futures[future], future.result())
+            if aggregate.completed % report_every == 0 or aggregate.completed == len(seeds):
+                yield aggregate.to_dict()
+
+
+def run_monte_carlo(device_configs: list, runs: int, horizon_steps: int, seed=None, **kwargs) -> dict:
+    """Run `runs` scenarios seeded from one root seed and return the final aggregate"""
+    seeds = spawn_seeds(seed, runs)
+    result = {}
+    for result in iter_monte_carlo(device_configs, seeds, horizon_steps, report_every=runs, **kwargs):
+        pass
+    return result
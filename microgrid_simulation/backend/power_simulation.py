@@ -5,18 +5,43 @@ This file represents multiple power generation and storage devices.
 """
 
 from environment_simulation import Environment
+from abc import ABC, abstractmethod
+from bisect import bisect_right
 import math
-from datetime import datetime
-import random
+from datetime import datetime, timedelta
+import numpy as np
 
-class PowerDevice:
+from economic_dispatch import (DISPATCH_REPLAN_SOC_TOLERANCE, DISPATCH_REPLAN_STEPS, EconomicDispatcher,
+                               diesel_setpoints)
+from unit_commitment import UnitCommitment
+from metrics import REGISTRY
+
+STEP_PHASE_SECONDS = REGISTRY.histogram(
+    "microgrid_step_phase_seconds", "Time spent in each phase of MicrogridManager.step.", ("phase",))
+RUN_PHASE_SECONDS = REGISTRY.histogram(
+    "microgrid_run_phase_seconds", "Time spent in each phase of MicrogridManager.run.", ("phase",))
+SIMULATED_STEPS = REGISTRY.counter(
+    "microgrid_simulated_steps_total", "Timesteps simulated, by entry point.", ("mode",))
+FAST_FORWARD_DISPATCHES = REGISTRY.counter(
+    "microgrid_fast_forward_dispatches_total", "Dispatch steps fast_forward took, coarse or fine.")
+
+# Upper bound on timestep x device cells evaluated at once by DeviceFleet.output_series
+FLEET_CHUNK_CELLS = 1_000_000
+
+class PowerDevice(ABC):
     def __init__(self, name: str):
+        if not isinstance(name, str):
+            raise ValueError("Device name must be a string")
         self.name: str = name
         self.power_output = 0.0  # Current power output in kW
 
     def update_output(self, environment: Environment) -> None:
         pass
 
+    @abstractmethod
+    def to_config(self) -> dict:
+        """Constructor parameters plus a "type" key, as accepted by build_device"""
+
     def get_power_output(self) -> float:
         return self.power_output
 
@@ -25,8 +50,8 @@ class PowerDevice:
 
 class WindTurbine(PowerDevice):
     # ADDED: Realistic power curve parameters
-    def __init__(self, name: str, rated_power: float, direction: int, 
-                 cut_in_speed: float, rated_speed: float, cut_out_speed: float):
+    def __init__(self, name: str, rated_power: float, direction: int,
+                 cut_in_speed: float = 3.0, rated_speed: float = 12.0, cut_out_speed: float = 25.0):
         super().__init__(name)
         self.rated_power = rated_power
         self.cut_in_speed = cut_in_speed
@@ -36,7 +61,7 @@ class WindTurbine(PowerDevice):
         if 0 <= direction <= 360:
             self.direction = direction
         else:
-            raise ValueError("Invalid direction for WindTurbine.")
+            raise ValueError("Direction must be 0-360 degrees")
 
     def update_output(self, environment):
         wind_speed = environment.wind_speed
@@ -62,6 +87,11 @@ class WindTurbine(PowerDevice):
         
         self.power_output = power * alignment_factor
 
+    def to_config(self) -> dict:
+        return {"type": "WindTurbine", "name": self.name, "rated_power": self.rated_power,
+                "direction": self.direction, "cut_in_speed": self.cut_in_speed,
+                "rated_speed": self.rated_speed, "cut_out_speed": self.cut_out_speed}
+
 class SolarPanel(PowerDevice):
     def __init__(self, name: str, rated_power: float, temp_coefficient: float = 0.004, stc_temp: float = 25.0):
         super().__init__(name)
@@ -83,11 +113,22 @@ class SolarPanel(PowerDevice):
         # Final power is base power adjusted for temperature
         self.power_output = max(0.0, base_power * temp_derating)
 
+    def to_config(self) -> dict:
+        return {"type": "SolarPanel", "name": self.name, "rated_power": self.rated_power,
+                "temp_coefficient": self.temp_coefficient, "stc_temp": self.stc_temp}
+
 class DieselGenerator(PowerDevice):
-    def __init__(self, name: str, rated_power: float, diesel_usage_litre_per_kw: float = 0.4):
+    def __init__(self, name: str, rated_power: float, diesel_usage_litre_per_kw: float = 0.4,
+                 min_load_fraction: float = 0.0, min_up_time_hours: float = 0.0,
+                 min_down_time_hours: float = 0.0, startup_cost: float = 0.0):
         super().__init__(name)
         self.rated_power = rated_power
         self.diesel_usage_litre_per_kw = diesel_usage_litre_per_kw
+        # Unit commitment constraints, honoured by the "unit_commitment" strategy
+        self.min_load_fraction = min_load_fraction  # Lowest output while running, as a fraction of rated power
+        self.min_up_time_hours = min_up_time_hours
+        self.min_down_time_hours = min_down_time_hours
+        self.startup_cost = startup_cost  # $ per start
 
     def update_output(self, environment, setpoint_kw):
         self.power_output = min(self.rated_power, setpoint_kw)
@@ -95,9 +136,19 @@ class DieselGenerator(PowerDevice):
     def get_diesel_usage(self):
         return self.diesel_usage_litre_per_kw * self.power_output
 
+    def to_config(self) -> dict:
+        return {"type": "DieselGenerator", "name": self.name, "rated_power": self.rated_power,
+                "diesel_usage_litre_per_kw": self.diesel_usage_litre_per_kw,
+                "min_load_fraction": self.min_load_fraction, "min_up_time_hours": self.min_up_time_hours,
+                "min_down_time_hours": self.min_down_time_hours, "startup_cost": self.startup_cost}
+
 class GridConnection(PowerDevice):
     def __init__(self, name: str, import_price: float, export_price: float):
         super().__init__(name)
+        if import_price < 0:
+            raise ValueError("Import price must be non-negative")
+        if export_price < 0:
+            raise ValueError("Export price must be non-negative")
         self.import_price = import_price # Price to buy from grid ($/kWh)
         self.export_price = export_price # Price to sell to grid ($/kWh)
 
@@ -115,10 +166,22 @@ class GridConnection(PowerDevice):
         else:
             return 0.0
 
+    def to_config(self) -> dict:
+        return {"type": "GridConnection", "name": self.name,
+                "import_price": self.import_price, "export_price": self.export_price}
+
 class Battery(PowerDevice):
     def __init__(self, name: str, capacity_kwh: float, max_power_kw: float, 
                  efficiency: float = 0.90, initial_charge: float = 0.5):
         super().__init__(name)
+        if capacity_kwh <= 0:
+            raise ValueError("Capacity must be positive")
+        if max_power_kw <= 0:
+            raise ValueError("Max power must be positive")
+        if not (0 < efficiency <= 1):
+            raise ValueError("Efficiency must be between 0 and 1")
+        if not (0 <= initial_charge <= 1):
+            raise ValueError("Initial charge must be between 0 and 1")
         self.capacity_kwh = capacity_kwh
         self.max_power_kw = max_power_kw
         # Account for round-trip efficiency
@@ -152,72 +215,429 @@ class Battery(PowerDevice):
     def get_state_of_charge(self) -> float:
         return self.state_of_charge
 
+    def to_config(self) -> dict:
+        """Parameters that rebuild this battery, with its current charge as initial_charge"""
+        return {"type": "Battery", "name": self.name, "capacity_kwh": self.capacity_kwh,
+                "max_power_kw": self.max_power_kw, "efficiency": self.one_way_efficiency ** 2,
+                "initial_charge": self.state_of_charge / self.capacity_kwh if self.capacity_kwh else 0.0}
+
+DEVICE_TYPES = {cls.__name__: cls for cls in (WindTurbine, SolarPanel, DieselGenerator, GridConnection, Battery)}
+
+def build_device(config: dict) -> PowerDevice:
+    """Create a device from a config dict such as the one returned by its to_config()"""
+    params = dict(config)
+    device_type = params.pop("type", None)
+    if device_type not in DEVICE_TYPES:
+        raise ValueError(f"Unknown device type '{device_type}'. Use one of {list(DEVICE_TYPES)}")
+    try:
+        return DEVICE_TYPES[device_type](**params)
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters for {device_type}: {e}")
+
+def wind_power_curve(wind_speed, wind_direction, rated_power, direction,
+                     cut_in_speed, rated_speed, cut_out_speed):
+    """
+    Vectorized WindTurbine.update_output. Arguments broadcast against each other, so
+    passing weather as (steps, 1) columns and turbine parameters as (turbines,) rows
+    yields a (steps, turbines) matrix of outputs in kW.
+    """
+    angle_diff = np.abs(direction - wind_direction) % 360
+    angle_diff = np.where(angle_diff > 180, 360 - angle_diff, angle_diff)
+    alignment_factor = np.maximum(0.0, np.cos(np.radians(angle_diff)))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ramp = rated_power * (
+            (wind_speed**3 - cut_in_speed**3) /
+            (rated_speed**3 - cut_in_speed**3)
+        )
+    power = np.where((cut_in_speed <= wind_speed) & (wind_speed < rated_speed), ramp, 0.0)
+    power = np.where((rated_speed <= wind_speed) & (wind_speed < cut_out_speed), rated_power, power)
+    return power * alignment_factor
+
+def solar_power_output(solar_radiation, temperature, rated_power, temp_coefficient, stc_temp):
+    """Vectorized SolarPanel.update_output, broadcasting like wind_power_curve."""
+    max_radiation = 1000  # W/m²
+    base_power = rated_power * (solar_radiation / max_radiation)
+    temp_derating = 1.0 - (temperature - stc_temp) * temp_coefficient
+    return np.maximum(0.0, base_power * temp_derating)
+
+def _fill_in_order(total_setpoint, rated_power):
+    """
+    Load generators in list order until total_setpoint is covered, as the diesel
+    strategies do. Works on a scalar or a column of setpoints.
+    """
+    loaded_before = np.concatenate(([0.0], np.cumsum(rated_power)[:-1]))
+    remaining = np.asarray(total_setpoint, dtype=float)[..., None] - loaded_before
+    return np.clip(remaining, 0.0, rated_power)
+
+def _battery_charging_diesel(net: float, stored_kwh: float, total_capacity: float, charge_power: float,
+                             rated: list, usage_rate: list, outputs) -> tuple:
+    """
+    One step of the battery_charging strategy: below 30% average charge, load generators
+    in order for the net demand plus the batteries' full charging power. Writes each
+    generator's output into `outputs`; returns (generation kW, usage L/h).
+    """
+    avg_soc_percent = stored_kwh / total_capacity * 100 if total_capacity > 0 else 0
+    remaining = max(0.0, net) + charge_power if avg_soc_percent < 30 else 0.0
+    generation = usage = 0.0
+    for g, gen_rated in enumerate(rated):
+        output = min(gen_rated, max(0.0, remaining))
+        outputs[g] = output
+        generation += output
+        usage += output * usage_rate[g]
+        remaining -= output
+    return generation, usage
+
+def _dispatch_batteries(shortfall: float, soc: list, capacity: list, max_power: list, efficiency: list,
+                        share: list, hours: float, outputs: list) -> float:
+    """
+    Battery.update_output for every battery over one step of `hours`, with `shortfall`
+    (kW, negative for a surplus) split by capacity share. Updates soc and outputs in
+    place and returns the total battery flow (kW).
+    """
+    flow = 0.0
+    for i in range(len(soc)):
+        request = share[i] * shortfall
+        if request > 0:
+            output = min(request, soc[i] * efficiency[i] / hours, max_power[i])
+            soc[i] -= output * hours / efficiency[i]
+        elif request < 0:
+            charge = min(-request, max_power[i], (capacity[i] - soc[i]) / efficiency[i] / hours)
+            output = -charge
+            soc[i] += charge * hours * efficiency[i]
+        else:
+            output = 0.0
+        soc[i] = max(0, min(capacity[i], soc[i]))
+        outputs[i] = output
+        flow += output
+    return flow
+
+def _param_array(devices: list, attr: str) -> np.ndarray:
+    return np.array([getattr(d, attr) for d in devices], dtype=float)
+
+class DeviceFleet:
+    """
+    Struct-of-arrays store for wind turbines and solar panels.
+
+    Device parameters are packed into contiguous NumPy arrays so the wind power curve and
+    solar temperature derating are evaluated for the whole fleet in one call. The device
+    objects are kept alongside and stay addressable by name.
+    """
+    DEVICE_TYPES = (WindTurbine, SolarPanel)
+
+    def __init__(self, devices=()):
+        self._devices = {}
+        self._stale = True
+        for device in devices:
+            self.add(device)
+
+    def add(self, device: PowerDevice):
+        if not isinstance(device, self.DEVICE_TYPES):
+            raise TypeError(f"DeviceFleet only holds wind turbines and solar panels, not {device.__class__.__name__}")
+        if device.name in self._devices:
+            raise ValueError(f"Device '{device.name}' already exists")
+        self._devices[device.name] = device
+        self._stale = True
+
+    def remove(self, name: str) -> PowerDevice:
+        device = self._devices.pop(name)
+        self._stale = True
+        return device
+
+    def invalidate(self):
+        """Repack the parameter arrays on next use, e.g. after editing a device in place"""
+        self._stale = True
+
+    def __getitem__(self, name: str) -> PowerDevice:
+        return self._devices[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._devices
+
+    def __iter__(self):
+        return iter(self._devices.values())
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def _pack(self):
+        self.turbines = [d for d in self._devices.values() if isinstance(d, WindTurbine)]
+        self.panels = [d for d in self._devices.values() if isinstance(d, SolarPanel)]
+
+        self.turbine_rated_power = _param_array(self.turbines, "rated_power")
+        self.direction = _param_array(self.turbines, "direction")
+        self.cut_in_speed = _param_array(self.turbines, "cut_in_speed")
+        self.rated_speed = _param_array(self.turbines, "rated_speed")
+        self.cut_out_speed = _param_array(self.turbines, "cut_out_speed")
+        self.panel_rated_power = _param_array(self.panels, "rated_power")
+        self.temp_coefficient = _param_array(self.panels, "temp_coefficient")
+        self.stc_temp = _param_array(self.panels, "stc_temp")
+        self._stale = False
+
+    def power_outputs(self, wind_speed, wind_direction, temperature, solar_radiation) -> tuple:
+        """
+        Evaluate every turbine and panel. Scalar weather gives (turbines,) and (panels,)
+        arrays; weather columns of shape (steps, 1) give (steps, turbines) and (steps, panels).
+        """
+        if self._stale:
+            self._pack()
+        wind = wind_power_curve(wind_speed, wind_direction, self.turbine_rated_power, self.direction,
+                                self.cut_in_speed, self.rated_speed, self.cut_out_speed)
+        solar = solar_power_output(solar_radiation, temperature, self.panel_rated_power,
+                                   self.temp_coefficient, self.stc_temp)
+        return wind, solar
+
+    def _store_outputs(self, wind: np.ndarray, solar: np.ndarray):
+        for device, output in zip(self.turbines, wind.tolist()):
+            device.power_output = output
+        for device, output in zip(self.panels, solar.tolist()):
+            device.power_output = output
+
+    def update_outputs(self, environment) -> float:
+        """Update every device for the current environment and return the total output (kW)"""
+        wind, solar = self.power_outputs(environment.wind_speed, environment.wind_direction,
+                                         environment.temperature, environment.solar_radiation)
+        self._store_outputs(wind, solar)
+        return float(wind.sum() + solar.sum())
+
+    def output_series(self, weather: dict, store_outputs: bool = True) -> np.ndarray:
+        """
+        Total fleet output for each row of a weather dict of equal-length arrays, evaluated
+        in bounded chunks. Devices are left holding their output for the final row unless
+        store_outputs is False (e.g. when evaluating a forecast).
+        """
+        steps = len(weather["wind_speed"])
+        total = np.zeros(steps)
+        if steps == 0 or not self._devices:
+            return total
+        if self._stale:
+            self._pack()
+
+        chunk = max(1, FLEET_CHUNK_CELLS // max(len(self.turbines), len(self.panels)))
+        for start in range(0, steps, chunk):
+            window = slice(start, min(start + chunk, steps))
+            wind, solar = self.power_outputs(weather["wind_speed"][window, None],
+                                             weather["wind_direction"][window, None],
+                                             weather["temperature"][window, None],
+                                             weather["solar_radiation"][window, None])
+            total[window] = wind.sum(axis=1) + solar.sum(axis=1)
+        if store_outputs:
+            self._store_outputs(wind[-1], solar[-1])
+        return total
+
+DIESEL_STRATEGIES = {
+    "demand_following": "Run diesel only to meet unmet demand",
+    "battery_charging": "Run diesel to charge battery when SOC < 30%",
+    "manual": "Use manually set setpoints for each generator",
+    "economic_dispatch": "Plan diesel, battery and grid over a forecast horizon to minimise fuel plus grid cost",
+    "unit_commitment": "Start and load generators in order of fuel efficiency, honouring min load and up/down times",
+}
+# Strategies fast_forward steps adaptively. The others carry a plan or commitment state
+# from one fixed-length step to the next, so fast_forward runs them at the requested timestep.
+ADAPTIVE_STRATEGIES = ("demand_following", "battery_charging", "manual")
+# fast_forward leaves the batteries idle for shortfalls this small (kW): with diesel
+# covering demand, rounding leaves residues of about 1e-12 kW of either sign
+FAST_FORWARD_IDLE_KW = 1e-6
+# ... and treats a battery as empty or full within this fraction of its capacity
+BATTERY_LIMIT_TOLERANCE = 1e-12
+# Cost of one fast_forward step, in units of run() dispatching one battery for one row;
+# a row of run() costs about FAST_FORWARD_ROW_COST plus one per battery. Steps shorter
+# than the ratio on average are dispatched row by row instead.
+FAST_FORWARD_STEP_COST = 28
+FAST_FORWARD_ROW_COST = 3
+# Steps between checks that the adaptive steps are still paying off
+FAST_FORWARD_CHECK_STEPS = 256
+
 class MicrogridManager:
     def __init__(self, environment, devices: list):
         self.environment = environment
-        self.devices = devices
+        # Registry: devices by name in insertion order, plus per-type lists rebuilt lazily
+        # after an add or remove
+        self._devices = {}
+        self._device_list = None
+        self._buckets = {}
+        # Bumped whenever devices, their outputs or the control settings change
+        self.state_version = 0
+        self.fleet = DeviceFleet()
         self.diesel_strategy = "demand_following"
         self.diesel_setpoints = {}
+        self.step_listeners = []
+        # Used by the "economic_dispatch" strategy. demand_forecaster(start, steps, timestep_hours)
+        # returns forecast demand (kW); without one, current demand is assumed to persist.
+        self.dispatcher = EconomicDispatcher()
+        self.demand_forecaster = None
+        self.dispatch_plan = None
+        self.unit_commitment = UnitCommitment()
+        for device in devices:
+            self.add_device(device)
+
+    def __getstate__(self) -> dict:
+        # Step listeners belong to the running process (e.g. the live stream), not the site
+        return dict(self.__dict__, step_listeners=[])
+
+    def add_step_listener(self, listener):
+        """Call listener(results, timestep_hours) after every step()"""
+        self.step_listeners.append(listener)
+
+    @property
+    def devices(self) -> list:
+        """All devices in the order they were added. Use add_device/remove_device to change it."""
+        if self._device_list is None:
+            self._device_list = list(self._devices.values())
+        return self._device_list
+
+    def devices_of_type(self, device_type) -> list:
+        """Devices that are instances of device_type (a class or tuple of classes)"""
+        bucket = self._buckets.get(device_type)
+        if bucket is None:
+            bucket = self._buckets[device_type] = [d for d in self._devices.values() if isinstance(d, device_type)]
+        return bucket
+
+    @property
+    def diesel_generators(self) -> list:
+        return self.devices_of_type(DieselGenerator)
+
+    @property
+    def batteries(self) -> list:
+        return self.devices_of_type(Battery)
+
+    @property
+    def grid_connections(self) -> list:
+        return self.devices_of_type(GridConnection)
+
+    def get_device(self, name: str) -> PowerDevice:
+        """The named device; raises KeyError if there is none"""
+        try:
+            return self._devices[name]
+        except KeyError:
+            raise KeyError(f"Device '{name}' not found") from None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._devices
+
+    def _invalidate_registry(self):
+        self._device_list = None
+        self._buckets = {}
+        self.state_version += 1
+
+    def add_device(self, device: PowerDevice):
+        """Add a device, keeping the renewable fleet in sync. Names must be unique."""
+        if device.name in self._devices:
+            raise ValueError(f"Device '{device.name}' already exists")
+        if isinstance(device, DeviceFleet.DEVICE_TYPES):
+            self.fleet.add(device)
+        elif isinstance(device, DieselGenerator):
+            self.unit_commitment.add(device)
+        self._devices[device.name] = device
+        self._invalidate_registry()
+
+    def add_devices(self, devices: list):
+        """Add several devices as one transaction: if any cannot be added, none are"""
+        clashes = [d.name for d in devices if d.name in self._devices]
+        if clashes:
+            raise ValueError(f"Devices already exist: {clashes}")
+        added = []
+        try:
+            for device in devices:
+                self.add_device(device)
+                added.append(device)
+        except Exception:
+            for device in reversed(added):
+                self.remove_device(device.name)
+            raise
+
+    def remove_device(self, name: str) -> PowerDevice:
+        """Remove and return the named device"""
+        device = self.get_device(name)
+        if name in self.fleet:
+            self.fleet.remove(name)
+        elif isinstance(device, DieselGenerator):
+            self.unit_commitment.remove(name)
+        del self._devices[name]
+        self._invalidate_registry()
+        return device
 
     def set_diesel_strategy(self, strategy: str):
-        valid_strategies = ["demand_following", "battery_charging", "manual"]
+        valid_strategies = list(DIESEL_STRATEGIES)
         if strategy not in valid_strategies:
             raise ValueError(f"Strategy must be one of {valid_strategies}")
+        if strategy == "unit_commitment" and self.diesel_strategy != strategy:
+            # Other strategies set outputs freely; start from every unit stopped
+            self.unit_commitment.reset()
         self.diesel_strategy = strategy
+        self.state_version += 1
 
     def set_diesel_setpoint(self, generator_name: str, setpoint_kw: float):
         self.diesel_setpoints[generator_name] = setpoint_kw
+        self.state_version += 1
 
     def step(self, demand_kw: float, timestep_hours: float = 1.0) -> dict:
-        # 1. Separate devices by type for easier management
-        renewable_devices = []
-        diesel_generators = []
-        batteries = [d for d in self.devices if isinstance(d, Battery)]
-        grid_connections = [d for d in self.devices if isinstance(d, GridConnection)]
-
-        for d in self.devices:
-            if isinstance(d, DieselGenerator):
-                diesel_generators.append(d)
-            elif isinstance(d, (WindTurbine, SolarPanel)):
-                d.update_output(self.environment)
-                renewable_devices.append(d)
-
-        # 2. Calculate total renewable generation
-        renewable_generation = sum(d.get_power_output() for d in renewable_devices)
+        timer = STEP_PHASE_SECONDS.timer()
+        # 1. Devices by type, from the registry's cached buckets
+        diesel_generators = self.diesel_generators
+        batteries = self.batteries
+        grid_connections = self.grid_connections
+
+        # 2. Update the whole wind/solar fleet at once and total its generation
+        renewable_generation = self.fleet.update_outputs(self.environment)
+        if timer:
+            timer.lap("update_outputs")
         
         # 3. Calculate demand remaining after renewables
         net_demand_after_renewables = demand_kw - renewable_generation
         
         # 4. Determine required diesel generation based on strategy
+        economic = self.diesel_strategy == "economic_dispatch"
+        if economic:
+            self.dispatch_plan = self._plan_dispatch(demand_kw, renewable_generation, timestep_hours)
+            if timer:
+                timer.lap("plan_dispatch")
         diesel_generation = self._control_diesel_generators(
             diesel_generators, net_demand_after_renewables, timestep_hours
         )
+        if timer:
+            timer.lap("control_diesel_generators")
         
         # 5. Calculate total generation and the final net demand for the batteries
         total_generation = renewable_generation + diesel_generation
         net_demand_for_batteries = demand_kw - total_generation
 
-        # 6. Battery response: Charge with surplus or discharge to meet shortfall
+        # 6. Battery response: Charge with surplus or discharge to meet shortfall,
+        # or follow the dispatch plan
+        battery_request = self.dispatch_plan.battery_kw[0] if economic else net_demand_for_batteries
         total_battery_power = 0.0
         total_battery_capacity = sum(bat.capacity_kwh for bat in batteries) or 1
         for battery in batteries:
-            battery_share = (battery.capacity_kwh / total_battery_capacity) * net_demand_for_batteries
+            battery_share = (battery.capacity_kwh / total_battery_capacity) * battery_request
             battery.update_output(self.environment, battery_share, timestep_hours)
             total_battery_power += battery.get_power_output()
+        if timer:
+            timer.lap("batteries")
             
         # 7. Final net demand after battery response
         final_net_demand = net_demand_for_batteries - total_battery_power
+        if economic and not grid_connections and final_net_demand > 0 and diesel_generators:
+            # Batteries delivered less than planned and nothing else can cover it: use spare diesel
+            diesel_generation = self._run_diesel_in_merit_order(diesel_generators,
+                                                                diesel_generation + final_net_demand)
+            final_net_demand = demand_kw - renewable_generation - diesel_generation - total_battery_power
         
         # 8. Grid response: import or export any remaining balance
         total_grid_power = 0.0
         if grid_connections:
-            grid_share = final_net_demand / len(grid_connections)
-            for grid in grid_connections:
+            if economic:
+                grid_shares = _cheapest_grid_split(grid_connections, final_net_demand)
+            else:
+                grid_shares = [final_net_demand / len(grid_connections)] * len(grid_connections)
+            for grid, grid_share in zip(grid_connections, grid_shares):
                 grid.update_output(self.environment, grid_share)
                 total_grid_power += grid.get_power_output()
+        if timer:
+            timer.lap("grid")
 
         # 9. Calculate costs and usage for this step
         total_diesel_usage = sum(gen.get_diesel_usage() for gen in diesel_generators)
+        startup_cost = self.unit_commitment.last_startup_cost if self.diesel_strategy == "unit_commitment" else 0.0
         total_grid_cost = sum(grid.get_cost(timestep_hours) for grid in grid_connections)
 
         # 10. Record results
@@ -231,16 +651,485 @@ class MicrogridManager:
             "Total Battery SOC (kWh)": sum(bat.get_state_of_charge() for bat in batteries),
             "Total Diesel Usage (L/h)": total_diesel_usage,
             "Total Grid Cost ($)": total_grid_cost,
+            "Diesel Startup Cost ($)": startup_cost,
             "Diesel Strategy": self.diesel_strategy,
             "Battery Count": len(batteries),
             "Grid Connection Count": len(grid_connections)
         }
+        self.state_version += 1
+        if timer:
+            timer.lap("results")
+        for listener in self.step_listeners:
+            listener(results, timestep_hours)
+        if timer:
+            timer.lap("step_listeners")
+            timer.done()
+            SIMULATED_STEPS.inc("step")
         return results
 
+    def _dispatch_planner(self, timestep_hours: float):
+        """plan(net_demand, soc_kwh) for the current devices, prices and diesel fleet"""
+        batteries = self.batteries
+        diesel_generators = self.diesel_generators
+        grid_connections = self.grid_connections
+        capacity = sum(bat.capacity_kwh for bat in batteries)
+        max_power = sum(bat.max_power_kw for bat in batteries)
+        efficiency = (sum(bat.one_way_efficiency * bat.capacity_kwh for bat in batteries) / capacity
+                      if capacity > 0 else 1.0)
+        rated = [gen.rated_power for gen in diesel_generators]
+        usage = [gen.diesel_usage_litre_per_kw for gen in diesel_generators]
+        import_price = min(grid.import_price for grid in grid_connections) if grid_connections else None
+        export_price = max(grid.export_price for grid in grid_connections) if grid_connections else None
+
+        def plan(net_demand, soc_kwh):
+            return self.dispatcher.plan(net_demand, soc_kwh, capacity, max_power, efficiency, rated, usage,
+                                        import_price, export_price, timestep_hours)
+        return plan
+
+    def _plan_dispatch(self, demand_kw: float, renewable_kw: float, timestep_hours: float):
+        """Plan from the current step over the dispatcher's horizon of forecast weather and demand"""
+        horizon = self.dispatcher.horizon_steps
+        weather = self.environment.forecast(horizon, timestep_hours)
+        renewable = self.fleet.output_series(weather, store_outputs=False)
+        renewable[0] = renewable_kw
+        if self.demand_forecaster is not None:
+            demand = np.array(self.demand_forecaster(self.environment.current_time, horizon, timestep_hours),
+                              dtype=float)
+        else:
+            demand = np.full(horizon, demand_kw)
+        demand[0] = demand_kw
+
+        soc = sum(bat.get_state_of_charge() for bat in self.batteries)
+        return self._dispatch_planner(timestep_hours)(demand - renewable, soc)
+
+    def run(self, horizon_steps: int, demand_series, timestep_hours: float = 1.0) -> dict:
+        """
+        Simulate horizon_steps consecutive steps, advancing the environment after each one
+        (the same sequence as step() followed by environment.step()).
+
+        Renewable output is evaluated for every timestep and device at once with NumPy and
+        the battery/diesel state is carried through a tight loop. Returns the same keys as
+        step(), each mapped to a column with one entry per step. Device state (outputs,
+        battery SOC) is left as it would be after the last step.
+        """
+        demand = np.asarray(demand_series, dtype=float)
+        if demand.ndim == 0:
+            demand = np.full(horizon_steps, float(demand))
+        if demand.shape != (horizon_steps,):
+            raise ValueError(f"demand_series must have {horizon_steps} entries")
+
+        timer = RUN_PHASE_SECONDS.timer()
+        weather = self.environment.advance(horizon_steps, timestep_hours)
+        if timer:
+            timer.lap("weather")
+        renewable = self.fleet.output_series(weather)
+        if timer:
+            timer.lap("renewables")
+        results = self.dispatch_series(weather["time"], demand, renewable, timestep_hours)
+        if timer:
+            timer.lap("dispatch")
+            timer.done()
+            SIMULATED_STEPS.inc("run", amount=horizon_steps)
+        return results
+
+    def fast_forward(self, horizon_steps: int, demand_series, timestep_hours: float = 1.0) -> dict:
+        """
+        run() with an adaptive dispatch step, for long planning horizons. Weather,
+        renewable and diesel output are evaluated for every row as in run(); what is
+        coarsened is the sequential battery dispatch. While the shortfall left for the
+        batteries keeps its sign and the same batteries sit at their power limit, each
+        battery's flow is linear in the shortfall, so such a run of rows is dispatched as
+        one step using prefix sums, however noisy the weather within it.
+
+        A step ends where the shortfall changes sign or crosses a battery's power limit
+        (e.g. at sunrise and sunset), at the row where a battery becomes empty or full
+        (dispatched on its own), and where the battery_charging 30% threshold is crossed.
+        Every row's flows and SOC are recovered exactly, so results match run() to rounding,
+        with an extra "Step (h)" column giving the length of the step that covered each row.
+        economic_dispatch and unit_commitment, and horizons whose shortfall changes regime
+        too often to gain anything, are dispatched row by row.
+        """
+        demand = np.asarray(demand_series, dtype=float)
+        if demand.ndim == 0:
+            demand = np.full(horizon_steps, float(demand))
+        if demand.shape != (horizon_steps,):
+            raise ValueError(f"demand_series must have {horizon_steps} entries")
+        if self.diesel_strategy not in ADAPTIVE_STRATEGIES or horizon_steps == 0:
+            results = self.run(horizon_steps, demand, timestep_hours)
+            results["Step (h)"] = np.full(horizon_steps, float(timestep_hours))
+            return results
+
+        steps = horizon_steps
+        weather = self.environment.advance(steps, timestep_hours)
+        renewable = self.fleet.output_series(weather)
+        net_demand = demand - renewable
+
+        diesel_generators = self.diesel_generators
+        batteries = self.batteries
+        grid_connections = self.grid_connections
+        rated = np.array([gen.rated_power for gen in diesel_generators], dtype=float)
+        usage_rate = np.array([gen.diesel_usage_litre_per_kw for gen in diesel_generators], dtype=float)
+        capacity = np.array([bat.capacity_kwh for bat in batteries], dtype=float)
+        max_power = np.array([bat.max_power_kw for bat in batteries], dtype=float)
+        efficiency = np.array([bat.one_way_efficiency for bat in batteries], dtype=float)
+        soc = np.array([bat.state_of_charge for bat in batteries], dtype=float)
+        total_capacity = float(capacity.sum())
+        share = capacity / (total_capacity or 1)
+
+        # Generator outputs for every row in each state the strategy can be in;
+        # battery_charging switches between idle (0) and charging (1) on the 30% threshold
+        battery_charging = self.diesel_strategy == "battery_charging" and diesel_generators
+        idle = np.zeros((steps, len(diesel_generators)))
+        if self.diesel_strategy == "demand_following" and diesel_generators:
+            regimes = [_fill_in_order(np.maximum(0.0, net_demand), rated)]
+        elif self.diesel_strategy == "manual" and diesel_generators:
+            setpoints = np.array([self.diesel_setpoints.get(gen.name, 0.0) for gen in diesel_generators])
+            regimes = [idle + np.minimum(rated, setpoints)]
+        elif battery_charging:
+            regimes = [idle, _fill_in_order(np.maximum(0.0, net_demand) + max_power.sum(), rated)]
+        else:
+            regimes = [idle]
+
+        # Battery i is at its power limit when |shortfall| exceeds max_power[i] / share[i];
+        # ranking those limits, the number exceeded tells which batteries are saturated
+        limits = max_power / share
+        rank = np.empty(len(batteries), dtype=np.int64)
+        rank[np.argsort(limits, kind="stable")] = np.arange(len(batteries))
+        sorted_limits = np.sort(limits)
+        series = []
+        for outputs in regimes:
+            generation = outputs.sum(axis=1)
+            shortfall = net_demand - generation
+            magnitude = np.abs(shortfall)
+            sign = np.where(magnitude > FAST_FORWARD_IDLE_KW, np.sign(shortfall), 0).astype(np.int64)
+            level = np.where(sign != 0, np.searchsorted(sorted_limits, magnitude, side="left"), 0)
+            regime_kind = sign + 1 + 3 * level if len(batteries) else np.zeros(steps, dtype=np.int64)
+            run_ends = (np.flatnonzero(regime_kind[1:] != regime_kind[:-1]) + 1).tolist() + [steps]
+            prefix = np.concatenate(([0.0], np.cumsum(shortfall)))
+            series.append((outputs, generation, outputs @ usage_rate, shortfall, sign, level, run_ends, prefix, -prefix))
+        # Shortest mean step worth taking; the shortfall's regime runs bound the mean from above
+        min_rows = FAST_FORWARD_STEP_COST / (FAST_FORWARD_ROW_COST + len(batteries))
+        if steps < min_rows * max(len(entry[6]) for entry in series):
+            # Too little to coarsen: dispatch every row with run()'s path
+            results = self.dispatch_series(weather["time"], demand, renewable, timestep_hours)
+            results["Step (h)"] = np.full(steps, float(timestep_hours))
+            if REGISTRY.enabled:
+                SIMULATED_STEPS.inc("fast_forward", amount=steps)
+            return results
+
+        # Stored energy each battery gains or loses per kW of flow over one row
+        discharge_loss = timestep_hours / efficiency
+        charge_gain = timestep_hours * efficiency
+        empty_below = capacity * BATTERY_LIMIT_TOLERANCE
+        threshold = 0.3 * total_capacity
+        battery_args = (capacity.tolist(), max_power.tolist(), efficiency.tolist(), share.tolist(), timestep_hours)
+        # Which batteries move linearly or at max power, and their rates, by
+        # (sign, saturation level, batteries not yet empty or full)
+        patterns = {}
+        # One entry per step: rows, regime, and each row's battery flow and change in stored
+        # energy as coefficient * shortfall + constant
+        taken = []
+        last_outputs = np.zeros(len(batteries))
+        regime = 0
+        t = 0
+        while t < steps:
+            if len(taken) % FAST_FORWARD_CHECK_STEPS == 0 and t < len(taken) * min_rows:
+                break
+            if battery_charging:
+                regime = int((soc.sum() / total_capacity * 100 if total_capacity > 0 else 0) < 30)
+            _, _, _, shortfall, sign, level, run_ends, prefix, falling = series[regime]
+            end = run_ends[bisect_right(run_ends, t)]
+            s = int(sign[t])
+            if s == 0:
+                taken.append((end - t, regime, 0.0, 0.0, 0.0, 0.0))
+                last_outputs = np.zeros(len(batteries))
+                t = end
+                continue
+
+            headroom = soc if s > 0 else capacity - soc
+            moving = headroom > empty_below
+            key = (s, int(level[t]), moving.tobytes())
+            pattern = patterns.get(key)
+            if pattern is None:
+                per_kw = discharge_loss if s > 0 else charge_gain
+                saturated = moving & (rank < level[t])
+                linear = np.flatnonzero(moving & ~saturated)
+                saturated = np.flatnonzero(saturated)
+                linear_rate = per_kw[linear] * share[linear]
+                saturated_rate = per_kw[saturated] * max_power[saturated]
+                pattern = patterns[key] = (linear, saturated, linear_rate, saturated_rate,
+                                           share[linear].sum(), s * max_power[saturated].sum(),
+                                           linear_rate.sum(), saturated_rate.sum())
+            linear, saturated, linear_rate, saturated_rate, flow_coef, flow_const, linear_total, saturated_total = pattern
+
+            # Rows until the first battery empties or fills: linear batteries move with the
+            # cumulative shortfall, which rises monotonically in `rising`, saturated ones
+            # by their max power every row
+            rising = prefix if s > 0 else falling
+            rows = end - t
+            limit = rows
+            if len(linear):
+                reach = (headroom[linear] / linear_rate).min()
+                limit = min(limit, int(np.searchsorted(rising[t + 1:end + 1], rising[t] + reach, side="right")))
+            if len(saturated):
+                limit = min(limit, int((headroom[saturated] / saturated_rate).min()))
+            take = limit
+            event = limit < rows
+            if battery_charging and (regime == 1) == (s < 0):
+                # Stored energy moves towards the threshold; the row after it is crossed
+                # dispatches with the generators in their other state
+                # (charging: first row reaching it; discharging: first row going below it)
+                gap = threshold - soc.sum() if regime else soc.sum() - threshold
+                side = "left" if regime else "right"
+                if not saturated_total:
+                    crossing = np.searchsorted(rising[t + 1:end + 1], rising[t] + gap / linear_total, side=side)
+                elif not linear_total:
+                    crossing = max(0, math.ceil(gap / saturated_total) - 1 if regime else math.floor(gap / saturated_total))
+                else:
+                    moved = (linear_total * (rising[t + 1:t + limit + 1] - rising[t])
+                             + saturated_total * np.arange(1, limit + 1))
+                    crossing = np.searchsorted(moved, gap, side=side)
+                if crossing < limit:
+                    take, event = crossing + 1, False
+
+            if take:
+                soc[linear] -= linear_rate * (prefix[t + take] - prefix[t])
+                soc[saturated] -= saturated_rate * (s * take)
+                np.clip(soc, 0.0, capacity, out=soc)
+                taken.append((take, regime, flow_coef, flow_const, -linear_total, -s * saturated_total))
+                last_outputs = (linear, share[linear] * shortfall[t + take - 1], saturated, s * max_power[saturated])
+                t += take
+            if event:
+                # A battery empties or fills during this row: dispatch it on its own
+                charges = soc.tolist()
+                outputs = [0.0] * len(batteries)
+                flow = _dispatch_batteries(float(shortfall[t]), charges, *battery_args, outputs)
+                taken.append((1, regime, 0.0, flow, 0.0, sum(charges) - soc.sum()))
+                soc[:] = charges
+                last_outputs = np.array(outputs)
+                t += 1
+        if t < steps:
+            # Steps have been too short to pay off (e.g. battery_charging toggling the
+            # generators every few rows): dispatch the remaining rows one by one
+            charges = soc.tolist()
+            outputs = [0.0] * len(batteries)
+            shortfalls = [entry[3][t:].tolist() for entry in series]
+            for row in range(steps - t):
+                if battery_charging:
+                    regime = int((sum(charges) / total_capacity * 100 if total_capacity > 0 else 0) < 30)
+                stored = sum(charges)
+                flow = _dispatch_batteries(shortfalls[regime][row], charges, *battery_args, outputs)
+                taken.append((1, regime, 0.0, flow, 0.0, sum(charges) - stored))
+            soc[:] = charges
+            last_outputs = np.array(outputs)
+        if isinstance(last_outputs, tuple):
+            linear, linear_outputs, saturated, saturated_outputs = last_outputs
+            last_outputs = np.zeros(len(batteries))
+            last_outputs[linear] = linear_outputs
+            last_outputs[saturated] = saturated_outputs
+
+        rows, step_regime, flow_coef, flow_const, soc_coef, soc_const = (np.array(column) for column in zip(*taken))
+        row_regime = np.repeat(step_regime, rows)
+
+        def per_row(column: int) -> np.ndarray:
+            if len(series) == 1:
+                return series[0][column]
+            return np.where(row_regime == 1, series[1][column], series[0][column])
+
+        shortfall = per_row(3)
+        diesel_generation = per_row(1)
+        diesel_usage = per_row(2)
+        battery_flow = np.repeat(flow_coef, rows) * shortfall + np.repeat(flow_const, rows)
+        stored = sum(bat.state_of_charge for bat in batteries)
+        battery_soc = stored + np.cumsum(np.repeat(soc_coef, rows) * shortfall + np.repeat(soc_const, rows))
+        step_hours = np.repeat(rows * timestep_hours, rows)
+
+        final_net_demand = net_demand - diesel_generation - battery_flow
+        if grid_connections:
+            grid_flow = final_net_demand
+            import_price = np.mean([grid.import_price for grid in grid_connections])
+            export_price = np.mean([grid.export_price for grid in grid_connections])
+            grid_cost = final_net_demand * np.where(final_net_demand > 0, import_price, export_price) * timestep_hours
+        else:
+            grid_flow = np.zeros(steps)
+            grid_cost = np.zeros(steps)
+
+        # Leave devices in the state the last step would have
+        self.state_version += 1
+        for gen, output in zip(diesel_generators, series[int(step_regime[-1])][0][-1].tolist()):
+            gen.power_output = output
+        for bat, output, charge in zip(batteries, last_outputs.tolist(), soc.tolist()):
+            bat.power_output = output
+            bat.state_of_charge = charge
+        for grid in grid_connections:
+            grid.power_output = final_net_demand[-1] / len(grid_connections)
+
+        if REGISTRY.enabled:
+            SIMULATED_STEPS.inc("fast_forward", amount=steps)
+            FAST_FORWARD_DISPATCHES.inc(amount=len(taken))
+        return {
+            "Time": np.char.replace(np.datetime_as_string(weather["time"], unit="m"), "T", " ").tolist(),
+            "Demand (kW)": demand,
+            "Renewable Generation (kW)": renewable,
+            "Diesel Generation (kW)": diesel_generation,
+            "Battery Flow (kW)": battery_flow,
+            "Grid Flow (kW)": grid_flow,
+            "Total Battery SOC (kWh)": battery_soc,
+            "Total Diesel Usage (L/h)": diesel_usage,
+            "Total Grid Cost ($)": grid_cost,
+            "Diesel Startup Cost ($)": np.zeros(steps),
+            "Diesel Strategy": [self.diesel_strategy] * steps,
+            "Battery Count": [len(batteries)] * steps,
+            "Grid Connection Count": [len(grid_connections)] * steps,
+            "Step (h)": step_hours,
+        }
+
+    def dispatch_series(self, times: np.ndarray, demand: np.ndarray, renewable: np.ndarray,
+                        timestep_hours: float) -> dict:
+        """
+        Sequential diesel/battery/grid dispatch over precomputed demand and renewable
+        generation, returning result columns like run(). Does not touch the environment, so
+        callers can reuse one weather trajectory across many device configurations.
+        The "economic_dispatch" strategy plans using the series themselves as its forecast
+        and follows each plan for up to DISPATCH_REPLAN_STEPS steps, re-planning sooner
+        when the batteries end a step away from the planned charge.
+        """
+        steps = len(demand)
+        diesel_generators = self.diesel_generators
+        batteries = self.batteries
+        grid_connections = self.grid_connections
+
+        rated = np.array([gen.rated_power for gen in diesel_generators], dtype=float)
+        usage_rate = np.array([gen.diesel_usage_litre_per_kw for gen in diesel_generators], dtype=float)
+
+        # Battery state is carried as plain floats: with a handful of batteries this is far
+        # cheaper per step than small-array NumPy calls
+        capacity = [bat.capacity_kwh for bat in batteries]
+        max_power = [bat.max_power_kw for bat in batteries]
+        efficiency = [bat.one_way_efficiency for bat in batteries]
+        soc = [bat.state_of_charge for bat in batteries]
+        total_capacity = sum(capacity)
+        share = [c / (total_capacity or 1) for c in capacity]
+        charge_power = sum(max_power)
+
+        net_demand = demand - renewable
+        diesel_generation = np.zeros(steps)
+        diesel_usage = np.zeros(steps)
+        battery_flow = np.zeros(steps)
+        battery_soc = np.zeros(steps)
+        gen_output = np.zeros(len(diesel_generators))
+        bat_output = [0.0] * len(batteries)
+
+        # Strategies that do not depend on battery state are dispatched up front
+        if self.diesel_strategy == "demand_following" and diesel_generators:
+            outputs = _fill_in_order(np.maximum(0.0, net_demand), rated)
+            diesel_generation = outputs.sum(axis=1)
+            diesel_usage = outputs @ usage_rate
+            gen_output = outputs[-1]
+        elif self.diesel_strategy == "manual" and diesel_generators:
+            setpoints = np.array([self.diesel_setpoints.get(gen.name, 0.0) for gen in diesel_generators])
+            gen_output = np.minimum(rated, setpoints)
+            diesel_generation[:] = gen_output.sum()
+            diesel_usage[:] = gen_output @ usage_rate
+
+        battery_charging = self.diesel_strategy == "battery_charging" and diesel_generators
+        economic = self.diesel_strategy == "economic_dispatch"
+        unit_commitment = self.diesel_strategy == "unit_commitment" and diesel_generators
+        startup_cost = np.zeros(steps)
+        if economic:
+            plan_dispatch = self._dispatch_planner(timestep_hours)
+            horizon = self.dispatcher.horizon_steps
+            soc_tolerance = DISPATCH_REPLAN_SOC_TOLERANCE * total_capacity
+            plan, row = None, 0
+        rated_list = rated.tolist()
+        usage_list = usage_rate.tolist()
+        net_list = net_demand.tolist()
+        diesel_list = diesel_generation.tolist()
+        for t in range(steps):
+            if battery_charging:
+                diesel_list[t], diesel_usage[t] = _battery_charging_diesel(
+                    net_list[t], sum(soc), total_capacity, charge_power, rated_list, usage_list, gen_output)
+
+            if unit_commitment:
+                diesel_list[t], diesel_usage[t], startup_cost[t] = self.unit_commitment.dispatch(
+                    net_list[t], timestep_hours)
+            if economic:
+                row += 1
+                if plan is None or row >= min(DISPATCH_REPLAN_STEPS, len(plan.battery_kw)):
+                    # Extended so every step of the plan that is followed sees a full horizon
+                    plan, row = plan_dispatch(net_demand[t:t + horizon + DISPATCH_REPLAN_STEPS - 1], sum(soc)), 0
+                if diesel_generators:
+                    gen_output = diesel_setpoints(plan.diesel_kw[row], rated, usage_rate)
+                    diesel_list[t] = float(gen_output.sum())
+                    diesel_usage[t] = gen_output @ usage_rate
+                shortfall = float(plan.battery_kw[row])
+            else:
+                shortfall = net_list[t] - diesel_list[t]
+            flow = _dispatch_batteries(shortfall, soc, capacity, max_power, efficiency, share,
+                                       timestep_hours, bat_output)
+            battery_flow[t] = flow
+            battery_soc[t] = sum(soc)
+            if economic and abs(battery_soc[t] - plan.soc_kwh[row]) > soc_tolerance:
+                plan = None  # The batteries could not follow the plan
+            if economic and not grid_connections and diesel_generators and net_list[t] - diesel_list[t] - flow > 0:
+                gen_output = diesel_setpoints(net_list[t] - flow, rated, usage_rate)
+                diesel_list[t] = float(gen_output.sum())
+                diesel_usage[t] = gen_output @ usage_rate
+        diesel_generation = np.array(diesel_list)
+        if unit_commitment:
+            # Unit commitment already left each generator at its last output
+            gen_output = np.array([gen.power_output for gen in diesel_generators])
+
+        final_net_demand = net_demand - diesel_generation - battery_flow
+        if grid_connections:
+            grid_flow = final_net_demand
+            if economic:
+                # All flow goes through the best-priced connection
+                import_price = min(grid.import_price for grid in grid_connections)
+                export_price = max(grid.export_price for grid in grid_connections)
+            else:
+                import_price = np.mean([grid.import_price for grid in grid_connections])
+                export_price = np.mean([grid.export_price for grid in grid_connections])
+            grid_cost = final_net_demand * np.where(final_net_demand > 0, import_price, export_price) * timestep_hours
+        else:
+            grid_flow = np.zeros(steps)
+            grid_cost = np.zeros(steps)
+
+        # Leave devices in the state the last step would have
+        if steps:
+            self.state_version += 1
+            for gen, output in zip(diesel_generators, gen_output.tolist()):
+                gen.power_output = output
+            for bat, output, charge in zip(batteries, bat_output, soc):
+                bat.power_output = output
+                bat.state_of_charge = charge
+            if economic and grid_connections:
+                grid_shares = _cheapest_grid_split(grid_connections, float(final_net_demand[-1]))
+            else:
+                grid_shares = [final_net_demand[-1] / (len(grid_connections) or 1)] * len(grid_connections)
+            for grid, grid_share in zip(grid_connections, grid_shares):
+                grid.power_output = grid_share
+
+        return {
+            "Time": np.char.replace(np.datetime_as_string(times, unit="m"), "T", " ").tolist(),
+            "Demand (kW)": demand,
+            "Renewable Generation (kW)": renewable,
+            "Diesel Generation (kW)": diesel_generation,
+            "Battery Flow (kW)": battery_flow,
+            "Grid Flow (kW)": grid_flow,
+            "Total Battery SOC (kWh)": battery_soc,
+            "Total Diesel Usage (L/h)": diesel_usage,
+            "Total Grid Cost ($)": grid_cost,
+            "Diesel Startup Cost ($)": startup_cost,
+            "Diesel Strategy": [self.diesel_strategy] * steps,
+            "Battery Count": [len(batteries)] * steps,
+            "Grid Connection Count": [len(grid_connections)] * steps
+        }
+
     def _control_diesel_generators(self, diesel_generators, net_demand, timestep_hours):
         """Control diesel generators based on selected strategy"""
         diesel_generation = 0.0
-        batteries = [d for d in self.devices if isinstance(d, Battery)]
+        batteries = self.batteries
 
         if self.diesel_strategy == "demand_following":
             remaining_demand = max(0, net_demand)
@@ -287,29 +1176,59 @@ class MicrogridManager:
                 diesel_gen.update_output(self.environment, setpoint)
                 diesel_generation += diesel_gen.get_power_output()
 
+        elif self.diesel_strategy == "economic_dispatch":
+            diesel_generation = self._run_diesel_in_merit_order(diesel_generators, self.dispatch_plan.diesel_kw[0])
+
+        elif self.diesel_strategy == "unit_commitment":
+            diesel_generation, _, _ = self.unit_commitment.dispatch(net_demand, timestep_hours)
+
         return diesel_generation
 
+    def _run_diesel_in_merit_order(self, diesel_generators, total_kw: float) -> float:
+        """Load the most fuel-efficient generators first until total_kw is covered"""
+        setpoints = diesel_setpoints(total_kw, [gen.rated_power for gen in diesel_generators],
+                                     [gen.diesel_usage_litre_per_kw for gen in diesel_generators])
+        diesel_generation = 0.0
+        for diesel_gen, setpoint in zip(diesel_generators, setpoints.tolist()):
+            diesel_gen.update_output(self.environment, setpoint)
+            diesel_generation += diesel_gen.get_power_output()
+        return diesel_generation
+
+
+def _cheapest_grid_split(grid_connections: list, net_demand: float) -> list:
+    """Route all imports through the cheapest connection and all exports through the best paid"""
+    if net_demand > 0:
+        best = min(range(len(grid_connections)), key=lambda i: grid_connections[i].import_price)
+    else:
+        best = max(range(len(grid_connections)), key=lambda i: grid_connections[i].export_price)
+    return [net_demand if i == best else 0.0 for i in range(len(grid_connections))]
 
-def get_realistic_demand(current_time: datetime, total_daily_kwh: float) -> float:
+
+# Base profile for an industrial site: high, constant load with minor dips
+# during shift changes or maintenance periods.
+INDUSTRIAL_DEMAND_PROFILE = np.array([
+    0.9, 0.85, 0.85, 0.85, 0.9, 0.95, 1.0, 1.0, 1.0, 1.0, 0.95, 0.9, # 00:00 - 11:59
+    0.9, 0.95, 1.0, 1.0, 1.0, 0.95, 0.9, 0.85, 0.85, 0.85, 0.9, 0.95 # 12:00 - 23:59
+])
+
+# Shared stream for callers of get_realistic_demand that do not pass their own
+_default_demand_rng = np.random.default_rng()
+
+def get_realistic_demand(current_time: datetime, total_daily_kwh: float, rng: np.random.Generator = None) -> float:
     """
     Generates a plausible industrial demand profile for a 24/7 operation.
-    The profile is scaled to match the total_daily_kwh.
+    The profile is scaled to match the total_daily_kwh. Noise is drawn from rng, so pass
+    a seeded generator (or use DemandGenerator) for reproducible runs.
     """
+    rng = rng or _default_demand_rng
     hour = current_time.hour + current_time.minute / 60
 
-    # Base profile for an industrial site: high, constant load with minor dips
-    # during shift changes or maintenance periods.
-    base_profile = [
-        0.9, 0.85, 0.85, 0.85, 0.9, 0.95, 1.0, 1.0, 1.0, 1.0, 0.95, 0.9, # 00:00 - 11:59
-        0.9, 0.95, 1.0, 1.0, 1.0, 0.95, 0.9, 0.85, 0.85, 0.85, 0.9, 0.95 # 12:00 - 23:59
-    ]
-
     # Interpolate between hours
     hour_floor = int(hour)
     hour_ceil = (hour_floor + 1) % 24
     fraction = hour - hour_floor
     
-    base_demand = base_profile[hour_floor] * (1 - fraction) + base_profile[hour_ceil] * fraction
+    base_demand = INDUSTRIAL_DEMAND_PROFILE[hour_floor] * (1 - fraction) + INDUSTRIAL_DEMAND_PROFILE[hour_ceil] * fraction
 
     # The average power (kW) required to meet the daily energy target (kWh)
     average_power = total_daily_kwh / 24.0
@@ -318,7 +1237,40 @@ def get_realistic_demand(current_time: datetime, total_daily_kwh: float) -> floa
     demand = base_demand * average_power
     
     # Add minor random noise
-    noise = random.uniform(-0.05, 0.05) * demand
+    noise = rng.uniform(-0.05, 0.05) * demand
     final_demand = demand + noise
     
-    return max(average_power * 0.7, final_demand) # Ensure a minimum load
\ No newline at end of file
+    return float(max(average_power * 0.7, final_demand)) # Ensure a minimum load
+
+def expected_demand(start: datetime, steps: int, timestep_hours: float = 1.0,
+                    total_daily_kwh: float = 50000.0) -> np.ndarray:
+    """The noise-free profile get_realistic_demand draws around, e.g. as a demand forecast"""
+    step = np.timedelta64(timedelta(hours=timestep_hours), "us")
+    times = np.datetime64(start, "us") + np.arange(steps) * step
+    minutes = (times - times.astype("datetime64[D]")) // np.timedelta64(1, "m")
+    hour = minutes // 60 + (minutes % 60) / 60
+
+    hour_floor = hour.astype(int)
+    fraction = hour - hour_floor
+    base_demand = (INDUSTRIAL_DEMAND_PROFILE[hour_floor] * (1 - fraction) +
+                   INDUSTRIAL_DEMAND_PROFILE[(hour_floor + 1) % 24] * fraction)
+    return base_demand * (total_daily_kwh / 24.0)
+
+class DemandGenerator:
+    """
+    The get_realistic_demand profile with its own random stream, so concurrent
+    simulations do not disturb each other and a seeded run can be replayed exactly.
+    """
+    def __init__(self, total_daily_kwh: float = 50000.0, seed=None):
+        self.total_daily_kwh = total_daily_kwh
+        self.rng = np.random.default_rng(seed)
+
+    def demand(self, current_time: datetime) -> float:
+        return get_realistic_demand(current_time, self.total_daily_kwh, self.rng)
+
+    def series(self, start: datetime, steps: int, timestep_hours: float = 1.0) -> np.ndarray:
+        """Demand (kW) for `steps` timesteps from `start`, drawn in one vectorized pass"""
+        average_power = self.total_daily_kwh / 24.0
+        demand = expected_demand(start, steps, timestep_hours, self.total_daily_kwh)
+        final_demand = demand + self.rng.uniform(-0.05, 0.05, steps) * demand
+        return np.maximum(average_power * 0.7, final_demand)
@@ -0,0 +1,136 @@
+"""
+profiler.py
+
+Sampling profiler for a live server. A background thread snapshots the Python stack of
+every other thread at a fixed interval for a bounded time; nothing is patched or traced,
+so the event loop and the simulation keep running at full speed apart from the sampler's
+own share of the GIL. Samples are reported as collapsed stacks (one "frame;frame;frame
+count" line per distinct stack, the input format of flamegraph.pl and speedscope) or as a
+pstats file for pstats/snakeviz, with times estimated from sample counts.
+"""
+from collections import Counter
+import marshal
+import os
+import sys
+import threading
+import time
+
+PROFILE_MAX_SECONDS = 120.0
+PROFILE_MIN_INTERVAL_SECONDS = 0.001
+
+# scope: files and functions that put a sample in scope when they appear anywhere on its stack
+PROFILE_SCOPES = {
+    "all": None,
+    "simulation": {("power_simulation.py", "step"), ("power_simulation.py", "run"),
+                   ("power_simulation.py", "fast_forward"), ("power_simulation.py", "dispatch_series")},
+    "requests": {("unified_api.py", None)},
+}
+PROFILE_FORMATS = ("collapsed", "pstats")
+
+
+def _in_scope(codes: list, markers) -> bool:
+    if markers is None:
+        return True
+    for code in codes:
+        filename = os.path.basename(code.co_filename)
+        if (filename, code.co_name) in markers or (filename, None) in markers:
+            return True
+    return False
+
+
+class SamplingProfiler:
+    """
+    Samples other threads' stacks every interval_seconds for `seconds`. Only samples whose
+    stack includes a frame matching `scope` (see PROFILE_SCOPES) are kept.
+    """
+    def __init__(self, seconds: float, interval_seconds: float = 0.005, scope: str = "all"):
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            raise ValueError(f"seconds must be 0-{PROFILE_MAX_SECONDS:g}")
+        if interval_seconds < PROFILE_MIN_INTERVAL_SECONDS:
+            raise ValueError(f"interval must be at least {PROFILE_MIN_INTERVAL_SECONDS * 1000:g} ms")
+        if scope not in PROFILE_SCOPES:
+            raise ValueError(f"Unknown scope '{scope}'. Use one of {list(PROFILE_SCOPES)}")
+        self.seconds = seconds
+        self.interval_seconds = interval_seconds
+        self.scope = scope
+        # Stacks as tuples of code objects, root first
+        self.stacks = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.elapsed_seconds = 0.0
+
+    def run(self) -> "SamplingProfiler":
+        """Sample until `seconds` have passed; call from a thread that may block"""
+        markers = PROFILE_SCOPES[self.scope]
+        own_thread = threading.get_ident()
+        start = time.perf_counter()
+        deadline = start + self.seconds
+        next_tick = start
+        while True:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                if _in_scope(codes, markers):
+                    self.stacks[tuple(codes)] += 1
+                    self.samples += 1
+            del frame
+            self.ticks += 1
+            next_tick += self.interval_seconds
+            now = time.perf_counter()
+            if next_tick >= deadline:
+                break
+            if next_tick > now:
+                time.sleep(next_tick - now)
+            else:
+                next_tick = now  # Fell behind; skip missed ticks instead of bursting
+        self.elapsed_seconds = time.perf_counter() - start
+        return self
+
+    @staticmethod
+    def _label(code) -> str:
+        name = getattr(code, "co_qualname", code.co_name)
+        return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def collapsed(self) -> str:
+        """One "root;...;leaf count" line per distinct stack, most frequent first"""
+        lines = [";".join(self._label(code) for code in stack) + f" {count}"
+                 for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def pstats_dump(self) -> bytes:
+        """
+        The samples as a marshalled pstats table, loadable with pstats.Stats(path).
+        Call counts are sample counts; times are sample counts times the interval.
+        """
+        stats = {}
+        callers = {}
+        for stack, count in self.stacks.items():
+            seconds = count * self.interval_seconds
+            keys = [(code.co_filename, code.co_firstlineno, code.co_name) for code in stack]
+            for key in set(keys):
+                entry = stats.setdefault(key, [0, 0, 0.0, 0.0])
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            stats[keys[-1]][2] += seconds
+            for caller, callee in zip(keys, keys[1:]):
+                edges = callers.setdefault(callee, {})
+                edges[caller] = edges.get(caller, 0) + count
+        return marshal.dumps({key: (cc, nc, tt, ct, callers.get(key, {}))
+                              for key, (cc, nc, tt, ct) in stats.items()})
+
+    def to_dict(self) -> dict:
+        return {
+            "scope": self.scope,
+            "seconds": self.seconds,
+            "interval_seconds": self.interval_seconds,
+            "elapsed_seconds": self.elapsed_seconds,
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+        }
@@ -0,0 +1,284 @@
+"""
+replay.py
+
+Replay mode: drive a microgrid with measured weather and metered demand instead of the
+synthetic Perth profiles. Recordings are CSV or Parquet files with a timestamp column
+and one column per quantity, at any resolution. They are read forward in chunks, only
+the rows around the times being simulated are held in memory, and values are linearly
+interpolated to the simulation timestep, so multi-year minute-resolution logs run in
+constant memory.
+
+    weather = RecordedSeries("site_weather.parquet", {"solar_radiation": "ghi_w_m2", "temperature": "temp_c"})
+    environment = ReplayEnvironment(weather)
+    demand = ReplayDemand(RecordedSeries("meter.csv", {"demand_kw": "kw"}))
+    microgrid = MicrogridManager(environment, devices)
+    for results in replay(microgrid, demand, steps=525600, timestep_hours=1 / 60):
+        ...
+
+Weather quantities missing from the recording are synthesized as usual. Timestamps are
+read as naive local times and must increase; blank cells are treated as gaps.
+"""
+from collections import deque
+from datetime import datetime, timedelta
+import csv
+import io
+import os
+import numpy as np
+
+from environment_simulation import Environment, WEATHER_KEYS
+
+# Rows read from a recording at a time
+RECORDED_CHUNK_ROWS = 65536
+# Interpolated on the circle so 350° and 10° average to 0°, not 180°
+CIRCULAR_KEYS = ("wind_direction",)
+
+
+def _to_float(values) -> np.ndarray:
+    return np.array([value if value not in ("", None) else "nan" for value in values], dtype=float)
+
+
+class RecordedSeries:
+    """
+    Columns of a CSV or Parquet recording, sampled at arbitrary times.
+
+    columns: {name used by the simulation: column name in the file}. Parquet files are
+    memory-mapped and read by row batch; CSV files are read line by line from a byte
+    offset. Pickling keeps the read position, not the buffered rows, so the series can be
+    shipped to worker processes.
+    """
+    def __init__(self, path: str, columns: dict, time_column: str = "time", chunk_rows: int = RECORDED_CHUNK_ROWS):
+        if not columns:
+            raise ValueError("columns must name at least one column to read")
+        if chunk_rows < 2:
+            raise ValueError("chunk_rows must be at least 2")
+        self.path = path
+        self.columns = dict(columns)
+        self.time_column = time_column
+        self.chunk_rows = chunk_rows
+        self.format = "parquet" if os.path.splitext(path)[1].lower() in (".parquet", ".pq") else "csv"
+        self._resume_offset = None
+        self._reset()
+        # Read the first chunk now so bad paths and column names fail early
+        self.start_time = np.datetime64(int(self._buffer[0][1][0]), "us").item() if self._read_chunk() else None
+        if self.start_time is None:
+            raise ValueError(f"{path} has no rows")
+
+    def _reset(self, offset=None):
+        self._reader = None
+        self._buffer = deque()  # (offset, times as int64 microseconds, {name: values})
+        self._resume_offset = offset
+        self._exhausted = False
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["_resume_offset"] = self._buffer[0][0] if self._buffer else self._resume_offset
+        del state["_reader"], state["_buffer"], state["_exhausted"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._reset(state["_resume_offset"])
+
+    # === Chunked readers: generators of (offset, times, {name: values}) ===
+    def _csv_chunks(self, offset):
+        with open(self.path, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8-sig")]))
+            try:
+                indices = [header.index(self.time_column)] + [header.index(c) for c in self.columns.values()]
+            except ValueError:
+                missing = [c for c in (self.time_column, *self.columns.values()) if c not in header]
+                raise ValueError(f"{self.path}: missing columns {missing}")
+            if offset is not None:
+                f.seek(offset)
+            while True:
+                offset = f.tell()
+                lines = [line for line in (f.readline() for _ in range(self.chunk_rows)) if line.strip()]
+                if not lines:
+                    return
+                rows = [[row[i] for i in indices] for row in csv.reader(io.StringIO(b"".join(lines).decode("utf-8")))]
+                fields = list(zip(*rows))
+                times = np.array(fields[0], dtype="datetime64[us]")
+                yield offset, times, {name: _to_float(values) for name, values in zip(self.columns, fields[1:])}
+
+    def _parquet_chunks(self, offset):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Replaying Parquet recordings requires pyarrow (pip install pyarrow)")
+        file = pq.ParquetFile(self.path, memory_map=True)
+        names = [self.time_column, *self.columns.values()]
+        missing = [c for c in names if c not in file.schema_arrow.names]
+        if missing:
+            raise ValueError(f"{self.path}: missing columns {missing}")
+        # Resume at the row group holding row `offset` without decoding the ones before it
+        row, first_group = 0, 0
+        for group in range(file.num_row_groups):
+            group_rows = file.metadata.row_group(group).num_rows
+            if row + group_rows > (offset or 0):
+                break
+            row += group_rows
+            first_group = group + 1
+        skip = (offset or 0) - row
+        row += skip
+        groups = list(range(first_group, file.num_row_groups))
+        for batch in file.iter_batches(batch_size=self.chunk_rows, row_groups=groups, columns=names) if groups else ():
+            if skip >= batch.num_rows:
+                skip -= batch.num_rows
+                continue
+            batch = batch.slice(skip)
+            skip = 0
+            times = batch.column(0).to_numpy(zero_copy_only=False).astype("datetime64[us]")
+            values = {name: batch.column(i + 1).to_numpy(zero_copy_only=False).astype(float)
+                      for i, name in enumerate(self.columns)}
+            yield row, times, values
+            row += batch.num_rows
+
+    def _read_chunk(self) -> bool:
+        """Append the next chunk to the buffer; False at the end of the file"""
+        if self._exhausted:
+            return False
+        if self._reader is None:
+            chunks = self._parquet_chunks if self.format == "parquet" else self._csv_chunks
+            self._reader = chunks(self._resume_offset)
+        chunk = next(self._reader, None)
+        if chunk is None:
+            self._exhausted = True
+            return False
+        offset, times, values = chunk
+        times = times.astype(np.int64)
+        last = self._buffer[-1][1][-1] if self._buffer else None
+        if np.any(np.diff(times) <= 0) or (last is not None and times[0] <= last):
+            raise ValueError(f"{self.path}: timestamps must be strictly increasing")
+        self._buffer.append((offset, times, values))
+        return True
+
+    @property
+    def end_time(self):
+        """The last recorded timestamp (datetime64) once the file has been read to its end, else None"""
+        return np.datetime64(int(self._buffer[-1][1][-1]), "us") if self._exhausted and self._buffer else None
+
+    def covers(self, time) -> bool:
+        """Whether `time` is at or before the last recorded timestamp, reading ahead as needed"""
+        target = np.datetime64(time, "us").astype(np.int64)
+        while (not self._buffer or self._buffer[-1][1][-1] < target) and self._read_chunk():
+            pass
+        return bool(self._buffer) and target <= self._buffer[-1][1][-1]
+
+    def sample(self, times, hold_end: bool = False) -> dict:
+        """
+        Values interpolated at `times` (increasing datetime64), as {name: float array}.
+        Raises ValueError for times outside the recording; with hold_end, times past its
+        end get the last recorded values instead.
+        """
+        targets = np.asarray(times, dtype="datetime64[us]").astype(np.int64)
+        if self._buffer and targets[0] < self._buffer[0][1][0]:
+            self._reset()  # Rewind: read again from the start of the file
+        while (not self._buffer or self._buffer[-1][1][-1] < targets[-1]) and self._read_chunk():
+            pass
+        # Drop chunks that end before the earliest time still needed
+        while len(self._buffer) > 1 and self._buffer[1][1][0] <= targets[0]:
+            self._buffer.popleft()
+
+        recorded = np.concatenate([chunk[1] for chunk in self._buffer])
+        if targets[0] < recorded[0]:
+            raise ValueError(f"{self.path} starts at {np.datetime64(int(recorded[0]), 'us')}; "
+                             f"cannot replay {np.datetime64(int(targets[0]), 'us')}")
+        if targets[-1] > recorded[-1] and not hold_end:
+            raise ValueError(f"{self.path} ends at {np.datetime64(int(recorded[-1]), 'us')}; "
+                             f"cannot replay {np.datetime64(int(targets[-1]), 'us')}")
+        samples = {}
+        for name in self.columns:
+            values = np.concatenate([chunk[2][name] for chunk in self._buffer])
+            valid = np.isfinite(values)
+            if not valid.any():
+                raise ValueError(f"{self.path}: no values for {self.columns[name]} around the requested times")
+            x, y = recorded[valid], values[valid]
+            if name in CIRCULAR_KEYS:
+                radians = np.deg2rad(y)
+                angle = np.arctan2(np.interp(targets, x, np.sin(radians)), np.interp(targets, x, np.cos(radians)))
+                samples[name] = np.rad2deg(angle) % 360
+            else:
+                samples[name] = np.interp(targets, x, y)
+        return samples
+
+
+class ReplayEnvironment(Environment):
+    """
+    Environment whose weather comes from a RecordedSeries keyed by WEATHER_KEYS.
+
+    The buffered lookahead (and forecast()) may run past the end of the recording; those
+    rows hold the last recorded values. Only simulating such a row - stepping into it, or
+    having advance() return it - raises ValueError. The row advance() stops on is not
+    simulated, so a recording can be replayed up to and including its last timestamp.
+    """
+    def __init__(self, weather: RecordedSeries, seed=None, start_time: datetime = None):
+        unknown = set(weather.columns) - set(WEATHER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown weather columns {sorted(unknown)}. Use {list(WEATHER_KEYS)}")
+        self.weather = weather
+        super().__init__(seed, start_time or weather.start_time)
+
+    def _check_recorded(self, time):
+        if not self.weather.covers(time):
+            raise ValueError(f"{self.weather.path} ends at {self.weather.end_time}; "
+                             f"cannot replay {np.datetime64(time, 'us')}")
+
+    def step(self, timestep_hours):
+        self._check_recorded(self.current_time + timedelta(hours=timestep_hours))
+        super().step(timestep_hours)
+
+    def advance(self, steps: int, timestep_hours: float) -> dict:
+        if steps:
+            self._check_recorded(self.current_time + (steps - 1) * timedelta(hours=timestep_hours))
+        return super().advance(steps, timestep_hours)
+
+    def generate_trajectory(self, start: datetime, steps: int, timestep_hours: float, seed=None) -> dict:
+        if set(WEATHER_KEYS) <= set(self.weather.columns):
+            step = np.timedelta64(timedelta(hours=timestep_hours), "us")
+            trajectory = {"time": np.datetime64(start, "us") + np.arange(steps) * step}
+        else:
+            trajectory = Environment.generate_trajectory(start, steps, timestep_hours, seed)
+        trajectory.update(self.weather.sample(trajectory["time"], hold_end=True))
+        return trajectory
+
+
+class ReplayDemand:
+    """
+    Metered demand (kW) from a RecordedSeries with a "demand_kw" column. Has the
+    DemandGenerator interface, and as a demand_forecaster gives economic dispatch a
+    perfect forecast of the recording (holding its last value past the end, so the
+    final hours can still be planned).
+    """
+    def __init__(self, recording: RecordedSeries):
+        if "demand_kw" not in recording.columns:
+            raise ValueError("The demand recording needs a 'demand_kw' column")
+        self.recording = recording
+
+    def demand(self, current_time: datetime) -> float:
+        return float(self.series(current_time, 1)[0])
+
+    def series(self, start: datetime, steps: int, timestep_hours: float = 1.0, hold_end: bool = False) -> np.ndarray:
+        step = np.timedelta64(timedelta(hours=timestep_hours), "us")
+        times = np.datetime64(start, "us") + np.arange(steps) * step
+        return np.maximum(self.recording.sample(times, hold_end)["demand_kw"], 0.0)
+
+    def __call__(self, start: datetime, steps: int, timestep_hours: float) -> np.ndarray:
+        return self.series(start, steps, timestep_hours, hold_end=True)
+
+
+def replay(microgrid, demand, steps: int, timestep_hours: float = 1.0, chunk_steps: int = 1440):
+    """
+    Run `steps` timesteps of microgrid (whose environment is usually a ReplayEnvironment)
+    against `demand` (anything with DemandGenerator.series), yielding the result columns
+    of MicrogridManager.run for every chunk_steps steps.
+    """
+    if chunk_steps < 1:
+        raise ValueError("chunk_steps must be at least 1")
+    if isinstance(demand, ReplayDemand):
+        microgrid.demand_forecaster = demand
+    done = 0
+    while done < steps:
+        count = min(chunk_steps, steps - done)
+        demand_series = demand.series(microgrid.environment.current_time, count, timestep_hours)
+        yield microgrid.run(count, demand_series, timestep_hours)
+        done += count
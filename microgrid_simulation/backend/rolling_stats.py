@@ -0,0 +1,150 @@
+"""
+rolling_stats.py
+
+Rolling-window aggregates over simulation steps. Each window keeps running sums and
+monotonic min/max queues, so recording a step and reading a window's statistics both
+take constant (amortized) time however much history has been simulated.
+"""
+from collections import deque
+from datetime import datetime, timedelta
+
+# Default windows, in hours
+ROLLING_WINDOWS = {"1h": 1, "24h": 24, "7d": 24 * 7, "30d": 24 * 30}
+
+# Result keys tracked, their short names and how they accumulate over time:
+# "rate" values (kW, L/h) are integrated over the timestep, "amount" values are already
+# per-step totals and are summed as-is, "level" values (stored energy) have no total.
+ROLLING_METRICS = {
+    "Demand (kW)": ("demand_kw", "rate"),
+    "Renewable Generation (kW)": ("renewable_kw", "rate"),
+    "Diesel Generation (kW)": ("diesel_kw", "rate"),
+    "Battery Flow (kW)": ("battery_kw", "rate"),
+    "Grid Flow (kW)": ("grid_kw", "rate"),
+    "Total Battery SOC (kWh)": ("battery_soc_kwh", "level"),
+    "Total Diesel Usage (L/h)": ("diesel_usage_lph", "rate"),
+    "Total Grid Cost ($)": ("grid_cost", "amount"),
+}
+
+
+class _Extremum:
+    """Monotonic queue giving the min (or max) of a sliding window in amortized O(1)"""
+    def __init__(self, is_max: bool):
+        self.is_max = is_max
+        self._queue = deque()  # (sequence number, value), values monotonic from the left
+
+    def push(self, seq: int, value: float):
+        queue = self._queue
+        if self.is_max:
+            while queue and queue[-1][1] <= value:
+                queue.pop()
+        else:
+            while queue and queue[-1][1] >= value:
+                queue.pop()
+        queue.append((seq, value))
+
+    def evict(self, seq: int):
+        if self._queue and self._queue[0][0] == seq:
+            self._queue.popleft()
+
+    @property
+    def value(self):
+        return self._queue[0][1] if self._queue else None
+
+
+class RollingWindow:
+    """Aggregates for the steps that started within `hours` of the end of the latest step"""
+    def __init__(self, hours: float):
+        self.span = timedelta(hours=hours)
+        self.hours = hours
+        self.clear()
+
+    def clear(self):
+        self._steps = deque()  # (sequence number, start time, timestep_hours, values)
+        self._duration = 0.0
+        self._weighted = {name: 0.0 for name, _ in ROLLING_METRICS.values()}
+        self._amounts = {name: 0.0 for name, kind in ROLLING_METRICS.values() if kind == "amount"}
+        self._min = {name: _Extremum(False) for name, _ in ROLLING_METRICS.values()}
+        self._max = {name: _Extremum(True) for name, _ in ROLLING_METRICS.values()}
+
+    def add(self, seq: int, start: datetime, timestep_hours: float, values: dict):
+        self._steps.append((seq, start, timestep_hours, values))
+        self._duration += timestep_hours
+        for name, value in values.items():
+            self._weighted[name] += value * timestep_hours
+            if name in self._amounts:
+                self._amounts[name] += value
+            self._min[name].push(seq, value)
+            self._max[name].push(seq, value)
+
+    def evict_before(self, cutoff: datetime):
+        """Drop steps that started before cutoff"""
+        while self._steps and self._steps[0][1] < cutoff:
+            seq, _, timestep_hours, values = self._steps.popleft()
+            self._duration -= timestep_hours
+            for name, value in values.items():
+                self._weighted[name] -= value * timestep_hours
+                if name in self._amounts:
+                    self._amounts[name] -= value
+                self._min[name].evict(seq)
+                self._max[name].evict(seq)
+        if not self._steps:
+            # Reset the running sums so float residue does not accumulate
+            self.clear()
+
+    def to_dict(self) -> dict:
+        metrics = {}
+        for name, kind in ROLLING_METRICS.values():
+            weighted = self._weighted[name]
+            entry = {
+                "mean": weighted / self._duration if self._duration > 0 else 0.0,
+                "min": self._min[name].value,
+                "max": self._max[name].value,
+            }
+            if kind == "rate":
+                entry["total"] = weighted
+            elif kind == "amount":
+                entry["total"] = self._amounts[name]
+            metrics[name] = entry
+        return {
+            "window_hours": self.hours,
+            "covered_hours": self._duration,
+            "steps": len(self._steps),
+            "metrics": metrics,
+        }
+
+
+class RollingStats:
+    """
+    One RollingWindow per entry in `windows` ({label: hours}), all fed from the same
+    stream of steps. Means are weighted by timestep_hours; totals of kW values are kWh
+    and totals of L/h values are litres.
+    """
+    def __init__(self, windows: dict = None):
+        self.windows = {label: RollingWindow(hours) for label, hours in (windows or ROLLING_WINDOWS).items()}
+        self._seq = 0
+        self._latest_end = None
+
+    def __len__(self) -> int:
+        return self._seq
+
+    def add(self, timestamp: datetime, results: dict, timestep_hours: float = 1.0):
+        """Record one step that started at `timestamp`"""
+        end = timestamp + timedelta(hours=timestep_hours)
+        if self._latest_end is not None and timestamp < self._latest_end:
+            # The simulation clock was set back; earlier steps no longer precede this one
+            for window in self.windows.values():
+                window.clear()
+        self._latest_end = end
+
+        values = {name: float(results.get(key, 0.0)) for key, (name, _) in ROLLING_METRICS.items()}
+        self._seq += 1
+        for window in self.windows.values():
+            window.add(self._seq, timestamp, timestep_hours, values)
+            window.evict_before(self._latest_end - window.span)
+
+    def window(self, label: str) -> dict:
+        """Aggregates for one window; raises KeyError for an unknown label"""
+        return self.windows[label].to_dict()
+
+    def to_dict(self) -> dict:
+        return {label: window.to_dict() for label, window in self.windows.items()}
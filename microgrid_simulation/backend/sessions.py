@@ -0,0 +1,206 @@
+"""
+sessions.py
+
+Isolated simulation sessions, so one API process can host many sites. Each Session owns
+its environment, microgrid, demand stream, history and rolling statistics. The
+SessionManager keeps at most max_sessions in memory. With a checkpoint directory, the
+least recently used idle sessions are saved there and loaded back on their next request;
+without one, no session is ever dropped and new sessions are refused at the limit.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import os
+import threading
+import numpy as np
+
+from environment_simulation import Environment, spawn_seeds
+from power_simulation import MicrogridManager
+from history_store import HistoryStore
+from rolling_stats import RollingStats
+from checkpoint import dump_checkpoint, write_checkpoint, read_checkpoint
+
+DEFAULT_SESSION_ID = "default"
+MAX_SESSIONS = 200
+
+
+class SessionLimitError(RuntimeError):
+    """max_sessions are in memory and none can be parked to make room"""
+
+
+class Session:
+    def __init__(self, session_id: str, environment: Environment, microgrid: MicrogridManager,
+                 demand_rng: np.random.Generator, historical_data: HistoryStore = None,
+                 rolling_stats: RollingStats = None, created_at: datetime = None):
+        self.id = session_id
+        self.environment = environment
+        self.microgrid = microgrid
+        self.demand_rng = demand_rng
+        # Full run history; older chunks spill to memory-mapped files in a temporary directory
+        self.historical_data = historical_data if historical_data is not None else HistoryStore(spill_dir="temp")
+        # Running 1h/24h/7d/30d aggregates over the same steps, for /stats
+        self.rolling_stats = rolling_stats if rolling_stats is not None else RollingStats()
+        self.created_at = created_at or datetime.now()
+        self.last_used_at = datetime.now()
+        # Requests being served from this session (see SessionManager.hold); never evicted while > 0
+        self.requests = 0
+        # Held by requests that change the simulation and while it is saved, so a checkpoint
+        # never captures a step or device change half-way through
+        self.lock = threading.RLock()
+        # Views the API derives from this session (live stream, serialized status); not saved
+        self.cache = {}
+
+    @classmethod
+    def create(cls, session_id: str, seed=None, start_time: datetime = None) -> "Session":
+        """A new session with an empty microgrid. seed: root seed for weather and demand."""
+        environment_seed, demand_seed = spawn_seeds(seed, 2)
+        environment = Environment(environment_seed, start_time)
+        return cls(session_id, environment, MicrogridManager(environment, []), np.random.default_rng(demand_seed))
+
+    @classmethod
+    def from_state(cls, session_id: str, state: dict) -> "Session":
+        return cls(session_id, state["environment"], state["microgrid"], state["demand_rng"],
+                   state["historical_data"], state["rolling_stats"], state.get("created_at"))
+
+    def state(self) -> dict:
+        """Everything needed to resume the session, as saved by a checkpoint"""
+        return {
+            "environment": self.environment,
+            "microgrid": self.microgrid,
+            "demand_rng": self.demand_rng,
+            "historical_data": self.historical_data,
+            "rolling_stats": self.rolling_stats,
+            "created_at": self.created_at,
+        }
+
+    def restore(self, state: dict):
+        """Replace this session's simulation with a state() dict read back from a checkpoint"""
+        listeners = self.microgrid.step_listeners
+        _restore_in_place(self.environment, state["environment"])
+        _restore_in_place(self.microgrid, state["microgrid"])
+        self.microgrid.environment = self.environment
+        self.microgrid.step_listeners = listeners
+        self.demand_rng = state["demand_rng"]
+        self.historical_data = state["historical_data"]
+        self.rolling_stats = state["rolling_stats"]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "created_at": self.created_at.isoformat(),
+            "last_used_at": self.last_used_at.isoformat(),
+            "environment_time": self.environment.current_time.isoformat(),
+            "devices_count": len(self.microgrid.devices),
+            "history_rows": len(self.historical_data),
+        }
+
+
+def _restore_in_place(target, restored):
+    # Listeners and cached views hold references to the session's environment and
+    # microgrid, so copy the restored state into them. Versions move past both so no
+    # cached view of either matches.
+    version = max(target.state_version, restored.state_version) + 1
+    target.__dict__.clear()
+    target.__dict__.update(restored.__dict__)
+    target.state_version = version
+
+
+class SessionManager:
+    """
+    Sessions by ID, most recently used last. Pinned sessions (the default one) and sessions
+    with requests in flight are never evicted. checkpoint_dir: where evicted sessions are
+    parked; None keeps every session in memory and refuses new ones at max_sessions.
+    """
+    def __init__(self, max_sessions: int = MAX_SESSIONS, checkpoint_dir: str = None):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.max_sessions = max_sessions
+        self.checkpoint_dir = checkpoint_dir
+        self._sessions = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _checkpoint_path(self, session_id: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{session_id}.ckpt")
+
+    def _parked(self, session_id: str) -> bool:
+        # IDs are generated hex strings; anything else never names a file
+        return (self.checkpoint_dir is not None and session_id.isalnum() and
+                os.path.exists(self._checkpoint_path(session_id)))
+
+    def add(self, session: Session, pinned: bool = False) -> Session:
+        with self._lock:
+            if session.id in self._sessions or self._parked(session.id):
+                raise ValueError(f"Session '{session.id}' already exists")
+            if self.checkpoint_dir is None and len(self._sessions) >= self.max_sessions:
+                raise SessionLimitError(f"All {self.max_sessions} sessions are in use")
+            self._sessions[session.id] = session
+            if pinned:
+                self._pinned.add(session.id)
+            self._evict(keep=session.id)
+        return session
+
+    def get(self, session_id: str) -> Session:
+        """The session, loaded back from its checkpoint if it was evicted; KeyError if unknown"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                if not self._parked(session_id):
+                    raise KeyError(session_id)
+                path = self._checkpoint_path(session_id)
+                session = Session.from_state(session_id, read_checkpoint(path)[0])
+                os.remove(path)
+                self._sessions[session_id] = session
+                self._evict(keep=session_id)
+            self._sessions.move_to_end(session_id)
+            session.last_used_at = datetime.now()
+            return session
+
+    def hold(self, session_id: str) -> Session:
+        """get(), keeping the session in memory until the matching release()"""
+        with self._lock:
+            session = self.get(session_id)
+            session.requests += 1
+            return session
+
+    def release(self, session: Session):
+        with self._lock:
+            session.requests -= 1
+            # Evictions skipped while it was in use
+            self._evict()
+
+    def remove(self, session_id: str):
+        """Delete a session and any checkpoint of it; KeyError if unknown"""
+        with self._lock:
+            if session_id in self._pinned:
+                raise ValueError(f"Session '{session_id}' cannot be removed")
+            parked = self._parked(session_id)
+            if self._sessions.pop(session_id, None) is None and not parked:
+                raise KeyError(session_id)
+            if parked:
+                os.remove(self._checkpoint_path(session_id))
+
+    def list(self) -> list:
+        """Sessions in memory, least recently used first"""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def parked_ids(self) -> list:
+        """IDs of evicted sessions saved in checkpoint_dir"""
+        if self.checkpoint_dir is None or not os.path.isdir(self.checkpoint_dir):
+            return []
+        return sorted(name[:-len(".ckpt")] for name in os.listdir(self.checkpoint_dir) if name.endswith(".ckpt"))
+
+    def _evict(self, keep: str = None):
+        """Park the least recently used idle sessions, other than `keep`, while over max_sessions"""
+        if self.checkpoint_dir is None:
+            return
+        idle = [session_id for session_id, session in self._sessions.items()
+                if session_id not in self._pinned and session_id != keep and session.requests == 0]
+        for session_id in idle[:max(0, len(self._sessions) - self.max_sessions)]:
+            session = self._sessions.pop(session_id)
+            with session.lock:
+                data = dump_checkpoint(session.state())
+            write_checkpoint(self._checkpoint_path(session_id), data)
@@ -0,0 +1,442 @@
+"""
+sharding.py
+
+Runs sessions across a pool of worker processes so independent sites simulate on
+separate cores. Each worker is a full copy of the unified API with its own sessions; the
+coordinator in front of them routes every request to the worker that owns its session
+(X-Session-ID header or session_id query parameter) and relays the response. Routing is
+sticky: a session stays on its worker until the coordinator migrates it, which moves a
+checkpoint of the session over to the new worker. Requests for a session that is moving
+wait for the move off the event loop; other sessions are routed as usual.
+
+Workers talk to the coordinator over multiprocessing pipes; no broker or extra ports.
+Messages carry a request ID, so a worker serves many requests at once, like a
+single-process server, and replies are matched up as they finish.
+
+    python sharding.py 4    # coordinator on :8000 with 4 workers
+"""
+import asyncio
+import atexit
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+import zlib
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+
+from sessions import DEFAULT_SESSION_ID
+from metrics import CONTENT_TYPE, merge_text
+
+# Response headers not relayed; the coordinator's server sets its own
+_HOP_HEADERS = {"content-length", "transfer-encoding", "connection", "date", "server"}
+
+
+# === WORKER PROCESS ===
+async def _call_app(app, method: str, path: str, query_string: bytes, headers: list, body: bytes) -> tuple:
+    """Run one HTTP request through an ASGI app in-process; returns (status, headers, body)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query_string, "root_path": "",
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+        "client": ("127.0.0.1", 0), "server": ("shard", 0),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": 500, "headers": [], "body": bytearray()}
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in response["headers"]]
+    return response["status"], headers, bytes(response["body"])
+
+
+async def _serve(conn, api, sessions):
+    """
+    Answer coordinator messages until told to stop. Each message runs as its own task,
+    so a slow request does not hold up the worker's other sessions; its reply is tagged
+    with the message's request ID.
+    """
+    from sessions import Session
+
+    async def export_session(session_id):
+        # Pickled here so the coordinator relays the snapshot without unpickling it. The
+        # session stays until the coordinator removes it, once its new worker has it.
+        session = sessions.get(session_id)
+        with session.lock:
+            return pickle.dumps(session.state(), protocol=pickle.HIGHEST_PROTOCOL)
+
+    async def import_session(session_id, state):
+        sessions.add(Session.from_state(session_id, pickle.loads(state)))
+
+    async def remove_session(session_id):
+        sessions.remove(session_id)
+
+    async def list_sessions():
+        return [session.to_dict() for session in sessions.list()], sessions.parked_ids()
+
+    handlers = {
+        "request": lambda *args: _call_app(api.app, *args),
+        "export": export_session,
+        "import": import_session,
+        "remove": remove_session,
+        "sessions": list_sessions,
+    }
+
+    async def handle(request_id, op, args):
+        try:
+            reply = ("ok", await handlers[op](*args))
+        except Exception as e:
+            reply = ("error", (type(e).__name__, str(e)))
+        # Replies are only sent from the event loop, so they never interleave on the pipe
+        conn.send((request_id, *reply))
+
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    async with api.app.router.lifespan_context(api.app):
+        while True:
+            # The pipe is read off the loop, which keeps serving running requests meanwhile
+            request_id, op, args = await loop.run_in_executor(None, conn.recv)
+            if op == "stop":
+                break
+            task = asyncio.create_task(handle(request_id, op, args))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+    conn.close()
+
+
+def _worker_main(conn, index: int):
+    # Only worker 0 hosts the default session, so only it loads the site config and
+    # keeps the default session's checkpoint. Parked sessions go to a per-worker directory.
+    if index != 0:
+        os.environ.pop("MICROGRID_CHECKPOINT_PATH", None)
+        os.environ.pop("MICROGRID_SITE_CONFIG", None)
+    if os.environ.get("MICROGRID_SESSION_DIR"):
+        os.environ["MICROGRID_SESSION_DIR"] = os.path.join(os.environ["MICROGRID_SESSION_DIR"], f"worker-{index}")
+    import unified_api
+    from simulation_instances import get_session_manager
+    asyncio.run(_serve(conn, unified_api, get_session_manager()))
+
+
+# === COORDINATOR ===
+class ShardError(RuntimeError):
+    """An operation failed inside a worker; error_type names the worker-side exception"""
+    def __init__(self, index: int, error_type: str, message: str):
+        super().__init__(f"shard {index}: {error_type}: {message}")
+        self.error_type = error_type
+
+
+class _Worker:
+    def __init__(self, index: int, context):
+        self.index = index
+        self.conn, child_conn = context.Pipe()
+        # Not a daemon: each worker runs simulation jobs in its own process pool
+        self.process = context.Process(target=_worker_main, args=(child_conn, index),
+                                       name=f"microgrid-shard-{index}")
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()  # sends on the pipe and the table of pending replies
+        self._pending = {}
+        self._request_ids = itertools.count()
+        self._reader = threading.Thread(target=self._read_replies, name=f"microgrid-shard-{index}-replies",
+                                        daemon=True)
+        self._reader.start()
+
+    def _read_replies(self):
+        """Hand each reply to the call waiting for its request ID, until the pipe closes"""
+        while True:
+            try:
+                request_id, status, value = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                future = self._pending.pop(request_id)
+            future.set_result((status, value))
+        with self.lock:
+            pending, self._pending = self._pending, None
+        for future in pending.values():
+            future.set_result(("error", ("EOFError", "worker process exited")))
+
+    def send(self, request_id, op: str, *args):
+        with self.lock:
+            self.conn.send((request_id, op, args))
+
+    def call(self, op: str, *args):
+        """Run op in the worker and wait for its reply; other calls may be in flight meanwhile"""
+        future = Future()
+        with self.lock:
+            if self._pending is None:
+                raise ShardError(self.index, "EOFError", "worker process exited")
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            self.conn.send((request_id, op, args))
+        status, value = future.result()
+        if status == "error":
+            raise ShardError(self.index, *value)
+        return value
+
+
+class ShardCoordinator:
+    """
+    Session placement across `workers` processes. Sessions without an explicit placement
+    live on the worker picked by a stable hash of their ID; new sessions are created on
+    the worker with the fewest sessions and migrated sessions are pinned where they went.
+    """
+    def __init__(self, workers: int = None):
+        workers = workers or os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        # spawn rather than fork: the coordinator is multi-threaded
+        context = multiprocessing.get_context("spawn")
+        self.workers = [_Worker(index, context) for index in range(workers)]
+        self._placement = {DEFAULT_SESSION_ID: 0}
+        # session ID: [routing lock, holders]; an entry lives only while someone holds or waits on it
+        self._routing = {}
+        self._lock = threading.Lock()  # placement and routing tables only; never held during IPC
+        self._closed = False
+        # Workers are not daemons, so make sure they are told to stop at interpreter exit
+        atexit.register(self.close)
+
+    @contextmanager
+    def routed(self, session_id: str):
+        """
+        Hold session_id's routing lock: its placement does not change, and it is not
+        migrated, until the block exits. Only requests for the same session wait on it.
+        """
+        with self._lock:
+            entry = self._routing.get(session_id)
+            if entry is None:
+                entry = self._routing[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._routing[session_id]
+
+    def worker_for(self, session_id: str) -> _Worker:
+        with self._lock:
+            index = self._placement.get(session_id)
+        if index is None:
+            index = zlib.crc32(session_id.encode()) % len(self.workers)
+        return self.workers[index]
+
+    def place(self, session_id: str, worker: _Worker):
+        with self._lock:
+            self._placement[session_id] = worker.index
+
+    def forget(self, session_id: str):
+        with self._lock:
+            if session_id != DEFAULT_SESSION_ID:
+                self._placement.pop(session_id, None)
+
+    def request(self, worker: _Worker, method: str, path: str, query_string: bytes, headers: list,
+                body: bytes) -> tuple:
+        return worker.call("request", method, path, query_string, headers, body)
+
+    def session_request(self, session_id: str, *request) -> tuple:
+        """Relay a request to the worker owning session_id, waiting out any migration of it"""
+        with self.routed(session_id):
+            return self.request(self.worker_for(session_id), *request)
+
+    def broadcast(self, *request) -> list:
+        """The same request on every worker; (status, headers, body) per worker"""
+        return [self.request(worker, *request) for worker in self.workers]
+
+    def sessions(self) -> list:
+        """(worker, sessions in memory, parked session IDs) for every worker"""
+        entries = []
+        for worker in self.workers:
+            sessions, parked = worker.call("sessions")
+            # Every worker has a default session, but only worker 0's is reachable
+            if worker.index != 0:
+                sessions = [session for session in sessions if session["id"] != DEFAULT_SESSION_ID]
+            entries.append((worker, sessions, parked))
+        return entries
+
+    def least_loaded(self) -> _Worker:
+        return min(self.sessions(), key=lambda entry: len(entry[1]) + len(entry[2]))[0]
+
+    def migrate(self, session_id: str, target: int) -> dict:
+        """Move a session to worker `target` by snapshot"""
+        if not 0 <= target < len(self.workers):
+            raise ValueError(f"worker must be 0-{len(self.workers) - 1}")
+        if session_id == DEFAULT_SESSION_ID:
+            raise ValueError("The default session cannot be migrated")
+        # This session's requests wait while it moves, so none reaches it mid-move
+        with self.routed(session_id):
+            source = self.worker_for(session_id)
+            destination = self.workers[target]
+            result = {"session_id": session_id, "from_worker": source.index, "to_worker": destination.index,
+                      "snapshot_bytes": 0}
+            if source is destination:
+                return result
+            # The source keeps the session until the destination has it, so a failed
+            # import leaves it where it was
+            state = source.call("export", session_id)
+            destination.call("import", session_id, state)
+            self.place(session_id, destination)
+            source.call("remove", session_id)
+        result["snapshot_bytes"] = len(state)
+        return result
+
+    def close(self):
+        """Stop every worker, after their running jobs are cancelled and sessions saved"""
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self.workers:
+            try:
+                worker.send(None, "stop")
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=30)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.conn.close()
+
+
+def create_app(workers: int = None) -> FastAPI:
+    """Coordinator API: the unified API's routes, served by `workers` shard processes"""
+    coordinator = None
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        nonlocal coordinator
+        coordinator = await run_in_threadpool(ShardCoordinator, workers)
+        app.state.coordinator = coordinator
+        yield
+        await run_in_threadpool(coordinator.close)
+
+    app = FastAPI(title="Sharded Microgrid Management API", version="2.0.0", lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    async def relay(request: Request, worker: _Worker = None, session_id: str = None) -> Response:
+        """Relay to `worker`, or to whichever worker owns session_id once it is not moving"""
+        message = (request.method, request.url.path, request.url.query.encode(),
+                   list(request.headers.items()), await request.body())
+        try:
+            if worker is not None:
+                status, headers, body = await run_in_threadpool(coordinator.request, worker, *message)
+            else:
+                status, headers, body = await run_in_threadpool(coordinator.session_request, session_id, *message)
+        except ShardError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        response = Response(content=body, status_code=status)
+        for name, value in headers:
+            if name.lower() not in _HOP_HEADERS:
+                response.headers.append(name, value)
+        return response
+
+    @app.get("/shards")
+    def get_shards():
+        """Workers, their sessions and explicitly placed sessions"""
+        return {
+            "workers": [{"index": worker.index, "pid": worker.process.pid, "alive": worker.process.is_alive(),
+                         "sessions": [session["id"] for session in sessions], "parked": parked}
+                        for worker, sessions, parked in coordinator.sessions()],
+        }
+
+    @app.post("/shards/migrate")
+    def migrate_session(session_id: str = Query(...), worker: int = Query(...)):
+        """Move a session to another worker by snapshot"""
+        try:
+            return coordinator.migrate(session_id, worker)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ShardError as e:
+            if e.error_type == "KeyError":
+                raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
+            raise HTTPException(status_code=502, detail=str(e))
+
+    @app.get("/sessions")
+    def list_sessions():
+        """Sessions on every worker"""
+        sessions, parked = [], []
+        for worker, worker_sessions, worker_parked in coordinator.sessions():
+            sessions += [dict(session, worker=worker.index) for session in worker_sessions]
+            parked += worker_parked
+        return {"sessions": sessions, "parked": parked}
+
+    @app.post("/sessions")
+    async def create_session(request: Request):
+        """Create a session on the least loaded worker"""
+        worker = await run_in_threadpool(coordinator.least_loaded)
+        response = await relay(request, worker)
+        if response.status_code == 200:
+            coordinator.place(json.loads(response.body)["id"], worker)
+        return response
+
+    @app.api_route("/sessions/{session_id}", methods=["GET", "DELETE"])
+    async def session_route(request: Request, session_id: str):
+        response = await relay(request, session_id=session_id)
+        if request.method == "DELETE" and response.status_code == 200:
+            coordinator.forget(session_id)
+        return response
+
+    @app.get("/metrics")
+    def get_metrics():
+        """Every worker's counters and histograms, summed per series"""
+        try:
+            replies = coordinator.broadcast("GET", "/metrics", b"", [], b"")
+        except ShardError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        status, headers, body = replies[0]
+        if status != 200:
+            # Metrics are configured by environment, so every worker answers alike
+            return Response(content=body, status_code=status, media_type=dict(headers).get("content-type"))
+        return Response(content=merge_text([body.decode() for _, _, body in replies]), media_type=CONTENT_TYPE)
+
+    @app.get("/stream")
+    def stream_unavailable():
+        raise HTTPException(status_code=501, detail="Live streams are not relayed by the sharded server; "
+                                                    "use /history or run a single-process server")
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    async def forward(request: Request, path: str):
+        session_id = (request.headers.get("x-session-id") or request.query_params.get("session_id")
+                      or DEFAULT_SESSION_ID)
+        return await relay(request, session_id=session_id)
+
+    return app
+
+
+def run_sharded(workers: int = None, host: str = "0.0.0.0", port: int = 8000):
+    """Run the coordinator with `workers` shard processes (default: one per core)"""
+    import uvicorn
+    print(f"Starting sharded Microgrid Management API on http://localhost:{port}")
+    uvicorn.run(create_app(workers), host=host, port=port)
+
+
+if __name__ == "__main__":
+    import sys
+    run_sharded(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -1,15 +1,54 @@
 from power_simulation import *
-from environment_simulation import Environment
-from collections import deque
+from environment_simulation import Environment, spawn_seeds
+from history_store import HistoryStore
+from rolling_stats import RollingStats
+from site_config import load_site_config, apply_site_config
+from checkpoint import Checkpointer, read_checkpoint, CHECKPOINT_INTERVAL_SECONDS
+from sessions import Session, SessionManager, DEFAULT_SESSION_ID, MAX_SESSIONS
+from forecasting import ForecastCache, FORECAST_CACHE_BLOCKS
+import os
+import numpy as np
+
+# Root seed for the live simulation. Leave as None for fresh weather on every start,
+# or set an int to replay the same environment and demand streams.
+SIMULATION_SEED = None
+environment_seed, demand_seed = spawn_seeds(SIMULATION_SEED, 2)
 
 # Create global instances
-env = Environment.get_instance()
+env = Environment.get_instance(environment_seed)
+demand_rng = np.random.default_rng(demand_seed)
+
+microgrid = MicrogridManager(env, [])
+
+# The site served to clients that do not name a session. Further sessions, each with its
+# own environment and microgrid, are created through the API. At most
+# MICROGRID_MAX_SESSIONS stay in memory; with MICROGRID_SESSION_DIR set, the least
+# recently used are parked there instead of being dropped.
+default_session = Session(DEFAULT_SESSION_ID, env, microgrid, demand_rng)
+session_manager = SessionManager(int(os.environ.get("MICROGRID_MAX_SESSIONS", MAX_SESSIONS)),
+                                 os.environ.get("MICROGRID_SESSION_DIR"))
+session_manager.add(default_session, pinned=True)
 
-devices = []
-microgrid = MicrogridManager(env, devices)
+# Forecast blocks shared by every session (see forecasting.py)
+forecast_cache = ForecastCache(int(os.environ.get("MICROGRID_FORECAST_CACHE_BLOCKS", FORECAST_CACHE_BLOCKS)))
 
-# Store the last 24 hours of data (assuming 1-hour timesteps)
-historical_data = deque(maxlen=24)
+# Optional checkpoint file for the default session. When set, it is saved every
+# MICROGRID_CHECKPOINT_INTERVAL seconds (and on demand), and a server started with an
+# existing one resumes from it.
+CHECKPOINT_PATH = os.environ.get("MICROGRID_CHECKPOINT_PATH")
+checkpointer = None
+if CHECKPOINT_PATH:
+    checkpointer = Checkpointer(
+        CHECKPOINT_PATH, default_session.state,
+        float(os.environ.get("MICROGRID_CHECKPOINT_INTERVAL", CHECKPOINT_INTERVAL_SECONDS)),
+        state_lock=default_session.lock)
+
+# Optional JSON/YAML site config (see site_config.py) loaded at startup
+SITE_CONFIG_PATH = os.environ.get("MICROGRID_SITE_CONFIG")
+if CHECKPOINT_PATH and os.path.exists(CHECKPOINT_PATH):
+    default_session.restore(read_checkpoint(CHECKPOINT_PATH)[0])
+elif SITE_CONFIG_PATH:
+    apply_site_config(microgrid, load_site_config(SITE_CONFIG_PATH))
 
 def get_environment_instance() -> Environment:
     return env
@@ -17,5 +56,21 @@ def get_environment_instance() -> Environment:
 def get_microgrid_instance() -> MicrogridManager:
     return microgrid
 
-def get_historical_data() -> deque:
-    return historical_data
\ No newline at end of file
+def get_demand_rng() -> np.random.Generator:
+    return default_session.demand_rng
+
+def get_historical_data() -> HistoryStore:
+    return default_session.historical_data
+
+def get_rolling_stats() -> RollingStats:
+    return default_session.rolling_stats
+
+def get_session_manager() -> SessionManager:
+    return session_manager
+
+def get_forecast_cache() -> ForecastCache:
+    return forecast_cache
+
+def get_checkpointer() -> Checkpointer:
+    """The configured Checkpointer, or None without MICROGRID_CHECKPOINT_PATH"""
+    return checkpointer
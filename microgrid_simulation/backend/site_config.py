@@ -0,0 +1,74 @@
+"""
+site_config.py
+
+Site configuration files: a whole microgrid described as a list of device configs (the
+same dicts as build_device and to_config use), loaded from JSON or YAML and applied in
+one all-or-nothing step.
+
+    {"diesel_strategy": "demand_following",
+     "devices": [{"type": "SolarPanel", "name": "roof_1", "rated_power": 100}, ...]}
+"""
+import json
+import os
+
+from power_simulation import MicrogridManager, DIESEL_STRATEGIES, build_device
+
+
+def load_site_config(path: str) -> dict:
+    """Read a site config from a .json, .yaml or .yml file"""
+    with open(path) as f:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Reading YAML site configs requires PyYAML (pip install pyyaml)")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    if not isinstance(config, dict) or not isinstance(config.get("devices"), list):
+        raise ValueError(f"{path}: a site config needs a 'devices' list")
+    return config
+
+
+def build_devices(configs: list) -> list:
+    """
+    Build every device in configs, or raise ValueError listing every invalid entry
+    (unknown type, bad or non-numeric parameters, repeated names).
+    """
+    devices = []
+    errors = []
+    seen = set()
+    for i, config in enumerate(configs):
+        if not isinstance(config, dict):
+            errors.append(f"devices[{i}]: expected an object")
+            continue
+        bad = [key for key, value in config.items()
+               if key not in ("type", "name") and (isinstance(value, bool) or not isinstance(value, (int, float)))]
+        if bad:
+            errors.append(f"devices[{i}]: non-numeric {bad}")
+            continue
+        try:
+            device = build_device(config)
+        except ValueError as e:
+            errors.append(f"devices[{i}]: {e}")
+            continue
+        if device.name in seen:
+            errors.append(f"devices[{i}]: duplicate name '{device.name}'")
+            continue
+        seen.add(device.name)
+        devices.append(device)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return devices
+
+
+def apply_site_config(microgrid: MicrogridManager, config: dict) -> list:
+    """Add the config's devices (and set its diesel strategy) all at once; returns the new devices"""
+    devices = build_devices(config["devices"])
+    strategy = config.get("diesel_strategy")
+    if strategy is not None and strategy not in DIESEL_STRATEGIES:
+        raise ValueError(f"Strategy must be one of {list(DIESEL_STRATEGIES)}")
+    microgrid.add_devices(devices)
+    if strategy is not None:
+        microgrid.set_diesel_strategy(strategy)
+    return devices
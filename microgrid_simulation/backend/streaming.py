@@ -0,0 +1,125 @@
+"""
+streaming.py
+
+Pushes simulation step results to connected clients as Server-Sent Events. The state of
+every device is diffed once per step, so each client receives only the fields that
+changed and the work per step does not grow with the number of clients.
+"""
+import asyncio
+import json
+import threading
+
+# Seconds to wait after the first pending message before sending a batch
+STREAM_BATCH_INTERVAL = 0.25
+# Seconds of silence after which a keep-alive comment is sent
+STREAM_KEEPALIVE_INTERVAL = 15.0
+# Pending messages kept per client. A client that falls further behind has its queue
+# replaced by a full snapshot, as the deltas it missed cannot be rebuilt from later ones.
+STREAM_MAX_PENDING = 1000
+
+
+def _changed_fields(before: dict, after: dict) -> dict:
+    return {key: value for key, value in after.items() if before.get(key) != value}
+
+
+def _diff(previous: dict, current: dict) -> tuple:
+    """Changed fields per entry, plus the names of removed entries"""
+    changed = {}
+    for name, fields in current.items():
+        delta = _changed_fields(previous.get(name, {}), fields)
+        if delta:
+            changed[name] = delta
+    removed = [name for name in previous if name not in current]
+    return changed, removed
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def deliver(self, message: dict, state: dict):
+        """
+        Runs on the subscriber's event loop. state is the full state message brings the
+        client up to, sent instead of the pending deltas once the client falls behind.
+        """
+        if self.queue.qsize() >= STREAM_MAX_PENDING:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = {"type": "snapshot", **state}
+        self.queue.put_nowait(message)
+
+
+class StepStream:
+    """
+    describe_state: callable returning {"environment": {...}, "devices": {name: {...}}}
+    with JSON-serializable values. It is called once per step while anyone is listening.
+    """
+    def __init__(self, describe_state, batch_interval: float = STREAM_BATCH_INTERVAL):
+        self.describe_state = describe_state
+        self.batch_interval = batch_interval
+        self._subscribers = set()
+        self._last_state = None
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _broadcast(self, message: dict):
+        for subscriber in self._subscribers:
+            subscriber.loop.call_soon_threadsafe(subscriber.deliver, message, self._last_state)
+
+    def _state_delta(self) -> dict:
+        """Diff the current state against the last one published and remember it"""
+        state = self.describe_state()
+        previous = self._last_state or {"environment": {}, "devices": {}}
+        devices, removed = _diff(previous["devices"], state["devices"])
+        environment = _changed_fields(previous["environment"], state["environment"])
+        self._last_state = state
+        return {"environment": environment, "devices": devices, "removed": removed}
+
+    def publish(self, results: dict, timestep_hours: float = 1.0):
+        """Step listener: queue one step's results and device deltas for every client"""
+        if not self._subscribers:
+            return
+        with self._lock:
+            message = {"type": "step", "timestep_hours": timestep_hours, "results": results, **self._state_delta()}
+            self._broadcast(message)
+
+    async def events(self):
+        """
+        Async generator of SSE text for one client: a full snapshot first, then batches
+        of step messages. A "snapshot" message within a batch replaces the client's state
+        after it fell behind; the steps it skipped are not sent.
+        """
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            # Bring existing clients up to date so the new baseline is shared by everyone
+            if self._subscribers:
+                self._broadcast({"type": "state", **self._state_delta()})
+            else:
+                self._state_delta()
+            snapshot = self._last_state
+            self._subscribers.add(subscriber)
+
+        try:
+            yield format_event("snapshot", snapshot)
+            while True:
+                try:
+                    first = await asyncio.wait_for(subscriber.queue.get(), STREAM_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                await asyncio.sleep(self.batch_interval)
+                batch = [first]
+                while not subscriber.queue.empty():
+                    batch.append(subscriber.queue.get_nowait())
+                yield format_event("steps", batch)
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
@@ -0,0 +1,108 @@
+"""
+sweep.py
+
+Parameter sweeps for sizing studies. Every combination of battery size, solar panel count,
+diesel generator size and diesel strategy is simulated over the same horizon, reusing one
+weather trajectory, one demand series and the renewable output computed from them.
+"""
+from datetime import datetime
+from itertools import product
+
+from environment_simulation import Environment, spawn_seeds
+from power_simulation import (
+    MicrogridManager, DeviceFleet, DemandGenerator, SolarPanel, Battery, DieselGenerator, build_device
+)
+from monte_carlo import summarize_run
+
+# Swept parameters, in table column order
+SWEEP_PARAMETERS = (
+    "battery_capacity_kwh",
+    "battery_max_power_kw",
+    "solar_panel_count",
+    "diesel_rated_power",
+    "diesel_strategy",
+)
+
+SWEEP_METRICS = (
+    "diesel_litres",
+    "grid_cost",
+    "unserved_energy_kwh",
+    "renewable_kwh",
+    "min_battery_soc_percent",
+    "mean_battery_soc_percent",
+)
+
+
+def _swept_devices(params: dict, solar_panel_rated_power: float) -> list:
+    """Devices added on top of the base configuration for one combination"""
+    devices = []
+    if params["battery_capacity_kwh"] > 0:
+        devices.append(Battery("sweep_battery", params["battery_capacity_kwh"], params["battery_max_power_kw"]))
+    if params["diesel_rated_power"] > 0:
+        devices.append(DieselGenerator("sweep_diesel", params["diesel_rated_power"]))
+    devices.extend(SolarPanel(f"sweep_solar_{i}", solar_panel_rated_power)
+                   for i in range(params["solar_panel_count"]))
+    return devices
+
+
+def run_sweep(base_devices: list, parameter_grid: dict, horizon_steps: int, timestep_hours: float = 1.0,
+              total_daily_kwh: float = 50000.0, start_time: datetime = None, seed=None,
+              solar_panel_rated_power: float = 100.0) -> dict:
+    """
+    Evaluate every combination in parameter_grid over a fixed horizon.
+
+    base_devices: device config dicts (see build_device) present in every combination.
+    parameter_grid: lists of values keyed by SWEEP_PARAMETERS. Each combination adds one
+        battery ("sweep_battery", skipped for a capacity of 0), one diesel generator
+        ("sweep_diesel", skipped for 0 kW) and solar_panel_count identical panels to the
+        base devices. Omitted parameters default to adding nothing and "demand_following".
+
+    Returns a compact table: {"columns": [...], "rows": [[...], ...]} with one row per
+    combination, parameters first and SWEEP_METRICS after.
+    """
+    unknown = set(parameter_grid) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}. Use {list(SWEEP_PARAMETERS)}")
+    if ("battery_capacity_kwh" in parameter_grid) != ("battery_max_power_kw" in parameter_grid):
+        raise ValueError("battery_capacity_kwh and battery_max_power_kw must be swept together")
+    grid = {
+        "battery_capacity_kwh": [0.0],
+        "battery_max_power_kw": [0.0],
+        "solar_panel_count": [0],
+        "diesel_rated_power": [0.0],
+        "diesel_strategy": ["demand_following"],
+        **parameter_grid,
+    }
+    if any(len(values) == 0 for values in grid.values()):
+        raise ValueError("Every swept parameter needs at least one value")
+
+    # One weather trajectory and demand series shared by every combination
+    start_time = start_time or datetime(datetime.now().year, 1, 1)
+    environment_seed, demand_seed = spawn_seeds(seed, 2)
+    environment = Environment(environment_seed, start_time)
+    weather = environment.advance(horizon_steps, timestep_hours)
+    demand = DemandGenerator(total_daily_kwh, demand_seed).series(start_time, horizon_steps, timestep_hours)
+
+    # Renewables from the base devices plus a per-panel series; panels are identical,
+    # so n swept panels contribute n times one panel's output
+    base = [build_device(config) for config in base_devices]
+    base_renewable = DeviceFleet(d for d in base if isinstance(d, DeviceFleet.DEVICE_TYPES)).output_series(weather)
+    panel_output = DeviceFleet([SolarPanel("sweep_solar", solar_panel_rated_power)]).output_series(weather)
+    base_capacity = sum(d.capacity_kwh for d in base if isinstance(d, Battery))
+
+    rows = []
+    for combination in product(*(grid[name] for name in SWEEP_PARAMETERS)):
+        params = dict(zip(SWEEP_PARAMETERS, combination))
+        devices = [build_device(config) for config in base_devices] + _swept_devices(params, solar_panel_rated_power)
+        microgrid = MicrogridManager(environment, devices)
+        microgrid.set_diesel_strategy(params["diesel_strategy"])
+
+        renewable = base_renewable + params["solar_panel_count"] * panel_output
+        results = microgrid.dispatch_series(weather["time"], demand, renewable, timestep_hours)
+
+        capacity = base_capacity + (params["battery_capacity_kwh"] if params["battery_capacity_kwh"] > 0 else 0.0)
+        summary = summarize_run(results, timestep_hours, capacity)
+        summary["renewable_kwh"] = float(renewable.sum() * timestep_hours)
+        rows.append(list(combination) + [summary[metric] for metric in SWEEP_METRICS])
+
+    return {"columns": list(SWEEP_PARAMETERS) + list(SWEEP_METRICS), "rows": rows}
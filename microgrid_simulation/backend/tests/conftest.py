@@ -0,0 +1,10 @@
+"""
+The backend modules import each other by bare name, as when the API is run from this
+directory, so the tests put it on sys.path the same way.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
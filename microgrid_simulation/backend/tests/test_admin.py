@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import unified_api
+from power_simulation import MicrogridManager
+from profiler import PROFILE_SCOPES, _in_scope
+from unified_api import app
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def test_admin_endpoints_do_not_exist_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(unified_api, "ADMIN_TOKEN", None)
+    assert client.post("/admin/profile", params={"seconds": 0.05}).status_code == 404
+    assert client.post("/admin/profile", params={"seconds": 0.05},
+                       headers={"X-Admin-Token": ""}).status_code == 404
+
+
+def test_admin_endpoints_require_the_configured_token(client, monkeypatch):
+    monkeypatch.setattr(unified_api, "ADMIN_TOKEN", "secret")
+    assert client.post("/admin/profile", params={"seconds": 0.05}).status_code == 403
+    assert client.post("/admin/profile", params={"seconds": 0.05},
+                       headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.post("/admin/profile", params={"seconds": 0.05}, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200 and "X-Profile-Samples" in response.headers
+
+
+@pytest.mark.parametrize("method", ["step", "run", "fast_forward", "dispatch_series"])
+def test_simulation_scope_covers_every_simulation_path(method):
+    assert _in_scope([getattr(MicrogridManager, method).__code__], PROFILE_SCOPES["simulation"])
@@ -0,0 +1,111 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from benchmarks import build_scenario
+from economic_dispatch import DISPATCH_REPLAN_STEPS, EconomicDispatcher, diesel_setpoints
+from power_simulation import Battery
+
+CAPACITY_KWH = 10.0
+MAX_POWER_KW = 5.0
+EFFICIENCY = 0.9
+RATED = [4.0, 6.0]
+USAGE = [0.3, 0.25]
+TIMESTEP_HOURS = 1.0
+SERIES_STEPS = 100
+
+
+def _plan(dispatcher, net_demand, soc_kwh, import_price=0.4, export_price=0.05):
+    return dispatcher.plan(net_demand, soc_kwh, CAPACITY_KWH, MAX_POWER_KW, EFFICIENCY, RATED, USAGE,
+                           import_price, export_price, TIMESTEP_HOURS)
+
+
+def _objective(dispatcher, net_demand, soc_kwh, path, import_price, export_price) -> float:
+    """Stage costs along a path of SOC levels plus the value of the energy left at the end"""
+    segments = dispatcher._supply_segments(np.array(RATED), np.array(USAGE), import_price, TIMESTEP_HOURS)
+    curve = dispatcher._cost_curve(segments)
+    soc = np.concatenate(([soc_kwh], path))
+    battery = dispatcher._battery_output(soc[:-1], soc[1:], MAX_POWER_KW, EFFICIENCY, TIMESTEP_HOURS)
+    if np.isnan(battery).any():
+        return np.inf
+    replacement = [c for c in segments[1] if c < dispatcher.unserved_penalty_per_kwh * TIMESTEP_HOURS]
+    terminal = -path[-1] * EFFICIENCY * min(replacement) / TIMESTEP_HOURS
+    return float(dispatcher._step_cost(net_demand - battery, curve, export_price, TIMESTEP_HOURS).sum()) + terminal
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("import_price", [0.4, None])
+def test_plan_is_the_cheapest_path_on_the_soc_grid(seed, import_price):
+    rng = np.random.default_rng(seed)
+    dispatcher = EconomicDispatcher(horizon_steps=4, soc_levels=5)
+    export_price = None if import_price is None else 0.05
+    net_demand = rng.uniform(-8, 14, 4)
+    levels, _ = dispatcher._transition_table(CAPACITY_KWH, MAX_POWER_KW, EFFICIENCY, TIMESTEP_HOURS)
+    soc_kwh = float(rng.choice(levels))
+
+    plan = _plan(dispatcher, net_demand, soc_kwh, import_price, export_price)
+    best = min(_objective(dispatcher, net_demand, soc_kwh, np.array(path), import_price, export_price)
+               for path in itertools.product(levels, repeat=len(net_demand)))
+    assert _objective(dispatcher, net_demand, soc_kwh, plan.soc_kwh, import_price, export_price) == pytest.approx(best)
+
+
+def test_plan_respects_battery_and_diesel_limits():
+    rng = np.random.default_rng(5)
+    dispatcher = EconomicDispatcher(horizon_steps=48)
+    net_demand = rng.uniform(-10, 15, 48)
+    plan = _plan(dispatcher, net_demand, 3.7)
+
+    assert np.all(np.abs(plan.battery_kw) <= MAX_POWER_KW + 1e-9)
+    assert np.all((plan.soc_kwh >= 0) & (plan.soc_kwh <= CAPACITY_KWH + 1e-9))
+    assert np.all((plan.diesel_kw >= 0) & (plan.diesel_kw <= sum(RATED) + 1e-9))
+    assert np.allclose(plan.battery_kw + plan.diesel_kw + plan.grid_kw, net_demand)
+    # Each battery output is the one that moves the charge between consecutive levels
+    soc = np.concatenate(([3.7], plan.soc_kwh))
+    expected = dispatcher._battery_output(soc[:-1], soc[1:], MAX_POWER_KW, EFFICIENCY, TIMESTEP_HOURS)
+    assert np.allclose(plan.battery_kw, expected)
+
+
+def test_diesel_setpoints_fill_the_most_efficient_generator_first():
+    assert diesel_setpoints(5.0, RATED, USAGE).tolist() == [0.0, 5.0]
+    assert diesel_setpoints(8.0, RATED, USAGE).tolist() == [2.0, 6.0]
+    assert diesel_setpoints(20.0, RATED, USAGE).tolist() == [4.0, 6.0]
+
+
+def _economic_site(batteries: list):
+    environment, microgrid, demand = build_scenario(20, seed=4)
+    for battery in microgrid.batteries:
+        microgrid.remove_device(battery.name)
+    microgrid.add_devices(batteries)
+    microgrid.set_diesel_strategy("economic_dispatch")
+    weather = environment.advance(SERIES_STEPS, 0.5)
+    renewable = microgrid.fleet.output_series(weather)
+    return microgrid, weather["time"], demand.series(environment.current_time, SERIES_STEPS, 0.5), renewable
+
+
+def _count_plans(microgrid) -> list:
+    plans = []
+    plan = microgrid.dispatcher.plan
+    microgrid.dispatcher.plan = lambda *args: plans.append(args[0]) or plan(*args)
+    return plans
+
+
+def test_batch_dispatch_replans_every_few_steps():
+    microgrid, times, demand, renewable = _economic_site([Battery("battery", 2000, 500)])
+    plans = _count_plans(microgrid)
+    results = microgrid.dispatch_series(times, demand, renewable, 0.5)
+
+    assert len(plans) == -(-SERIES_STEPS // DISPATCH_REPLAN_STEPS)
+    # Each plan looks a full horizon past the last step it is followed for
+    assert len(plans[0]) == microgrid.dispatcher.horizon_steps + DISPATCH_REPLAN_STEPS - 1
+    supplied = (results["Renewable Generation (kW)"] + results["Diesel Generation (kW)"] +
+                results["Battery Flow (kW)"] + results["Grid Flow (kW)"])
+    assert np.allclose(supplied, demand)
+
+
+def test_batch_dispatch_replans_when_batteries_leave_the_plan():
+    # Shared by capacity, the low-power battery cannot take its part of the planned flow
+    microgrid, times, demand, renewable = _economic_site([Battery("large", 2000, 1000), Battery("slow", 2000, 50)])
+    plans = _count_plans(microgrid)
+    microgrid.dispatch_series(times, demand, renewable, 0.5)
+    assert len(plans) > -(-SERIES_STEPS // DISPATCH_REPLAN_STEPS)
@@ -0,0 +1,29 @@
+from datetime import datetime
+import json
+import sys
+
+import numpy as np
+
+from encoding import _encode_json
+
+PAYLOAD = {
+    "time": [datetime(2024, 1, 1)],
+    "values": np.array([1.5, np.nan, np.inf, -np.inf]),
+    "stats": {"mean": float("nan"), "max": float("inf"), "count": np.int64(3), "min": np.float32(0.5)},
+    "rows": [(1, float("-inf"))],
+}
+
+
+def _strict_loads(data: bytes):
+    def invalid(token):
+        raise AssertionError(f"{token} is not valid JSON")
+    return json.loads(data, parse_constant=invalid)
+
+
+def test_json_without_orjson_is_valid_and_matches_orjson(monkeypatch):
+    with_orjson = _strict_loads(_encode_json(PAYLOAD))
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    fallback = _strict_loads(_encode_json(PAYLOAD))
+
+    assert fallback == with_orjson
+    assert fallback["values"] == [1.5, None, None, None] and fallback["stats"]["max"] is None
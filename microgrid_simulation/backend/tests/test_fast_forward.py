@@ -0,0 +1,49 @@
+import copy
+
+import numpy as np
+import pytest
+
+from benchmarks import build_scenario
+from power_simulation import FAST_FORWARD_DISPATCHES, WindTurbine
+
+STEPS = 30 * 24 * 4
+TIMESTEP_HOURS = 0.25
+COLUMNS = ("Renewable Generation (kW)", "Diesel Generation (kW)", "Battery Flow (kW)", "Grid Flow (kW)",
+           "Total Battery SOC (kWh)", "Total Diesel Usage (L/h)", "Total Grid Cost ($)")
+
+
+def _both(device_count: int, strategy: str):
+    """run() and fast_forward() results for the same site, plus the two microgrids"""
+    environment, microgrid, demand = build_scenario(device_count, seed=11)
+    microgrid.set_diesel_strategy(strategy)
+    microgrid.diesel_setpoints = {gen.name: 0.4 * gen.rated_power for gen in microgrid.diesel_generators}
+    demand = demand.series(environment.current_time, STEPS, TIMESTEP_HOURS)
+    _, reference = copy.deepcopy((environment, microgrid))
+    expected = reference.run(STEPS, demand, TIMESTEP_HOURS)
+    dispatches = FAST_FORWARD_DISPATCHES.value()
+    results = microgrid.fast_forward(STEPS, demand, TIMESTEP_HOURS)
+    return expected, results, reference, microgrid, FAST_FORWARD_DISPATCHES.value() - dispatches
+
+
+@pytest.mark.parametrize("strategy", ["demand_following", "battery_charging", "manual"])
+def test_matches_run_on_a_site_with_wind(strategy):
+    expected, results, reference, microgrid, dispatches = _both(120, strategy)
+
+    assert microgrid.batteries and microgrid.devices_of_type(WindTurbine)
+    for column in COLUMNS:
+        assert np.sum(results[column]) == pytest.approx(np.sum(expected[column]), rel=1e-9, abs=1e-6), column
+        assert np.allclose(results[column], expected[column], rtol=1e-7, atol=1e-4), column
+    for ours, theirs in zip(microgrid.batteries, reference.batteries):
+        assert ours.state_of_charge == pytest.approx(theirs.state_of_charge, rel=1e-9)
+        assert ours.power_output == pytest.approx(theirs.power_output, rel=1e-7, abs=1e-6)
+    assert microgrid.environment.current_time == reference.environment.current_time
+    # Noisy wind no longer prevents coarse steps
+    assert 0 < dispatches < STEPS / 2
+    assert np.sum(results["Step (h)"] > TIMESTEP_HOURS) > STEPS / 2
+
+
+def test_strategies_with_state_step_row_by_row():
+    expected, results, _, _, dispatches = _both(30, "unit_commitment")
+    assert dispatches == 0
+    assert np.all(results["Step (h)"] == TIMESTEP_HOURS)
+    assert np.allclose(results["Grid Flow (kW)"], expected["Grid Flow (kW)"])
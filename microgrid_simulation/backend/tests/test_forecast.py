@@ -0,0 +1,103 @@
+from datetime import datetime
+import pickle
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from environment_simulation import Environment, TRAJECTORY_BLOCK_STEPS, WEATHER_KEYS
+from forecasting import ForecastCache
+from unified_api import app
+
+START = datetime(2024, 3, 1, 6)
+
+
+def _snapshot(environment: Environment) -> bytes:
+    return pickle.dumps(environment)
+
+
+@pytest.mark.parametrize("timestep_hours", [1.0, 0.25])
+def test_forecast_is_what_advance_returns_and_changes_nothing(timestep_hours):
+    environment = Environment(3, START)
+    environment.step(1.0)
+    before = _snapshot(environment)
+
+    steps = 2 * TRAJECTORY_BLOCK_STEPS + 10
+    forecast = environment.forecast(steps, timestep_hours)
+    assert _snapshot(environment) == before
+
+    weather = environment.advance(steps, timestep_hours)
+    for key in ("time",) + WEATHER_KEYS:
+        assert np.array_equal(forecast[key], weather[key]), key
+
+
+def test_forecast_does_not_change_the_weather_stepped_through():
+    stepped, forecasted = Environment(4, START), Environment(4, START)
+    forecasted.forecast(3 * TRAJECTORY_BLOCK_STEPS, 0.5)
+    forecasted.forecast(3 * TRAJECTORY_BLOCK_STEPS, 1.0)
+    for _ in range(TRAJECTORY_BLOCK_STEPS + 5):
+        stepped.step(1.0)
+        forecasted.step(1.0)
+    assert stepped.temperature == forecasted.temperature and stepped.wind_speed == forecasted.wind_speed
+    stepped.step(0.5)
+    forecasted.step(0.5)
+    assert stepped.temperature == forecasted.temperature and stepped.wind_speed == forecasted.wind_speed
+
+
+def _weather(environment: Environment) -> tuple:
+    return tuple(getattr(environment, key) for key in WEATHER_KEYS)
+
+
+def test_switching_timestep_redraws_the_weather_from_the_seed():
+    steady, alternating, replayed = Environment(5, START), Environment(5, START), Environment(5, START)
+    for _ in range(3):
+        steady.step(1.0)
+    for environment in (alternating, replayed):
+        for timestep_hours in (1.0, 0.5, 0.5, 1.0):
+            environment.step(timestep_hours)
+
+    # Every switch drew a new block, so the weather follows the sequence of timesteps...
+    assert alternating.current_time == steady.current_time
+    assert _weather(alternating) != _weather(steady)
+    # ...and is reproducible from the seed for that sequence
+    assert _weather(alternating) == _weather(replayed)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def _session(client, seed):
+    return {"X-Session-ID": client.post("/sessions", json={"seed": seed, "start_time": START.isoformat()}).json()["id"]}
+
+
+def test_session_forecast_is_what_the_session_steps_through(client):
+    headers = _session(client, 8)
+    current = client.get("/environment", headers=headers).json()
+    forecast = client.get("/forecast", headers=headers, params={"steps": 6, "total_daily_kwh": 20000}).json()
+    assert forecast["source"] == "session"
+    assert forecast["temperature"][0] == current["temperature"]
+    assert client.get("/environment", headers=headers).json() == current
+
+    for row in range(5):
+        response = client.post("/simulate/realistic", headers=headers,
+                               params={"total_daily_kwh": 20000, "timestep_hours": 1.0}).json()
+        assert response["calculated_demand"] == pytest.approx(forecast["demand"][row])
+        for key in WEATHER_KEYS:
+            assert response["environment_state"][key] == pytest.approx(forecast[key][row + 1]), key
+
+
+def test_sessions_forecast_their_own_weather_unless_a_scenario_is_asked_for(client):
+    first, second = _session(client, 1), _session(client, 2)
+    params = {"steps": 24}
+    assert (client.get("/forecast", headers=first, params=params).json()["wind_speed"] !=
+            client.get("/forecast", headers=second, params=params).json()["wind_speed"])
+
+    params["seed"] = 5
+    scenario = client.get("/forecast", headers=first, params=params).json()
+    assert scenario["source"] == "scenario"
+    assert scenario["wind_speed"] == client.get("/forecast", headers=second, params=params).json()["wind_speed"]
+    expected = ForecastCache().forecast(START, 24, 1.0, seed=5)
+    assert np.allclose(scenario["wind_speed"], expected["wind_speed"])
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+import pickle
+
+import numpy as np
+
+from history_store import HistoryStore
+
+START = datetime(2024, 1, 1)
+
+
+class _Device:
+    def __init__(self, name: str, output: float):
+        self.name = name
+        self.output = output
+
+    def get_power_output(self) -> float:
+        return self.output
+
+
+def test_device_outputs_keep_full_precision(tmp_path):
+    store = HistoryStore(chunk_rows=4, max_memory_chunks=1, spill_dir=str(tmp_path))
+    outputs = [1234567.891 + i / 7 for i in range(10)]
+    for i, output in enumerate(outputs):
+        store.append(START + timedelta(hours=i), {"Demand (kW)": output}, [_Device("gen", output)])
+
+    for history in (store, pickle.loads(pickle.dumps(store))):
+        queried = history.query(devices=["gen"])
+        assert queried["devices"]["gen"].tolist() == outputs
+        assert queried["devices"]["gen"].sum() == queried["columns"]["demand_kw"].sum()
+
+
+def test_float32_outputs_from_older_checkpoints_are_widened():
+    store = HistoryStore()
+    store.append(START, {}, [_Device("gen", 2.5)])
+    chunk = store._chunks[0]
+    chunk.device_outputs = chunk.device_outputs.astype(np.float32)
+
+    restored = pickle.loads(pickle.dumps(store))
+    restored.append(START + timedelta(hours=1), {}, [_Device("gen", 1234567.891)])
+    assert restored._chunks[0].device_outputs.dtype == np.float64
+    assert restored.query(devices=["gen"])["devices"]["gen"].tolist() == [2.5, 1234567.891]
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from environment_simulation import spawn_seeds
+from monte_carlo import METRICS, PERCENTILES, iter_monte_carlo, run_monte_carlo
+
+SITE = [
+    {"type": "SolarPanel", "name": "s1", "rated_power": 300.0},
+    {"type": "WindTurbine", "name": "w1", "rated_power": 200.0, "direction": 220},
+    {"type": "Battery", "name": "b1", "capacity_kwh": 800.0, "max_power_kw": 200.0},
+    {"type": "DieselGenerator", "name": "d1", "rated_power": 500.0},
+]
+RUNS = 6
+HORIZON_STEPS = 48
+OPTIONS = {"start_time": datetime(2024, 6, 1), "total_daily_kwh": 8000.0}
+
+
+def test_percentiles_do_not_depend_on_the_worker_count():
+    serial = run_monte_carlo(SITE, RUNS, HORIZON_STEPS, seed=7, max_workers=1, **OPTIONS)
+    parallel = run_monte_carlo(SITE, RUNS, HORIZON_STEPS, seed=7, max_workers=2, **OPTIONS)
+
+    assert serial["completed_runs"] == RUNS and serial == parallel
+    for metric in METRICS:
+        levels = [serial["metrics"][metric][f"p{p}"] for p in PERCENTILES]
+        assert levels == sorted(levels), metric
+    assert serial["metrics"]["diesel_litres"]["p95"] > serial["metrics"]["diesel_litres"]["p5"]
+
+
+def test_aggregate_is_reported_as_runs_complete():
+    reports = list(iter_monte_carlo(SITE, spawn_seeds(3, RUNS), HORIZON_STEPS, max_workers=2, report_every=2,
+                                    **OPTIONS))
+    assert [report["completed_runs"] for report in reports] == [2, 4, 6]
+    assert all(report["total_runs"] == RUNS for report in reports)
@@ -0,0 +1,77 @@
+import copy
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from benchmarks import build_scenario
+from environment_simulation import Environment
+from power_simulation import (DEVICE_TYPES, Battery, DieselGenerator, GridConnection, MicrogridManager, PowerDevice,
+                              SolarPanel, WindTurbine, build_device)
+
+STEPS = 96
+COLUMNS = ("Demand (kW)", "Renewable Generation (kW)", "Diesel Generation (kW)", "Battery Flow (kW)",
+           "Grid Flow (kW)", "Total Battery SOC (kWh)", "Total Diesel Usage (L/h)", "Total Grid Cost ($)",
+           "Diesel Startup Cost ($)")
+
+
+def _step_through(microgrid: MicrogridManager, demand, timestep_hours: float) -> list:
+    rows = []
+    for demand_kw in demand:
+        rows.append(microgrid.step(float(demand_kw), timestep_hours))
+        microgrid.environment.step(timestep_hours)
+    return rows
+
+
+@pytest.mark.parametrize("strategy", ["demand_following", "battery_charging", "manual", "unit_commitment"])
+@pytest.mark.parametrize("timestep_hours", [1.0, 0.5])
+def test_run_matches_step_then_environment_step(strategy, timestep_hours):
+    environment, microgrid, demand = build_scenario(30, seed=3)
+    microgrid.set_diesel_strategy(strategy)
+    microgrid.diesel_setpoints = {gen.name: 0.4 * gen.rated_power for gen in microgrid.diesel_generators}
+    demand = demand.series(environment.current_time, STEPS, timestep_hours)
+    stepped = copy.deepcopy(microgrid)
+
+    results = microgrid.run(STEPS, demand, timestep_hours)
+    rows = _step_through(stepped, demand, timestep_hours)
+
+    assert results["Time"] == [row["Time"] for row in rows]
+    for column in COLUMNS:
+        assert np.allclose(results[column], [row[column] for row in rows], rtol=1e-9, atol=1e-9), column
+    assert microgrid.environment.current_time == stepped.environment.current_time
+    assert microgrid.environment.wind_speed == stepped.environment.wind_speed
+    for ours, theirs in zip(microgrid.devices, stepped.devices):
+        assert ours.get_power_output() == pytest.approx(theirs.get_power_output(), abs=1e-9), ours.name
+        if isinstance(ours, Battery):
+            assert ours.state_of_charge == pytest.approx(theirs.state_of_charge, abs=1e-9)
+
+
+def test_run_balances_demand_and_respects_battery_limits():
+    environment = Environment(5, datetime(2024, 6, 1))
+    battery = Battery("battery", capacity_kwh=200, max_power_kw=50, initial_charge=0.2)
+    microgrid = MicrogridManager(environment, [
+        SolarPanel("solar", rated_power=400), battery,
+        DieselGenerator("diesel", rated_power=150), GridConnection("grid", import_price=0.3, export_price=0.05),
+    ])
+    demand = np.random.default_rng(0).uniform(50, 300, STEPS)
+    results = microgrid.run(STEPS, demand, 0.5)
+
+    supplied = (results["Renewable Generation (kW)"] + results["Diesel Generation (kW)"] +
+                results["Battery Flow (kW)"] + results["Grid Flow (kW)"])
+    assert np.allclose(supplied, demand)
+    assert np.all(np.abs(results["Battery Flow (kW)"]) <= battery.max_power_kw + 1e-9)
+    soc = results["Total Battery SOC (kWh)"]
+    assert np.all((soc >= 0) & (soc <= battery.capacity_kwh))
+    assert soc[-1] == pytest.approx(battery.state_of_charge)
+
+
+def test_every_device_type_rebuilds_from_its_config():
+    devices = [WindTurbine("wind", 300, 90, cut_in_speed=2.5), SolarPanel("solar", 120, stc_temp=20.0),
+               DieselGenerator("diesel", 200, min_load_fraction=0.3, startup_cost=12.0),
+               GridConnection("grid", 0.3, 0.05), Battery("battery", 400, 100, efficiency=0.81, initial_charge=0.25)]
+    assert {type(device).__name__ for device in devices} == set(DEVICE_TYPES)
+    for device in devices:
+        rebuilt = build_device(device.to_config())
+        assert type(rebuilt) is type(device) and rebuilt.to_config() == pytest.approx(device.to_config())
+    with pytest.raises(TypeError):
+        PowerDevice("abstract")
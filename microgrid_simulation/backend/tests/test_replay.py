@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+import pickle
+
+import numpy as np
+import pytest
+
+from power_simulation import MicrogridManager, build_device
+from replay import RecordedSeries, ReplayEnvironment, ReplayDemand, replay
+
+START = datetime(2024, 1, 1)
+SITE = [
+    {"type": "SolarPanel", "name": "s1", "rated_power": 200.0},
+    {"type": "Battery", "name": "b1", "capacity_kwh": 400.0, "max_power_kw": 100.0},
+    {"type": "GridConnection", "name": "g1", "import_price": 0.3, "export_price": 0.1},
+]
+
+
+def _recording(hours: int) -> dict:
+    rng = np.random.default_rng(0)
+    times = np.datetime64(START, "us") + np.arange(hours) * np.timedelta64(1, "h")
+    return {
+        "time": times,
+        "ghi": np.round(rng.uniform(0, 900, hours), 1),
+        "temp": np.round(rng.uniform(5, 35, hours), 1),
+        "wind": np.round(rng.uniform(0, 15, hours), 1),
+        "kw": np.round(rng.uniform(100, 300, hours), 1),
+    }
+
+
+def _write_csv(path, data: dict):
+    with open(path, "w") as f:
+        f.write(",".join(data) + "\n")
+        for row in zip(*data.values()):
+            f.write(",".join(str(value) for value in row) + "\n")
+
+
+def _write_parquet(path, data: dict, row_group_size: int = 100):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    pq.write_table(pa.table(data), path, row_group_size=row_group_size)
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def recording(request, tmp_path):
+    data = _recording(48)
+    path = str(tmp_path / f"site.{request.param}")
+    (_write_csv if request.param == "csv" else _write_parquet)(path, data)
+    return path, data
+
+
+def _replay_site(path: str, chunk_rows: int = 16):
+    weather = RecordedSeries(path, {"solar_radiation": "ghi", "temperature": "temp", "wind_speed": "wind"},
+                             chunk_rows=chunk_rows)
+    environment = ReplayEnvironment(weather, seed=1)
+    microgrid = MicrogridManager(environment, [build_device(config) for config in SITE])
+    demand = ReplayDemand(RecordedSeries(path, {"demand_kw": "kw"}, chunk_rows=chunk_rows))
+    return environment, microgrid, demand
+
+
+def test_replays_a_whole_recording(recording):
+    path, data = recording
+    environment, microgrid, demand = _replay_site(path)
+
+    chunks = list(replay(microgrid, demand, steps=48, chunk_steps=10))
+
+    assert sum(len(chunk["Demand (kW)"]) for chunk in chunks) == 48
+    assert np.allclose(np.concatenate([chunk["Demand (kW)"] for chunk in chunks]), data["kw"])
+    assert environment.current_time == START + timedelta(hours=48)
+    with pytest.raises(ValueError, match="ends at"):
+        microgrid.run(1, [200.0], 1.0)
+
+
+def test_short_recording_steps_to_its_last_row(recording):
+    path, data = recording
+    environment, _, _ = _replay_site(path)
+    temperatures = [environment.temperature]
+    for _ in range(47):
+        environment.step(1.0)
+        temperatures.append(environment.temperature)
+    assert temperatures == list(data["temp"])
+    with pytest.raises(ValueError, match="ends at"):
+        environment.step(1.0)
+
+
+def test_forecast_may_look_past_the_end(recording):
+    path, data = recording
+    environment, _, demand = _replay_site(path)
+    environment.advance(40, 1.0)
+    weather = environment.forecast(24, 1.0)
+    assert np.allclose(weather["temperature"][:8], data["temp"][40:])
+    assert np.all(weather["temperature"][8:] == data["temp"][-1])
+    assert np.all(demand(environment.current_time, 24, 1.0)[8:] == data["kw"][-1])
+
+
+def test_sample_interpolates_rewinds_and_survives_pickling(tmp_path):
+    data = _recording(300)
+    path = str(tmp_path / "site.csv")
+    _write_csv(path, data)
+    series = RecordedSeries(path, {"temperature": "temp"}, chunk_rows=32)
+
+    half_hours = np.datetime64(START, "us") + np.arange(0, 500) * np.timedelta64(30, "m")
+    expected = np.interp(np.arange(500) / 2, np.arange(300), data["temp"])
+    assert np.allclose(series.sample(half_hours[400:])["temperature"], expected[400:])
+    # Earlier than the buffered chunks: read again from the start
+    assert np.allclose(series.sample(half_hours[:50])["temperature"], expected[:50])
+
+    series.sample(half_hours[200:210])
+    resumed = pickle.loads(pickle.dumps(series))
+    assert np.allclose(resumed.sample(half_hours[210:260])["temperature"], expected[210:260])
+    with pytest.raises(ValueError, match="ends at"):
+        resumed.sample([np.datetime64(START, "us") + np.timedelta64(300, "h")])
+
+
+def test_job_replays_a_month_to_its_last_hour(tmp_path):
+    from jobs import build_job_state, run_job_chunk
+    path = str(tmp_path / "month.csv")
+    _write_csv(path, _recording(30 * 24))
+    recording = {"path": path, "columns": {"solar_radiation": "ghi", "temperature": "temp"}}
+    state = build_job_state({"start_time": None, "devices": SITE, "seed": 2,
+                             "replay": {"weather": recording, "demand": {"path": path, "columns": {"demand_kw": "kw"}}}})
+    for _ in range(30):
+        state, results = run_job_chunk(state, 24, 1.0)
+    assert state[0].current_time == START + timedelta(days=30)
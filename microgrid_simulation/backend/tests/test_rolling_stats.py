@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from rolling_stats import ROLLING_METRICS, RollingStats, _Extremum
+
+WINDOWS = {"1h": 1, "6h": 6, "24h": 24}
+START = datetime(2024, 1, 1)
+
+
+def _brute_force(steps: list, hours: float) -> dict:
+    """
+    Window aggregates recomputed from scratch over the steps since the last clock reset.
+    A step longer than the window leaves it empty.
+    """
+    latest_end = steps[-1][0] + timedelta(hours=steps[-1][1])
+    kept = [step for step in steps if step[0] >= latest_end - timedelta(hours=hours)]
+    duration = sum(timestep for _, timestep, _ in kept)
+    metrics = {}
+    for name, kind in ROLLING_METRICS.values():
+        values = [values[name] for _, _, values in kept]
+        weighted = sum(value * timestep for (_, timestep, _), value in zip(kept, values))
+        entry = {"mean": weighted / duration if kept else 0.0,
+                 "min": min(values, default=None), "max": max(values, default=None)}
+        if kind == "rate":
+            entry["total"] = weighted
+        elif kind == "amount":
+            entry["total"] = sum(values)
+        metrics[name] = entry
+    return {"window_hours": hours, "covered_hours": duration, "steps": len(kept), "metrics": metrics}
+
+
+def test_windows_match_a_brute_force_recomputation():
+    rng = np.random.default_rng(1)
+    stats = RollingStats(WINDOWS)
+    steps = []
+    clock = START
+    for i in range(600):
+        if i in (250, 420):
+            # Set the clock back: every window starts over
+            clock -= timedelta(hours=30)
+            steps = []
+        timestep = float(rng.choice([0.25, 0.5, 1.0, 2.0]))
+        results = {key: float(rng.normal(100, 50)) for key in ROLLING_METRICS}
+        stats.add(clock, results, timestep)
+        steps.append((clock, timestep, {name: results[key] for key, (name, _) in ROLLING_METRICS.items()}))
+        clock += timedelta(hours=timestep)
+
+        for label, hours in WINDOWS.items():
+            actual, expected = stats.window(label), _brute_force(steps, hours)
+            assert actual["steps"] == expected["steps"]
+            assert actual["covered_hours"] == pytest.approx(expected["covered_hours"])
+            for name, entry in expected["metrics"].items():
+                assert actual["metrics"][name] == pytest.approx(entry, rel=1e-9, abs=1e-6), (i, label, name)
+    assert len(stats) == 600
+
+
+def test_gaps_empty_the_window():
+    stats = RollingStats({"1h": 1})
+    stats.add(START, {"Demand (kW)": 5.0}, 0.5)
+    stats.add(START + timedelta(hours=3), {"Demand (kW)": 7.0}, 0.5)
+    window = stats.window("1h")
+    assert window["steps"] == 1
+    assert window["metrics"]["demand_kw"] == {"mean": 7.0, "min": 7.0, "max": 7.0, "total": 3.5}
+
+
+@pytest.mark.parametrize("is_max", [False, True])
+def test_monotonic_queue_tracks_the_sliding_extremum(is_max):
+    rng = np.random.default_rng(2)
+    values = rng.integers(0, 20, 500).astype(float)  # Repeats exercise ties
+    width = 7
+    extremum = _Extremum(is_max)
+    reduce = max if is_max else min
+    for seq, value in enumerate(values):
+        extremum.push(seq, value)
+        if seq >= width:
+            extremum.evict(seq - width)
+        assert extremum.value == reduce(values[max(0, seq - width + 1):seq + 1])
+        assert len(extremum._queue) <= width
+    assert _Extremum(is_max).value is None
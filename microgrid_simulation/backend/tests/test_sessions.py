@@ -0,0 +1,124 @@
+from datetime import datetime
+import os
+import pickle
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import unified_api
+from checkpoint import Checkpointer, read_checkpoint
+from sessions import DEFAULT_SESSION_ID, Session, SessionLimitError, SessionManager
+from unified_api import app
+
+START = datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def _blocked_until_released(lock, action):
+    """Start action while holding lock; check it is still waiting, then let it finish"""
+    with lock:
+        thread = threading.Thread(target=action)
+        thread.start()
+        time.sleep(0.2)
+        assert thread.is_alive()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+
+
+def test_checkpoints_wait_for_changes_in_progress(tmp_path):
+    session = Session.create("s", seed=1, start_time=START)
+    path = str(tmp_path / "session.ckpt")
+    checkpointer = Checkpointer(path, session.state, state_lock=session.lock)
+    with session.lock:
+        thread = threading.Thread(target=checkpointer.save)
+        thread.start()
+        time.sleep(0.2)
+        assert not os.path.exists(path)
+        # Still mid-change: the save must not see this step until it is complete
+        session.environment.step(1.0)
+    thread.join(timeout=10)
+    state, _ = read_checkpoint(path)
+    assert state["environment"].current_time == session.environment.current_time
+
+
+def test_simulation_requests_hold_the_session_lock(client):
+    session_id = client.post("/sessions", json={"seed": 3, "start_time": START.isoformat()}).json()["id"]
+    session = unified_api.session_manager.get(session_id)
+    responses = []
+
+    def step():
+        responses.append(client.post("/simulate/realistic", headers={"X-Session-ID": session_id}))
+    _blocked_until_released(session.lock, step)
+    assert responses[0].status_code == 200
+    assert session.environment.current_time == datetime(2024, 3, 1, 1)
+
+
+def _sessions(manager, count: int) -> list:
+    return [manager.add(Session.create(f"s{i}", seed=i, start_time=START)) for i in range(count)]
+
+
+def test_sessions_are_refused_not_dropped_without_a_park_dir():
+    manager = SessionManager(max_sessions=3)
+    manager.add(Session.create(DEFAULT_SESSION_ID), pinned=True)
+    kept = _sessions(manager, 2)
+    with pytest.raises(SessionLimitError):
+        manager.add(Session.create("extra"))
+    assert manager.list()[1:] == kept
+    manager.remove("s0")
+    manager.add(Session.create("extra"))
+
+
+def test_api_refuses_sessions_over_the_limit(client, monkeypatch):
+    monkeypatch.setattr(unified_api.session_manager, "max_sessions", len(unified_api.session_manager))
+    response = client.post("/sessions", json={})
+    assert response.status_code == 503 and "MICROGRID_SESSION_DIR" in response.json()["detail"]
+
+
+def test_sessions_in_use_are_not_parked(tmp_path):
+    manager = SessionManager(max_sessions=2, checkpoint_dir=str(tmp_path))
+    manager.add(Session.create(DEFAULT_SESSION_ID), pinned=True)
+    (first,) = _sessions(manager, 1)
+    held = manager.hold("s0")
+    manager.add(Session.create("s1"))
+    assert held is first and [session.id for session in manager.list()] == [DEFAULT_SESSION_ID, "s0", "s1"]
+
+    held.environment.step(1.0)  # A change made by the request still in flight
+    manager.release(held)
+    assert manager.parked_ids() == ["s0"]
+    restored = manager.get("s0")
+    assert restored.environment.current_time == first.environment.current_time
+    assert restored.created_at == first.created_at
+
+
+def test_created_at_survives_state_round_trips():
+    session = Session.create("s", seed=1, start_time=START)
+    copy = Session.from_state("s", pickle.loads(pickle.dumps(session.state())))
+    assert copy.created_at == session.created_at
+
+
+def test_status_is_built_and_tagged_under_the_session_lock(client):
+    session_id = client.post("/sessions", json={"seed": 4, "start_time": START.isoformat()}).json()["id"]
+    headers = {"X-Session-ID": session_id}
+    session = unified_api.session_manager.get(session_id)
+    responses = []
+
+    def status():
+        responses.append(client.get("/", headers=headers))
+    with session.lock:
+        thread = threading.Thread(target=status)
+        thread.start()
+        time.sleep(0.2)
+        # A change the status request must not interleave with
+        session.environment.step(1.0)
+    thread.join(timeout=10)
+    response = responses[0]
+    assert response.json()["timestamp"] == datetime(2024, 3, 1, 1).isoformat()
+    assert response.headers["ETag"].split("-")[-2] == str(session.environment.state_version)
+    assert client.get("/", headers=dict(headers, **{"If-None-Match": response.headers["ETag"]})).status_code == 304
@@ -0,0 +1,141 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from sharding import _serve, create_app
+from metrics import merge_text
+
+SITE = [
+    {"type": "SolarPanel", "name": "s1", "rated_power": 300.0},
+    {"type": "Battery", "name": "b1", "capacity_kwh": 500.0, "max_power_kw": 100.0},
+    {"type": "GridConnection", "name": "g1", "import_price": 0.3, "export_price": 0.1},
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(create_app(2)) as client:
+        yield client
+
+
+def _wait_for_job(client, job_id, headers, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}", headers=headers).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+
+def test_job_runs_end_to_end_through_coordinator(client):
+    session = client.post("/sessions", json={"seed": 1}).json()
+    headers = {"X-Session-ID": session["id"]}
+    submitted = client.post("/jobs", headers=headers,
+                            json={"horizon_steps": 48, "seed": 3, "devices": SITE}).json()
+
+    job = _wait_for_job(client, submitted["id"], headers)
+    assert job["status"] == "completed", job["error"]
+    results = client.get(f"/jobs/{job['id']}/results", headers=headers).json()["results"]
+    assert len(results["Demand (kW)"]) == 48
+
+
+def test_migration_only_holds_back_the_moving_session(client):
+    moving = client.post("/sessions", json={}).json()["id"]
+    other = client.post("/sessions", json={}).json()["id"]
+    coordinator = client.app.state.coordinator
+    finished = threading.Event()
+
+    def request_moving_session():
+        client.get("/environment", headers={"X-Session-ID": moving})
+        finished.set()
+
+    with coordinator.routed(moving):
+        waiter = threading.Thread(target=request_moving_session)
+        waiter.start()
+        assert client.get("/environment", headers={"X-Session-ID": other}).status_code == 200
+        assert client.get("/shards").status_code == 200
+        assert not finished.wait(0.5)
+    waiter.join(30)
+    assert finished.is_set()
+
+
+def test_migrated_session_keeps_its_state(client):
+    session_id = client.post("/sessions", json={"seed": 5}).json()["id"]
+    headers = {"X-Session-ID": session_id}
+    client.post("/step", headers=headers)
+    before = client.get("/environment", headers=headers).json()
+    worker = client.app.state.coordinator.worker_for(session_id).index
+
+    moved = client.post("/shards/migrate", params={"session_id": session_id, "worker": 1 - worker}).json()
+    assert moved["to_worker"] == 1 - worker and moved["snapshot_bytes"] > 0
+    assert client.get("/environment", headers=headers).json() == before
+
+
+def test_worker_answers_other_requests_while_one_is_slow():
+    release = threading.Event()
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        return {"released": release.wait(30)}
+
+    @app.get("/fast")
+    def fast():
+        return {}
+
+    conn, worker_conn = multiprocessing.Pipe()
+    worker = threading.Thread(target=asyncio.run, args=(_serve(worker_conn, SimpleNamespace(app=app), None),))
+    worker.start()
+    try:
+        conn.send(("slow", "request", ("GET", "/slow", b"", [], b"")))
+        conn.send(("fast", "request", ("GET", "/fast", b"", [], b"")))
+        assert conn.poll(30) and conn.recv()[:2] == ("fast", "ok")
+        release.set()
+        request_id, status, (code, _, body) = conn.recv()
+        assert (request_id, status, code, body) == ("slow", "ok", 200, b'{"released":true}')
+    finally:
+        release.set()
+        conn.send((None, "stop", ()))
+        worker.join(30)
+
+
+def test_failed_import_leaves_the_session_on_its_worker(client):
+    session_id = client.post("/sessions", json={"seed": 6}).json()["id"]
+    headers = {"X-Session-ID": session_id}
+    client.post("/step", headers=headers)
+    before = client.get("/environment", headers=headers).json()
+    coordinator = client.app.state.coordinator
+    source = coordinator.worker_for(session_id).index
+    destination = coordinator.workers[1 - source]
+    # A session of the same ID already on the destination makes its import fail
+    destination.call("import", session_id, coordinator.workers[source].call("export", session_id))
+
+    response = client.post("/shards/migrate", params={"session_id": session_id, "worker": 1 - source})
+    assert response.status_code == 502
+    assert coordinator.worker_for(session_id).index == source
+    assert client.get("/environment", headers=headers).json() == before
+    destination.call("remove", session_id)
+
+
+def test_metrics_are_summed_across_workers(client):
+    coordinator = client.app.state.coordinator
+    for worker in coordinator.workers:
+        coordinator.request(worker, "GET", "/health", b"", [], b"")
+    text = client.get("/metrics").text
+    line = next(line for line in text.splitlines()
+                if line.startswith('microgrid_http_requests_total{method="GET",route="/health",status="200"}'))
+    assert float(line.rsplit(" ", 1)[1]) >= len(coordinator.workers)
+
+
+def test_merge_text_sums_equal_series():
+    first = "# HELP c Requests.\n# TYPE c counter\nc{route=\"/a b\"} 2.0\nh_bucket{le=\"+Inf\"} 3\n"
+    second = "# HELP c Requests.\n# TYPE c counter\nc{route=\"/a b\"} 1.5\nc{route=\"/x\"} 1.0\n"
+    assert merge_text([first, second]).splitlines() == [
+        "# HELP c Requests.", "# TYPE c counter", 'c{route="/a b"} 3.5', 'h_bucket{le="+Inf"} 3', 'c{route="/x"} 1.0']
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from power_simulation import WindTurbine
+from site_config import build_devices, load_site_config
+from unified_api import app
+
+INVALID = [
+    ({"type": "Battery", "name": "b", "capacity_kwh": 0, "max_power_kw": 10}, "Capacity must be positive"),
+    ({"type": "Battery", "name": "b", "capacity_kwh": 10, "max_power_kw": 0}, "Max power must be positive"),
+    ({"type": "Battery", "name": "b", "capacity_kwh": 10, "max_power_kw": 5, "efficiency": 3}, "Efficiency"),
+    ({"type": "Battery", "name": "b", "capacity_kwh": 10, "max_power_kw": 5, "initial_charge": -0.1},
+     "Initial charge"),
+    ({"type": "GridConnection", "name": "g", "import_price": -1, "export_price": 0.1}, "Import price"),
+    ({"type": "GridConnection", "name": "g", "import_price": 0.3, "export_price": -0.1}, "Export price"),
+    ({"type": "WindTurbine", "name": "w", "rated_power": 100, "direction": 400}, "Direction"),
+    ({"type": "SolarPanel", "name": 123, "rated_power": 100}, "name must be a string"),
+]
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def session(client):
+    return {"X-Session-ID": client.post("/sessions", json={}).json()["id"]}
+
+
+@pytest.mark.parametrize("config, message", INVALID)
+def test_build_devices_applies_the_single_add_checks(config, message):
+    with pytest.raises(ValueError, match=message):
+        build_devices([config])
+
+
+@pytest.mark.parametrize("config, message", INVALID)
+def test_bulk_add_rejects_what_single_add_rejects(client, session, config, message):
+    response = client.post("/devices/bulk", headers=session, json={"devices": [config]})
+    assert response.status_code == 400 and message in response.json()["detail"]
+    assert client.get("/devices", headers=session).json()["devices"] == []
+    assert client.get("/", headers=session).status_code == 200
+
+
+def test_single_add_and_bulk_share_messages(client, session):
+    response = client.post("/add/battery", headers=session,
+                           json={"name": "b", "capacity_kwh": 0, "max_power_kw": 10})
+    assert response.status_code == 400 and response.json()["detail"] == "Capacity must be positive"
+
+
+def test_bulk_wind_turbine_uses_the_single_add_defaults(client, session):
+    response = client.post("/devices/bulk", headers=session,
+                           json={"devices": [{"type": "WindTurbine", "name": "w", "rated_power": 100, "direction": 90}]})
+    assert response.status_code == 200
+    (turbine,) = build_devices([{"type": "WindTurbine", "name": "w", "rated_power": 100, "direction": 90}])
+    assert isinstance(turbine, WindTurbine)
+    assert (turbine.cut_in_speed, turbine.rated_speed, turbine.cut_out_speed) == (3.0, 12.0, 25.0)
+
+
+def test_every_invalid_entry_is_reported(tmp_path):
+    path = tmp_path / "site.json"
+    path.write_text(json.dumps({"devices": [config for config, _ in INVALID[:3]]}))
+    with pytest.raises(ValueError) as error:
+        build_devices(load_site_config(str(path))["devices"])
+    assert [part.split(":")[0] for part in str(error.value).split("; ")] == ["devices[0]", "devices[1]", "devices[2]"]
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import streaming
+from streaming import StepStream
+
+
+def _parse(event: str):
+    name, data = event.strip().split("\n")
+    return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def _apply(state: dict, message: dict):
+    """Update a client's copy of the state from one stream message"""
+    if message["type"] == "snapshot":
+        state.clear()
+        state.update({"environment": message["environment"], "devices": message["devices"]})
+        return
+    state["environment"].update(message["environment"])
+    for name, fields in message["devices"].items():
+        state["devices"].setdefault(name, {}).update(fields)
+    for name in message["removed"]:
+        del state["devices"][name]
+
+
+def test_client_that_falls_behind_is_resynced_with_the_full_state(monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_MAX_PENDING", 5)
+    site = {"step": 0}
+
+    def describe_state():
+        step = site["step"]
+        devices = {f"d{i}": {"output": step * i} for i in range(3) if i != step % 3}
+        return {"environment": {"time": step, "clouds": step // 4}, "devices": devices}
+
+    async def follow() -> dict:
+        stream = StepStream(describe_state, batch_interval=0)
+        events = stream.events()
+        name, state = _parse(await events.__anext__())
+        assert name == "snapshot"
+        for _ in range(12):
+            site["step"] += 1
+            stream.publish({"step": site["step"]})
+        await asyncio.sleep(0)
+        name, batch = _parse(await events.__anext__())
+        await events.aclose()
+        assert name == "steps" and batch[0]["type"] == "snapshot" and len(batch) < 12
+        for message in batch:
+            _apply(state, message)
+        return state
+
+    assert asyncio.run(follow()) == describe_state()
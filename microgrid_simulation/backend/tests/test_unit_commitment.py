@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from power_simulation import DieselGenerator
+from unit_commitment import UnitCommitment
+
+TIMESTEP_HOURS = 0.5
+
+
+def _fleet(rng, count: int) -> list:
+    return [DieselGenerator(f"gen{i}", rated_power=float(rng.choice([50, 100, 250])),
+                            diesel_usage_litre_per_kw=float(rng.uniform(0.2, 0.4)),
+                            min_load_fraction=float(rng.choice([0.0, 0.3])),
+                            min_up_time_hours=float(rng.choice([0.0, 1.0, 3.0])),
+                            min_down_time_hours=float(rng.choice([0.0, 0.5, 2.0])),
+                            startup_cost=float(rng.uniform(0, 20)))
+            for i in range(count)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_dispatch_honours_commitment_constraints(seed):
+    rng = np.random.default_rng(seed)
+    generators = _fleet(rng, 8)
+    by_name = {gen.name: gen for gen in generators}
+    commitment = UnitCommitment(generators)
+    started_at = {gen.name: -np.inf for gen in generators}
+    stopped_at = {gen.name: -np.inf for gen in generators}
+    online = set()
+    # Slow swings with noise, sometimes beyond the fleet's capacity
+    required = 600 + 500 * np.sin(np.arange(400) / 15) + rng.normal(0, 150, 400)
+
+    for step, required_kw in enumerate(required):
+        clock = step * TIMESTEP_HOURS
+        generation, fuel, startup_cost = commitment.dispatch(required_kw, TIMESTEP_HOURS)
+        now_online = set(commitment.online)
+
+        for name in now_online - online:
+            assert clock - stopped_at[name] >= by_name[name].min_down_time_hours - 1e-9, name
+            started_at[name] = clock
+        for name in online - now_online:
+            assert clock - started_at[name] >= by_name[name].min_up_time_hours - 1e-9, name
+            stopped_at[name] = clock
+        assert startup_cost == pytest.approx(sum(by_name[name].startup_cost for name in now_online - online))
+        online = now_online
+
+        # Running units sit between minimum load and rated power, in merit order
+        running = [by_name[name] for name in commitment.online]
+        assert [gen.diesel_usage_litre_per_kw for gen in running] == sorted(
+            gen.diesel_usage_litre_per_kw for gen in running)
+        extra = [gen.power_output - gen.rated_power * gen.min_load_fraction for gen in running]
+        headroom = [gen.rated_power * (1 - gen.min_load_fraction) for gen in running]
+        assert all(-1e-9 <= e <= h + 1e-9 for e, h in zip(extra, headroom))
+        partial = [i for i, (e, h) in enumerate(zip(extra, headroom)) if 1e-9 < e < h - 1e-9]
+        assert len(partial) <= 1
+        assert all(e >= h - 1e-9 for e, h in zip(extra[:partial[0]], headroom)) if partial else True
+        assert all(gen.power_output == 0.0 for gen in generators if gen.name not in online)
+
+        capacity = sum(gen.rated_power for gen in running)
+        min_load = sum(gen.rated_power * gen.min_load_fraction for gen in running)
+        assert generation == pytest.approx(min(capacity, max(required_kw, 0.0, min_load)))
+        assert fuel == pytest.approx(sum(gen.get_diesel_usage() for gen in generators))
+        assert commitment.online_capacity == pytest.approx(capacity)
+        if capacity < required_kw:
+            # Every idle unit is still in its minimum down time
+            idle = [gen for gen in generators if gen.name not in online]
+            assert all(clock - stopped_at[gen.name] < gen.min_down_time_hours for gen in idle)
+    assert commitment.total_startup_cost > 0
+
+
+def test_removed_units_are_never_started():
+    generators = _fleet(np.random.default_rng(9), 4)
+    commitment = UnitCommitment(generators)
+    commitment.dispatch(10_000, TIMESTEP_HOURS)
+    commitment.remove(generators[0].name)
+    commitment.remove(generators[1].name)
+    commitment.reset()
+    commitment.dispatch(10_000, TIMESTEP_HOURS)
+    assert sorted(commitment.online) == sorted(gen.name for gen in generators[2:])
+    assert commitment.online_capacity == pytest.approx(sum(gen.rated_power for gen in generators[2:]))
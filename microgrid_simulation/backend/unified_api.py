@@ -1,21 +1,51 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional
+from typing import Iterator, Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import partial, wraps
+import hmac
+import os
+import threading
+import uuid
 from simulation_instances import (
-    get_environment_instance,
-    get_microgrid_instance,
-    get_historical_data,
+    get_session_manager,
+    get_checkpointer,
+    get_forecast_cache,
 )
 
 # Import from your actual code structure
 from power_simulation import (
     WindTurbine, SolarPanel, DieselGenerator,
-    get_realistic_demand, GridConnection, Battery
+    get_realistic_demand, GridConnection, Battery, DIESEL_STRATEGIES, expected_demand
 )
-
-app = FastAPI(title="Unified Microgrid Management API", version="2.0.0")
+from sweep import run_sweep
+from jobs import JobManager
+from streaming import StepStream
+from site_config import apply_site_config
+from encoding import JSON, negotiate, encode
+from checkpoint import read_checkpoint
+from sessions import Session, SessionLimitError, DEFAULT_SESSION_ID
+from metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware
+from profiler import SamplingProfiler, PROFILE_FORMATS
+from forecasting import FORECAST_MAX_STEPS, session_forecast
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run periodic checkpoints while serving; on shutdown, stop jobs and save a final one"""
+    checkpointer = get_checkpointer()
+    if checkpointer is not None:
+        checkpointer.start()
+    yield
+    job_manager.shutdown()
+    if checkpointer is not None:
+        checkpointer.stop()
+        checkpointer.save()
+
+app = FastAPI(title="Unified Microgrid Management API", version="2.0.0", lifespan=lifespan)
 
 # Enable CORS for local dashboard
 app.add_middleware(
@@ -25,6 +55,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-route request counts and latencies for /metrics; MICROGRID_METRICS=0 leaves it out
+if REGISTRY.enabled:
+    app.add_middleware(MetricsMiddleware)
+
+REALISTIC_STEP_SECONDS = REGISTRY.histogram(
+    "microgrid_realistic_step_phase_seconds", "Time spent in each phase of POST /simulate/realistic.", ("phase",))
 
 # Pydantic models for request/response
 class WindTurbineRequest(BaseModel):
@@ -45,6 +81,10 @@ class DieselGeneratorRequest(BaseModel):
     name: str
     rated_power: float
     diesel_usage_litre_per_kw: float = 0.4
+    min_load_fraction: float = 0.0
+    min_up_time_hours: float = 0.0
+    min_down_time_hours: float = 0.0
+    startup_cost: float = 0.0
 
 class BatteryRequest(BaseModel):
     name: str
@@ -72,12 +112,82 @@ class EnvironmentUpdateRequest(BaseModel):
 class DieselSetpointRequest(BaseModel):
     setpoint_kw: float
 
-# Get global instances
-environment = get_environment_instance()
-microgrid = get_microgrid_instance()
+class SweepRequest(BaseModel):
+    horizon_steps: int = 8760
+    timestep_hours: float = 1.0
+    total_daily_kwh: float = 50000.0
+    seed: Optional[int] = None
+    start_time: Optional[datetime] = None
+    # Device configs present in every combination; defaults to the current site's devices
+    base_devices: Optional[List[dict]] = None
+    solar_panel_rated_power: float = 100.0
+    battery_capacity_kwh: Optional[List[float]] = None
+    battery_max_power_kw: Optional[List[float]] = None
+    solar_panel_count: Optional[List[int]] = None
+    diesel_rated_power: Optional[List[float]] = None
+    diesel_strategy: Optional[List[str]] = None
+
+class JobRequest(BaseModel):
+    horizon_steps: int
+    timestep_hours: float = 1.0
+    total_daily_kwh: float = 50000.0
+    seed: Optional[int] = None
+    # Defaults to the current environment time, site devices and diesel strategy
+    start_time: Optional[datetime] = None
+    devices: Optional[List[dict]] = None
+    diesel_strategy: Optional[str] = None
+    # Recorded weather and/or demand to replay instead of the synthetic profiles, e.g.
+    # {"weather": {"path": "site.parquet", "columns": {"solar_radiation": "ghi"}, "time_column": "ts"}}.
+    # Paths are relative to MICROGRID_REPLAY_DIR; start_time defaults to the recording's start.
+    replay: Optional[dict] = None
+
+class BulkDevicesRequest(BaseModel):
+    # Device config dicts as accepted by build_device, e.g. {"type": "SolarPanel", "name": ..., ...}
+    devices: List[dict]
+    diesel_strategy: Optional[str] = None
+
+class SessionRequest(BaseModel):
+    seed: Optional[int] = None
+    start_time: Optional[datetime] = None
+    # Optional site config: {"devices": [...], "diesel_strategy": ...}, as for /devices/bulk
+    site: Optional[dict] = None
 
-def _env_state():
+# Get global instances
+session_manager = get_session_manager()
+job_manager = JobManager()
+forecast_cache = get_forecast_cache()
+
+def current_session(x_session_id: Optional[str] = Header(default=None),
+                    session_id: Optional[str] = Query(default=None)) -> Iterator[Session]:
+    """
+    The session a request addresses: the X-Session-ID header, or the session_id query
+    parameter for clients that cannot set headers (EventSource). Neither means the default.
+    """
+    requested = x_session_id or session_id or DEFAULT_SESSION_ID
+    try:
+        session = session_manager.hold(requested)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Session '{requested}' not found")
+    # Not evicted (and its changes lost) while the request is being served
+    try:
+        yield session
+    finally:
+        session_manager.release(session)
+
+def _locked(endpoint):
+    """
+    Run a sync endpoint holding its session's lock, so that checkpoints and other requests
+    never see the simulation half-way through the change it makes
+    """
+    @wraps(endpoint)
+    def locked(*args, session: Session, **kwargs):
+        with session.lock:
+            return endpoint(*args, session=session, **kwargs)
+    return locked
+
+def _env_state(session: Session):
     """Get current environment state"""
+    environment = session.environment
     return {
         "time": environment.current_time.strftime("%d %B %Y %H:%M"),
         "timestamp": environment.current_time.isoformat(),
@@ -93,128 +203,227 @@ def _set_if_exists(obj, attr, value):
     if hasattr(obj, attr) and value is not None:
         setattr(obj, attr, value)
 
+def _negotiate(accept: Optional[str], tabular: bool = False) -> str:
+    """Response media type for an Accept header; 406 if none can be produced"""
+    try:
+        return negotiate(accept, tabular=tabular)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+def _encoded_response(payload: dict, accept: Optional[str], table: dict = None, metadata: dict = None) -> Response:
+    """
+    payload as JSON (default), MessagePack or, for tabular endpoints that pass `table`,
+    an Arrow IPC stream. NumPy arrays in payload are written without conversion.
+    """
+    media_type = _negotiate(accept, tabular=table is not None)
+    return Response(content=encode(payload, media_type, table, metadata), media_type=media_type,
+                    headers={"Vary": "Accept"})
+
+def _device_info(device, session: Session) -> dict:
+    """Summary of one device as reported by the dashboard endpoints"""
+    device_info = {
+        "name": device.name,
+        "type": device.__class__.__name__,
+        "power_output": device.get_power_output()
+    }
+
+    if isinstance(device, WindTurbine):
+        device_info.update({
+            "rated_power": device.rated_power,
+            "direction": device.direction,
+            "cut_in_speed": device.cut_in_speed,
+            "rated_speed": device.rated_speed,
+            "cut_out_speed": device.cut_out_speed
+        })
+    elif isinstance(device, SolarPanel):
+        device_info.update({
+            "rated_power": device.rated_power,
+            "temp_coefficient": device.temp_coefficient,
+            "stc_temp": device.stc_temp
+        })
+    elif isinstance(device, DieselGenerator):
+        device_info.update({
+            "rated_power": device.rated_power,
+            "diesel_usage_litre_per_kw": device.diesel_usage_litre_per_kw,
+            "current_diesel_usage": device.get_diesel_usage(),
+            "manual_setpoint": session.microgrid.diesel_setpoints.get(device.name, "auto")
+        })
+    elif isinstance(device, Battery):
+        device_info.update({
+            "capacity_kwh": device.capacity_kwh,
+            "max_power_kw": device.max_power_kw,
+            "state_of_charge": device.get_state_of_charge(),
+            "soc_percent": (device.get_state_of_charge() / device.capacity_kwh) * 100,
+            "efficiency": device.one_way_efficiency ** 2
+        })
+    elif isinstance(device, GridConnection):
+        device_info.update({
+            "import_price": device.import_price,
+            "export_price": device.export_price,
+            "status": "importing" if device.get_power_output() > 0 else "exporting" if device.get_power_output() < 0 else "idle"
+        })
+    return device_info
+
+def _stream_state(session: Session) -> dict:
+    """Environment and per-device state diffed by the live stream"""
+    return {
+        "environment": _env_state(session),
+        "devices": {device.name: _device_info(device, session) for device in session.microgrid.devices},
+    }
+
+def _step_stream(session: Session) -> StepStream:
+    """The session's live stream, created on first use"""
+    if "stream" not in session.cache:
+        stream = StepStream(partial(_stream_state, session))
+        session.microgrid.add_step_listener(stream.publish)
+        session.cache["stream"] = stream
+    return session.cache["stream"]
+
 # === MAIN DASHBOARD ENDPOINT ===
-@app.get("/")
-def get_system_status():
-    """Get complete system status including environment and power systems"""
-    device_states = []
-    for device in microgrid.devices:
-        device_info = {
-            "name": device.name,
-            "type": device.__class__.__name__,
-            "power_output": device.get_power_output()
-        }
+# Serialized GET / responses, kept per session and encoding and rebuilt only when the
+# environment or microgrid state version changes. The ETag prefix is per process so tags
+# from before a restart never match.
+_STATUS_ETAG_PREFIX = uuid.uuid4().hex[:8]
 
-        if isinstance(device, WindTurbine):
-            device_info.update({
-                "rated_power": device.rated_power,
-                "direction": device.direction,
-                "cut_in_speed": device.cut_in_speed,
-                "rated_speed": device.rated_speed,
-                "cut_out_speed": device.cut_out_speed
-            })
-        elif isinstance(device, SolarPanel):
-            device_info.update({
-                "rated_power": device.rated_power,
-                "temp_coefficient": device.temp_coefficient,
-                "stc_temp": device.stc_temp
-            })
-        elif isinstance(device, DieselGenerator):
-            device_info.update({
-                "rated_power": device.rated_power,
-                "diesel_usage_litre_per_kw": device.diesel_usage_litre_per_kw,
-                "current_diesel_usage": device.get_diesel_usage(),
-                "manual_setpoint": microgrid.diesel_setpoints.get(device.name, "auto")
-            })
-        elif isinstance(device, Battery):
-            device_info.update({
+def _status_payload(session: Session) -> dict:
+    """Complete system status, built in a single pass over the devices"""
+    device_states = []
+    batteries = []
+    grid_connections = []
+    total_generation = total_storage_power = total_grid_power = 0.0
+    for device in session.microgrid.devices:
+        device_states.append(_device_info(device, session))
+        power = device.get_power_output()
+        if isinstance(device, Battery):
+            batteries.append({
+                "name": device.name,
                 "capacity_kwh": device.capacity_kwh,
                 "max_power_kw": device.max_power_kw,
                 "state_of_charge": device.get_state_of_charge(),
-                "soc_percent": (device.get_state_of_charge() / device.capacity_kwh) * 100,
-                "efficiency": device.one_way_efficiency ** 2
+                "current_power": power,
+                "soc_percent": (device.get_state_of_charge() / device.capacity_kwh) * 100
             })
+            total_storage_power += power
         elif isinstance(device, GridConnection):
-            device_info.update({
+            grid_connections.append({
+                "name": device.name,
                 "import_price": device.import_price,
                 "export_price": device.export_price,
-                "status": "importing" if device.get_power_output() > 0 else "exporting" if device.get_power_output() < 0 else "idle"
+                "current_power": power,
+                "status": "importing" if power > 0 else "exporting" if power < 0 else "idle"
             })
-
-        device_states.append(device_info)
-
-    # Get all batteries and grids
-    batteries = [d for d in microgrid.devices if isinstance(d, Battery)]
-    grid_connections = [d for d in microgrid.devices if isinstance(d, GridConnection)]
+            total_grid_power += power
+        else:
+            total_generation += power
 
     return {
-        "timestamp": environment.current_time.isoformat(),
-        "environment": _env_state(),
+        "timestamp": session.environment.current_time.isoformat(),
+        "environment": _env_state(session),
         "devices": device_states,
-        "batteries": [
-            {
-                "name": bat.name,
-                "capacity_kwh": bat.capacity_kwh,
-                "max_power_kw": bat.max_power_kw,
-                "state_of_charge": bat.get_state_of_charge(),
-                "current_power": bat.get_power_output(),
-                "soc_percent": (bat.get_state_of_charge() / bat.capacity_kwh) * 100
-            } for bat in batteries
-        ],
-        "grid_connections": [
-            {
-                "name": grid.name,
-                "import_price": grid.import_price,
-                "export_price": grid.export_price,
-                "current_power": grid.get_power_output(),
-                "status": "importing" if grid.get_power_output() > 0 else "exporting" if grid.get_power_output() < 0 else "idle"
-            } for grid in grid_connections
-        ],
-        "diesel_strategy": microgrid.diesel_strategy,
-        "total_generation": sum(d.get_power_output() for d in microgrid.devices if not isinstance(d, (Battery, GridConnection))),
-        "total_storage_power": sum(d.get_power_output() for d in microgrid.devices if isinstance(d, Battery)),
-        "total_grid_power": sum(d.get_power_output() for d in microgrid.devices if isinstance(d, GridConnection)),
-        "device_count": len(microgrid.devices)
+        "batteries": batteries,
+        "grid_connections": grid_connections,
+        "diesel_strategy": session.microgrid.diesel_strategy,
+        "total_generation": total_generation,
+        "total_storage_power": total_storage_power,
+        "total_grid_power": total_grid_power,
+        "device_count": len(device_states)
     }
 
+@app.get("/")
+def get_system_status(if_none_match: Optional[str] = Header(default=None),
+                      accept: Optional[str] = Header(default=None),
+                      session: Session = Depends(current_session)):
+    """Get complete system status including environment and power systems"""
+    media_type = _negotiate(accept)
+    # Under the session lock, so the payload is of exactly the version it is cached and tagged with
+    with session.lock:
+        version = (session.environment.state_version, session.microgrid.state_version)
+        snapshot = session.cache.get("status")
+        if snapshot is None or snapshot["version"] != version:
+            snapshot = session.cache["status"] = {"version": version, "payload": _status_payload(session),
+                                                  "bodies": {}}
+    bodies = snapshot["bodies"]
+    if media_type not in bodies:
+        bodies[media_type] = encode(snapshot["payload"], media_type)
+
+    suffix = "" if media_type == JSON else "-" + media_type.rsplit("/", 1)[-1]
+    etag = f'"{_STATUS_ETAG_PREFIX}-{session.id}-{version[0]}-{version[1]}{suffix}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if if_none_match is not None and (if_none_match.strip() == "*" or
+                                      etag in (tag.strip() for tag in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers)
+    return Response(content=bodies[media_type], media_type=media_type, headers=headers)
+
 # === ENVIRONMENT ENDPOINTS ===
 @app.get("/environment")
-def get_environment():
+def get_environment(session: Session = Depends(current_session)):
     """Get current environment state"""
-    return _env_state()
+    return _env_state(session)
+
+@app.get("/forecast")
+@_locked
+def get_forecast(
+    steps: int = Query(default=24, ge=1, le=FORECAST_MAX_STEPS),
+    timestep_hours: float = Query(default=1.0, gt=0, le=24),
+    total_daily_kwh: float = Query(default=50000.0, gt=0),
+    seed: Optional[int] = Query(default=None, ge=0),
+    accept: Optional[str] = Header(default=None),
+    session: Session = Depends(current_session),
+):
+    """
+    Weather and demand for the next `steps` timesteps from the session's current time,
+    without stepping it. By default this is the session's own trajectory: row 0 holds the
+    current weather, later rows the weather it will step through at this timestep, and
+    demand is what /simulate/realistic will draw. With a seed it is instead a reproducible
+    climatological scenario, the same for every session at that time.
+    """
+    start = session.environment.current_time
+    try:
+        if seed is None:
+            forecast = session_forecast(session.environment, session.demand_rng, steps, timestep_hours,
+                                        total_daily_kwh)
+        else:
+            forecast = forecast_cache.forecast(start, steps, timestep_hours, seed, total_daily_kwh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    source = "session" if seed is None else "scenario"
+    payload = {"start": start.isoformat(), "steps": steps, "timestep_hours": timestep_hours, "source": source,
+               "seed": seed, **forecast}
+    return _encoded_response(payload, accept, table=forecast,
+                             metadata={"timestep_hours": timestep_hours, "source": source, "seed": seed})
 
 @app.post("/step")
-def step_environment(timestep_hours: float = Query(1.0, gt=0, le=24)):
+@_locked
+def step_environment(timestep_hours: float = Query(1.0, gt=0, le=24), session: Session = Depends(current_session)):
     """Step the environment simulation forward"""
     try:
-        environment.step(timestep_hours)
-        return {"message": f"Environment stepped by {timestep_hours} hours", "environment": _env_state()}
+        session.environment.step(timestep_hours)
+        return {"message": f"Environment stepped by {timestep_hours} hours", "environment": _env_state(session)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Environment step error: {str(e)}")
 
 @app.post("/reset")
-def reset_environment():
+@_locked
+def reset_environment(session: Session = Depends(current_session)):
     """Reset the environment to initial state"""
     try:
         # Reset environment to initial values
-        environment.current_time = datetime.now()
-        environment.set_environment_values()
+        session.environment.current_time = datetime.now()
+        session.environment.set_environment_values()
         
-        return {"message": "Environment reset to initial state", "environment": _env_state()}
+        return {"message": "Environment reset to initial state", "environment": _env_state(session)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Environment reset error: {str(e)}")
 
 # === DEVICE MANAGEMENT ENDPOINTS ===
 @app.post("/add/windturbine")
-def add_wind_turbine(turbine: WindTurbineRequest):
+@_locked
+def add_wind_turbine(turbine: WindTurbineRequest, session: Session = Depends(current_session)):
     """Add a wind turbine to the microgrid"""
     try:
-        if any(d.name == turbine.name for d in microgrid.devices):
+        if turbine.name in session.microgrid:
             raise HTTPException(status_code=400, detail=f"Device '{turbine.name}' already exists")
 
-        if not (0 <= turbine.direction <= 360):
-            raise HTTPException(status_code=400, detail="Direction must be 0-360 degrees")
-
         wind_turbine = WindTurbine(
             name=turbine.name,
             rated_power=turbine.rated_power,
@@ -224,7 +433,7 @@ def add_wind_turbine(turbine: WindTurbineRequest):
             cut_out_speed=turbine.cut_out_speed
         )
 
-        microgrid.devices.append(wind_turbine)
+        session.microgrid.add_device(wind_turbine)
 
         return {
             "message": f"Wind turbine '{turbine.name}' added successfully",
@@ -238,10 +447,11 @@ def add_wind_turbine(turbine: WindTurbineRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/add/solarpanel")
-def add_solar_panel(panel: SolarPanelRequest):
+@_locked
+def add_solar_panel(panel: SolarPanelRequest, session: Session = Depends(current_session)):
     """Add a solar panel to the microgrid"""
     try:
-        if any(d.name == panel.name for d in microgrid.devices):
+        if panel.name in session.microgrid:
             raise HTTPException(status_code=400, detail=f"Device '{panel.name}' already exists")
 
         solar_panel = SolarPanel(
@@ -251,7 +461,7 @@ def add_solar_panel(panel: SolarPanelRequest):
             stc_temp=panel.stc_temp
         )
 
-        microgrid.devices.append(solar_panel)
+        session.microgrid.add_device(solar_panel)
 
         return {
             "message": f"Solar panel '{panel.name}' added successfully",
@@ -265,21 +475,13 @@ def add_solar_panel(panel: SolarPanelRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/add/battery")
-def add_battery(battery: BatteryRequest):
+@_locked
+def add_battery(battery: BatteryRequest, session: Session = Depends(current_session)):
     """Add a battery to the microgrid"""
     try:
-        if any(d.name == battery.name for d in microgrid.devices):
+        if battery.name in session.microgrid:
             raise HTTPException(status_code=400, detail=f"Device '{battery.name}' already exists")
 
-        if battery.capacity_kwh <= 0:
-            raise HTTPException(status_code=400, detail="Capacity must be positive")
-        if battery.max_power_kw <= 0:
-            raise HTTPException(status_code=400, detail="Max power must be positive")
-        if not (0 < battery.efficiency <= 1):
-            raise HTTPException(status_code=400, detail="Efficiency must be between 0 and 1")
-        if not (0 <= battery.initial_charge <= 1):
-            raise HTTPException(status_code=400, detail="Initial charge must be between 0 and 1")
-
         new_battery = Battery(
             name=battery.name,
             capacity_kwh=battery.capacity_kwh,
@@ -288,7 +490,7 @@ def add_battery(battery: BatteryRequest):
             initial_charge=battery.initial_charge
         )
 
-        microgrid.devices.append(new_battery)
+        session.microgrid.add_device(new_battery)
 
         return {
             "message": f"Battery '{battery.name}' added successfully",
@@ -303,24 +505,20 @@ def add_battery(battery: BatteryRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/add/gridconnection")
-def add_grid_connection(grid: GridConnectionRequest):
+@_locked
+def add_grid_connection(grid: GridConnectionRequest, session: Session = Depends(current_session)):
     """Add a grid connection to the microgrid"""
     try:
-        if any(d.name == grid.name for d in microgrid.devices):
+        if grid.name in session.microgrid:
             raise HTTPException(status_code=400, detail=f"Device '{grid.name}' already exists")
 
-        if grid.import_price < 0:
-            raise HTTPException(status_code=400, detail="Import price must be non-negative")
-        if grid.export_price < 0:
-            raise HTTPException(status_code=400, detail="Export price must be non-negative")
-
         new_grid = GridConnection(
             name=grid.name,
             import_price=grid.import_price,
             export_price=grid.export_price
         )
 
-        microgrid.devices.append(new_grid)
+        session.microgrid.add_device(new_grid)
 
         return {
             "message": f"Grid connection '{grid.name}' added successfully",
@@ -334,94 +532,280 @@ def add_grid_connection(grid: GridConnectionRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/add/dieselgenerator")
-def add_diesel_generator(generator: DieselGeneratorRequest):
+@_locked
+def add_diesel_generator(generator: DieselGeneratorRequest, session: Session = Depends(current_session)):
     """Add a diesel generator to the microgrid"""
     try:
-        if any(d.name == generator.name for d in microgrid.devices):
+        if generator.name in session.microgrid:
             raise HTTPException(status_code=400, detail=f"Device '{generator.name}' already exists")
 
         diesel_gen = DieselGenerator(
             name=generator.name,
             rated_power=generator.rated_power,
-            diesel_usage_litre_per_kw=generator.diesel_usage_litre_per_kw
+            diesel_usage_litre_per_kw=generator.diesel_usage_litre_per_kw,
+            min_load_fraction=generator.min_load_fraction,
+            min_up_time_hours=generator.min_up_time_hours,
+            min_down_time_hours=generator.min_down_time_hours,
+            startup_cost=generator.startup_cost
         )
 
-        microgrid.devices.append(diesel_gen)
+        session.microgrid.add_device(diesel_gen)
 
         return {
             "message": f"Diesel generator '{generator.name}' added successfully",
             "device": {
                 "name": diesel_gen.name,
                 "rated_power": diesel_gen.rated_power,
-                "diesel_usage_litre_per_kw": diesel_gen.diesel_usage_litre_per_kw
+                "diesel_usage_litre_per_kw": diesel_gen.diesel_usage_litre_per_kw,
+                "min_load_fraction": diesel_gen.min_load_fraction,
+                "min_up_time_hours": diesel_gen.min_up_time_hours,
+                "min_down_time_hours": diesel_gen.min_down_time_hours,
+                "startup_cost": diesel_gen.startup_cost
             }
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/devices/bulk")
+@_locked
+def add_devices_bulk(request: BulkDevicesRequest, session: Session = Depends(current_session)):
+    """Validate and add many devices at once; if any device is invalid, none are added"""
+    try:
+        devices = apply_site_config(session.microgrid, request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    added_by_type = {}
+    for device in devices:
+        added_by_type[device.__class__.__name__] = added_by_type.get(device.__class__.__name__, 0) + 1
+    return {
+        "message": f"Added {len(devices)} devices",
+        "added_by_type": added_by_type,
+        "total_devices": len(session.microgrid.devices),
+        "diesel_strategy": session.microgrid.diesel_strategy,
+    }
+
 @app.delete("/remove/{device_name}")
-def remove_device(device_name: str):
+@_locked
+def remove_device(device_name: str, session: Session = Depends(current_session)):
     """Remove a device from the microgrid"""
-    device_to_remove = None
-    for device in microgrid.devices:
-        if device.name == device_name:
-            device_to_remove = device
-            break
-
-    if device_to_remove is None:
+    try:
+        session.microgrid.remove_device(device_name)
+    except KeyError:
         raise HTTPException(status_code=404, detail=f"Device '{device_name}' not found")
 
-    microgrid.devices.remove(device_to_remove)
-
     return {
         "message": f"Device '{device_name}' removed successfully",
-        "remaining_devices": len(microgrid.devices)
+        "remaining_devices": len(session.microgrid.devices)
     }
 
 # === SIMULATION ENDPOINTS ===
 @app.post("/simulate/step")
-def simulate_step(request: SimulationStepRequest):
+@_locked
+def simulate_step(request: SimulationStepRequest, session: Session = Depends(current_session)):
     """Run one simulation step with specified demand"""
     try:
-        results = microgrid.step(
+        results = session.microgrid.step(
             demand_kw=request.demand_kw,
             timestep_hours=request.timestep_hours
         )
 
         return {
             "simulation_results": results,
-            "environment_state": _env_state()
+            "environment_state": _env_state(session)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Simulation error: {str(e)}")
 
 @app.post("/simulate/realistic")
-def simulate_realistic_step(total_daily_kwh: float = Query(default=50000.0), timestep_hours: float = Query(default=1.0)):
+@_locked
+def simulate_realistic_step(total_daily_kwh: float = Query(default=50000.0), timestep_hours: float = Query(default=1.0),
+                            session: Session = Depends(current_session)):
     """Run simulation step with realistic demand calculation"""
     try:
-        demand = get_realistic_demand(environment.current_time, total_daily_kwh)
-        results = microgrid.step(demand_kw=demand, timestep_hours=timestep_hours)
+        timer = REALISTIC_STEP_SECONDS.timer()
+        demand = get_realistic_demand(session.environment.current_time, total_daily_kwh, session.demand_rng)
+        # economic_dispatch plans against the noise-free profile this demand is drawn around
+        session.microgrid.demand_forecaster = partial(expected_demand, total_daily_kwh=total_daily_kwh)
+        if timer:
+            timer.lap("demand")
+        results = session.microgrid.step(demand_kw=demand, timestep_hours=timestep_hours)
+        if timer:
+            timer.lap("step")
 
-        # Step the environment forward as well
-        environment.step(timestep_hours)
-        
         # Store historical data
-        historical_data = get_historical_data()
-        historical_data.append(results)
+        historical_data = session.historical_data
+        historical_data.append(session.environment.current_time, results, session.microgrid.devices, timestep_hours)
+        session.rolling_stats.add(session.environment.current_time, results, timestep_hours)
+        if timer:
+            timer.lap("record")
 
-        return {
+        # Step the environment forward as well
+        session.environment.step(timestep_hours)
+        if timer:
+            timer.lap("environment_step")
+
+        response = {
             "simulation_results": results,
             "calculated_demand": demand,
-            "environment_state": _env_state()
+            "environment_state": _env_state(session)
         }
+        if timer:
+            timer.lap("response")
+            timer.done()
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Simulation error: {str(e)}")
 
+@app.post("/sweep")
+def parameter_sweep(request: SweepRequest, accept: Optional[str] = Header(default=None),
+                    session: Session = Depends(current_session)):
+    """Evaluate every combination of sizing parameters over a fixed horizon"""
+    if request.horizon_steps <= 0:
+        raise HTTPException(status_code=400, detail="horizon_steps must be positive")
+    if request.timestep_hours <= 0:
+        raise HTTPException(status_code=400, detail="timestep_hours must be positive")
+
+    parameter_grid = {
+        name: values for name, values in {
+            "battery_capacity_kwh": request.battery_capacity_kwh,
+            "battery_max_power_kw": request.battery_max_power_kw,
+            "solar_panel_count": request.solar_panel_count,
+            "diesel_rated_power": request.diesel_rated_power,
+            "diesel_strategy": request.diesel_strategy,
+        }.items() if values is not None
+    }
+    base_devices = request.base_devices
+    if base_devices is None:
+        with session.lock:
+            base_devices = [device.to_config() for device in session.microgrid.devices]
+
+    # Refuse an unsupported Accept header before running the sweep
+    media_type = _negotiate(accept, tabular=True)
+    try:
+        sweep = run_sweep(
+            base_devices, parameter_grid, request.horizon_steps,
+            timestep_hours=request.timestep_hours,
+            total_daily_kwh=request.total_daily_kwh,
+            start_time=request.start_time or session.environment.current_time,
+            seed=request.seed,
+            solar_panel_rated_power=request.solar_panel_rated_power,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    table = dict(zip(sweep["columns"], map(list, zip(*sweep["rows"])))) if sweep["rows"] else \
+        {name: [] for name in sweep["columns"]}
+    return _encoded_response(sweep, media_type, table)
+
+# === SIMULATION JOBS ===
+@app.post("/jobs")
+def submit_job(request: JobRequest, session: Session = Depends(current_session)):
+    """Submit a long-running simulation on a copy of the site; runs in background workers"""
+    if request.horizon_steps <= 0:
+        raise HTTPException(status_code=400, detail="horizon_steps must be positive")
+    if not (0 < request.timestep_hours <= 24):
+        raise HTTPException(status_code=400, detail="timestep_hours must be 0-24")
+
+    replay = _replay_config(request.replay) if request.replay else None
+    start_time = request.start_time
+    if start_time is None and not (replay and replay.get("weather")):
+        start_time = session.environment.current_time
+
+    with session.lock:
+        devices = request.devices if request.devices is not None else [d.to_config() for d in session.microgrid.devices]
+        diesel_strategy = request.diesel_strategy or session.microgrid.diesel_strategy
+    config = {
+        "horizon_steps": request.horizon_steps,
+        "timestep_hours": request.timestep_hours,
+        "total_daily_kwh": request.total_daily_kwh,
+        "seed": request.seed,
+        "start_time": start_time,
+        "devices": devices,
+        "diesel_strategy": diesel_strategy,
+        "session_id": session.id,
+        "replay": replay,
+    }
+    try:
+        job = job_manager.submit(config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+# Directory that replay recordings are read from; replay is disabled when unset
+REPLAY_DIR = os.environ.get("MICROGRID_REPLAY_DIR")
+
+def _replay_config(replay: dict) -> dict:
+    """Job replay config with recording paths resolved inside REPLAY_DIR"""
+    if REPLAY_DIR is None:
+        raise HTTPException(status_code=409, detail="Replay is disabled; set MICROGRID_REPLAY_DIR")
+    unknown = set(replay) - {"weather", "demand"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown replay recordings {sorted(unknown)}")
+    root = os.path.realpath(REPLAY_DIR)
+    resolved = {}
+    for kind, recording in replay.items():
+        if not isinstance(recording, dict) or not isinstance(recording.get("path"), str):
+            raise HTTPException(status_code=400, detail=f"replay.{kind} needs a path")
+        path = os.path.realpath(os.path.join(root, recording["path"]))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            raise HTTPException(status_code=400, detail=f"replay.{kind}: no recording '{recording['path']}'")
+        resolved[kind] = dict(recording, path=path)
+    return resolved
+
+def _session_job(job_id: str, session: Session):
+    """A job submitted from this session; 404 for unknown jobs and other sessions' jobs"""
+    try:
+        job = job_manager.get(job_id)
+    except KeyError:
+        job = None
+    if job is None or job.config.get("session_id") != session.id:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+@app.get("/jobs")
+def list_jobs(session: Session = Depends(current_session)):
+    """List simulation jobs submitted from this session"""
+    return {"jobs": [job.to_dict() for job in job_manager.list() if job.config.get("session_id") == session.id]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, session: Session = Depends(current_session)):
+    """Get the status and progress of a simulation job"""
+    return _session_job(job_id, session).to_dict()
+
+@app.get("/jobs/{job_id}/results")
+def get_job_results(job_id: str, accept: Optional[str] = Header(default=None),
+                    session: Session = Depends(current_session)):
+    """Fetch all per-step results of a completed job as columns"""
+    job = _session_job(job_id, session)
+    if job.results is None:
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is {job.status}")
+
+    return _encoded_response({"job": job.to_dict(), "results": job.results}, accept,
+                             table=job.results, metadata={"job": job.to_dict()})
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str, session: Session = Depends(current_session)):
+    """Cancel a queued or running simulation job"""
+    return job_manager.cancel(_session_job(job_id, session).id).to_dict()
+
+# === LIVE STREAMING ===
+@app.get("/stream")
+async def stream_simulation(session: Session = Depends(current_session)):
+    """
+    Server-Sent Events stream: a full snapshot on connect, then batched per-step results
+    with only the device and environment fields that changed
+    """
+    return StreamingResponse(
+        _step_stream(session).events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # === DIESEL GENERATOR CONTROL ===
 @app.get("/diesel/status")
-def get_diesel_status():
+def get_diesel_status(session: Session = Depends(current_session)):
     """Get status of all diesel generators"""
-    diesel_generators = [d for d in microgrid.devices if isinstance(d, DieselGenerator)]
+    diesel_generators = session.microgrid.diesel_generators
 
     diesel_info = []
     total_diesel_output = 0.0
@@ -435,7 +819,7 @@ def get_diesel_status():
             "diesel_usage_rate": gen.diesel_usage_litre_per_kw,
             "current_diesel_usage": gen.get_diesel_usage(),
             "utilization_percent": (gen.get_power_output() / gen.rated_power) * 100 if gen.rated_power > 0 else 0,
-            "manual_setpoint": microgrid.diesel_setpoints.get(gen.name, "auto")
+            "manual_setpoint": session.microgrid.diesel_setpoints.get(gen.name, "auto")
         }
         diesel_info.append(gen_info)
         total_diesel_output += gen.get_power_output()
@@ -448,34 +832,35 @@ def get_diesel_status():
             "running_generators": sum(1 for gen in diesel_generators if gen.get_power_output() > 0),
             "total_diesel_output": total_diesel_output,
             "total_diesel_usage_lph": total_diesel_usage,
-            "current_strategy": microgrid.diesel_strategy,
+            "current_strategy": session.microgrid.diesel_strategy,
+            "committed_generators": (session.microgrid.unit_commitment.online
+                                     if session.microgrid.diesel_strategy == "unit_commitment" else None),
+            "total_startup_cost": session.microgrid.unit_commitment.total_startup_cost,
             "fleet_utilization": (total_diesel_output / sum(gen.rated_power for gen in diesel_generators)) * 100 if diesel_generators else 0
         }
     }
 
 @app.post("/diesel/strategy")
-def set_diesel_strategy(strategy: str = Query(...)):
+@_locked
+def set_diesel_strategy(strategy: str = Query(...), session: Session = Depends(current_session)):
     """Set diesel control strategy"""
     try:
-        microgrid.set_diesel_strategy(strategy)
+        session.microgrid.set_diesel_strategy(strategy)
         return {
             "message": f"Diesel strategy set to '{strategy}'",
             "strategy": strategy,
-            "available_strategies": ["demand_following", "battery_charging", "manual"]
+            "available_strategies": list(DIESEL_STRATEGIES)
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/diesel/{generator_name}/setpoint")
-def set_diesel_setpoint(generator_name: str, request: DieselSetpointRequest):
+@_locked
+def set_diesel_setpoint(generator_name: str, request: DieselSetpointRequest,
+                        session: Session = Depends(current_session)):
     """Set manual setpoint for diesel generator"""
-    diesel_gen = None
-    for device in microgrid.devices:
-        if isinstance(device, DieselGenerator) and device.name == generator_name:
-            diesel_gen = device
-            break
-
-    if diesel_gen is None:
+    diesel_gen = session.microgrid.get_device(generator_name) if generator_name in session.microgrid else None
+    if not isinstance(diesel_gen, DieselGenerator):
         raise HTTPException(status_code=404, detail=f"Generator '{generator_name}' not found")
 
     if request.setpoint_kw < 0 or request.setpoint_kw > diesel_gen.rated_power:
@@ -484,7 +869,7 @@ def set_diesel_setpoint(generator_name: str, request: DieselSetpointRequest):
             detail=f"Setpoint must be 0-{diesel_gen.rated_power} kW"
         )
 
-    microgrid.set_diesel_setpoint(generator_name, request.setpoint_kw)
+    session.microgrid.set_diesel_setpoint(generator_name, request.setpoint_kw)
 
     return {
         "message": f"Setpoint for '{generator_name}' set to {request.setpoint_kw} kW",
@@ -494,22 +879,44 @@ def set_diesel_setpoint(generator_name: str, request: DieselSetpointRequest):
     }
 
 @app.get("/diesel/strategies")
-def get_diesel_strategies():
+def get_diesel_strategies(session: Session = Depends(current_session)):
     """Get available diesel control strategies"""
     return {
-        "current_strategy": microgrid.diesel_strategy,
-        "available_strategies": {
-            "demand_following": "Run diesel only to meet unmet demand",
-            "battery_charging": "Run diesel to charge battery when SOC < 30%",
-            "manual": "Use manually set setpoints for each generator"
-        }
+        "current_strategy": session.microgrid.diesel_strategy,
+        "available_strategies": DIESEL_STRATEGIES,
+        "diesel_price_per_litre": session.microgrid.dispatcher.diesel_price_per_litre,
+        "dispatch_horizon_steps": session.microgrid.dispatcher.horizon_steps,
+    }
+
+@app.post("/diesel/price")
+@_locked
+def set_diesel_price(price_per_litre: float = Query(..., ge=0), session: Session = Depends(current_session)):
+    """Set the diesel price used by the economic_dispatch strategy"""
+    session.microgrid.dispatcher.diesel_price_per_litre = price_per_litre
+    return {
+        "message": f"Diesel price set to ${price_per_litre}/L",
+        "diesel_price_per_litre": price_per_litre,
+    }
+
+@app.get("/dispatch/plan")
+def get_dispatch_plan(session: Session = Depends(current_session)):
+    """The most recent economic_dispatch plan (first step executed, the rest forecast)"""
+    plan = session.microgrid.dispatch_plan
+    if plan is None:
+        raise HTTPException(status_code=404, detail="No dispatch plan yet. Use the 'economic_dispatch' strategy")
+    return {
+        "battery_kw": plan.battery_kw.tolist(),
+        "diesel_kw": plan.diesel_kw.tolist(),
+        "grid_kw": plan.grid_kw.tolist(),
+        "soc_kwh": plan.soc_kwh.tolist(),
+        "cost": plan.cost,
     }
 
 # === BATTERY & GRID STATUS ===
 @app.get("/batteries/status")
-def get_batteries_status():
+def get_batteries_status(session: Session = Depends(current_session)):
     """Get status of all batteries"""
-    batteries = [d for d in microgrid.devices if isinstance(d, Battery)]
+    batteries = session.microgrid.batteries
 
     battery_statuses = []
     for battery in batteries:
@@ -532,9 +939,9 @@ def get_batteries_status():
     }
 
 @app.get("/grids/status")
-def get_grids_status():
+def get_grids_status(session: Session = Depends(current_session)):
     """Get status of all grid connections"""
-    grids = [d for d in microgrid.devices if isinstance(d, GridConnection)]
+    grids = session.microgrid.grid_connections
 
     grid_statuses = []
     for grid in grids:
@@ -557,10 +964,10 @@ def get_grids_status():
 
 # === UTILITY ENDPOINTS ===
 @app.get("/devices")
-def list_devices():
+def list_devices(session: Session = Depends(current_session)):
     """List all devices"""
     devices = []
-    for device in microgrid.devices:
+    for device in session.microgrid.devices:
         device_info = {
             "name": device.name,
             "type": device.__class__.__name__,
@@ -571,48 +978,199 @@ def list_devices():
     return {
         "devices": devices,
         "total_devices": len(devices),
-        "total_generation": sum(d.get_power_output() for d in microgrid.devices)
+        "total_generation": sum(d.get_power_output() for d in session.microgrid.devices)
     }
 
 @app.get("/health")
-def health_check():
+def health_check(session: Session = Depends(current_session)):
     """Health check endpoint"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "devices_count": len(microgrid.devices),
-        "environment_time": environment.current_time.isoformat(),
+        "devices_count": len(session.microgrid.devices),
+        "environment_time": session.environment.current_time.isoformat(),
         "api_version": "2.0.0"
     }
     
+@app.get("/metrics")
+def get_metrics():
+    """Counters and latency histograms in the Prometheus text format"""
+    if not REGISTRY.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled; unset MICROGRID_METRICS=0")
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/history")
+def get_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    last: Optional[int] = Query(default=None, gt=0),
+    devices: Optional[str] = Query(default=None, description="Comma-separated device names, or * for all"),
+    accept: Optional[str] = Header(default=None),
+    session: Session = Depends(current_session),
+):
+    """Recorded step history between start (inclusive) and end (exclusive), or the last N steps"""
+    historical_data = session.historical_data
+    device_names = devices if devices == "*" else [name for name in (devices or "").split(",") if name]
+    history = historical_data.query(start=start, end=end, devices=device_names, last=last)
+
+    history["total_rows"] = len(historical_data)
+    # Arrow: one flat table, device output columns prefixed "device:"
+    table = {"timestamp": history["timestamps"], **history["columns"],
+             **{f"device:{name}": series for name, series in history["devices"].items()}}
+    return _encoded_response(history, accept, table=table, metadata={"total_rows": history["total_rows"]})
+
 # CO2 emission factor for Australia's grid (kg CO2-e/kWh)
 # Source: https://www.dcceew.gov.au/climate-change/publications/national-greenhouse-accounts-factors-2023
 CO2_EMISSION_FACTOR = 0.67
 
 @app.get("/stats")
-def get_stats():
-    """Get 24-hour statistics"""
-    historical_data = get_historical_data()
-    
-    if not historical_data:
-        return {
-            "co2_emissions_saved_kg": 0,
-            "net_grid_profit_cost": 0,
-            "net_diesel_usage_litres": 0,
-        }
+def get_stats(window: str = Query(default="24h"), session: Session = Depends(current_session)):
+    """Statistics over a rolling window of simulated time (1h, 24h, 7d or 30d)"""
+    try:
+        stats = session.rolling_stats.window(window)
+    except KeyError:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown window '{window}'. Use {list(session.rolling_stats.windows)}")
 
-    total_renewable_generation_24h = sum(d.get("Renewable Generation (kW)", 0) for d in historical_data)
-    net_grid_cost_24h = sum(d.get("Total Grid Cost ($)", 0) for d in historical_data)
-    total_diesel_usage_24h = sum(d.get("Total Diesel Usage (L/h)", 0) for d in historical_data)
+    metrics = stats["metrics"]
+    return {
+        "co2_emissions_saved_kg": metrics["renewable_kw"]["total"] * CO2_EMISSION_FACTOR,
+        "net_grid_profit_cost": metrics["grid_cost"]["total"],
+        "net_diesel_usage_litres": metrics["diesel_usage_lph"]["total"],
+        "window": window,
+        "covered_hours": stats["covered_hours"],
+        "metrics": metrics,
+    }
+
+# === SESSIONS ===
+@app.post("/sessions")
+def create_session(request: SessionRequest):
+    """Create an isolated simulation session; address it with X-Session-ID or ?session_id="""
+    session = Session.create(uuid.uuid4().hex, seed=request.seed, start_time=request.start_time)
+    if request.site is not None:
+        try:
+            apply_site_config(session.microgrid, request.site)
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid site config: {e}")
+    try:
+        return session_manager.add(session).to_dict()
+    except SessionLimitError as e:
+        raise HTTPException(status_code=503, detail=f"{e}; delete one first or set MICROGRID_SESSION_DIR",
+                            headers={"Retry-After": "60"})
+
+@app.get("/sessions")
+def list_sessions():
+    """Sessions in memory (least recently used first) and evicted sessions parked on disk"""
+    return {
+        "sessions": [session.to_dict() for session in session_manager.list()],
+        "parked": session_manager.parked_ids(),
+        "max_sessions": session_manager.max_sessions,
+    }
 
-    co2_emissions_saved_kg = total_renewable_generation_24h * CO2_EMISSION_FACTOR
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    """Summary of one session, loading it back if it was parked"""
+    try:
+        return session_manager.get(session_id).to_dict()
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
 
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    """Delete a session and its parked checkpoint, if any"""
+    try:
+        session_manager.remove(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Session '{session_id}' deleted"}
+
+# === CHECKPOINTS ===
+# MICROGRID_CHECKPOINT_PATH checkpoints the default session
+def _require_checkpointer():
+    checkpointer = get_checkpointer()
+    if checkpointer is None:
+        raise HTTPException(status_code=409, detail="Checkpoints are disabled; set MICROGRID_CHECKPOINT_PATH")
+    return checkpointer
+
+@app.get("/checkpoint")
+def get_checkpoint_status():
+    """Checkpoint file, schedule and result of the last save"""
+    checkpointer = get_checkpointer()
+    if checkpointer is None:
+        return {"enabled": False}
+    return {"enabled": True, **checkpointer.to_dict()}
+
+@app.post("/checkpoint")
+def save_checkpoint():
+    """Write a checkpoint of the default session now"""
+    checkpointer = _require_checkpointer()
+    try:
+        return checkpointer.save()
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Checkpoint failed: {e}")
+
+@app.post("/checkpoint/restore")
+def restore_checkpoint():
+    """Replace the default session's simulation with the last saved checkpoint"""
+    checkpointer = _require_checkpointer()
+    if not os.path.exists(checkpointer.path):
+        raise HTTPException(status_code=404, detail="No checkpoint has been saved yet")
+    try:
+        state, saved_at = read_checkpoint(checkpointer.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    session = session_manager.get(DEFAULT_SESSION_ID)
+    with session.lock:
+        session.restore(state)
     return {
-        "co2_emissions_saved_kg": co2_emissions_saved_kg,
-        "net_grid_profit_cost": net_grid_cost_24h,
-        "net_diesel_usage_litres": total_diesel_usage_24h,
+        "message": "Simulation restored from checkpoint",
+        "saved_at": saved_at.isoformat(),
+        "environment_time": session.environment.current_time.isoformat(),
+        "devices_count": len(session.microgrid.devices),
+        "history_rows": len(session.historical_data),
     }
 
+# === ADMIN ===
+# Admin endpoints require this in the X-Admin-Token header; without it they do not exist
+ADMIN_TOKEN = os.environ.get("MICROGRID_ADMIN_TOKEN") or None
+_profile_lock = threading.Lock()
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_server(seconds: float = Query(10.0, gt=0), interval_ms: float = Query(5.0, gt=0),
+                         scope: str = Query("all"), format: str = Query("collapsed")):
+    """
+    Sample this process's stacks for `seconds` while it keeps serving. scope: all,
+    simulation (samples inside MicrogridManager.step/run/fast_forward or batch dispatch)
+    or requests (inside an API handler). format: collapsed (flamegraph stacks) or pstats (file for pstats/snakeviz).
+    """
+    if format not in PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}'. Use one of {list(PROFILE_FORMATS)}")
+    try:
+        profiler = SamplingProfiler(seconds, interval_ms / 1000, scope)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        # The sampler sleeps between ticks in a worker thread; the event loop keeps serving
+        await run_in_threadpool(profiler.run)
+    finally:
+        _profile_lock.release()
+
+    headers = {f"X-Profile-{key.replace('_', '-').title()}": str(value) for key, value in profiler.to_dict().items()}
+    if format == "pstats":
+        headers["Content-Disposition"] = 'attachment; filename="microgrid.pstats"'
+        return Response(content=profiler.pstats_dump(), media_type="application/octet-stream", headers=headers)
+    return Response(content=profiler.collapsed(), media_type="text/plain", headers=headers)
+
 
 def run():
     """Run the unified API server"""
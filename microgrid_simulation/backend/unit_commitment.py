@@ -0,0 +1,158 @@
+"""
+unit_commitment.py
+
+Merit-order unit commitment for the "unit_commitment" diesel strategy. Generators are kept
+in priority order by fuel use per kWh: idle units in a min-heap, running units in a sorted
+list. Each step only the units that start or stop are moved, so the cost of a step grows
+with the number of running units and commitment changes, not the size of the fleet.
+Honours each generator's minimum load, minimum up/down times and start-up cost.
+"""
+from bisect import insort
+import heapq
+
+
+class UnitCommitment:
+    def __init__(self, generators=()):
+        self.clock = 0.0  # Simulated hours dispatched so far
+        self.last_startup_cost = 0.0
+        self.total_startup_cost = 0.0
+        self.online_capacity = 0.0
+        self._online_min_load = 0.0
+        self._units = {}
+        self._keys = {}
+        self._switched_at = {}  # Clock time of each unit's last start or stop
+        self._offline = []  # heap of (usage, sequence, name)
+        self._online = []   # sorted (usage, sequence, name), most efficient first
+        self._sequence = 0  # Tie-breaker between equally efficient units, in order added
+        for generator in generators:
+            self.add(generator)
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if not isinstance(self._sequence, int):
+            # Checkpoints written while the counter was an itertools.count
+            self._sequence = next(self._sequence)
+
+    @property
+    def online(self) -> list:
+        """Names of running units, most efficient first"""
+        return [name for _, _, name in self._online]
+
+    def add(self, generator):
+        """Register an idle generator"""
+        self._sequence += 1
+        key = (generator.diesel_usage_litre_per_kw, self._sequence, generator.name)
+        self._units[generator.name] = generator
+        self._keys[generator.name] = key
+        self._switched_at[generator.name] = float("-inf")
+        heapq.heappush(self._offline, key)
+
+    def remove(self, name: str):
+        """Forget a generator. Its idle heap entry, if any, is discarded lazily."""
+        key = self._keys.pop(name)
+        generator = self._units.pop(name)
+        del self._switched_at[name]
+        if key in self._online:
+            self._online.remove(key)
+            self._take_offline(generator, add_to_heap=False)
+
+    def reset(self):
+        """Stop every unit immediately, e.g. when another strategy has been driving them"""
+        self._online = []
+        self._offline = [self._keys[name] for name in self._units]
+        heapq.heapify(self._offline)
+        self.online_capacity = self._online_min_load = 0.0
+        for name, generator in self._units.items():
+            generator.power_output = 0.0
+            self._switched_at[name] = float("-inf")
+
+    def _take_offline(self, generator, add_to_heap: bool = True):
+        self.online_capacity -= generator.rated_power
+        self._online_min_load -= generator.rated_power * generator.min_load_fraction
+        generator.power_output = 0.0
+        if add_to_heap:
+            self._switched_at[generator.name] = self.clock
+            heapq.heappush(self._offline, self._keys[generator.name])
+
+    def _can_stop(self, name: str) -> bool:
+        return self.clock - self._switched_at[name] >= self._units[name].min_up_time_hours
+
+    def _next_available(self, deferred: list):
+        """Cheapest idle unit allowed to start, skipping (and deferring) those still in min down time"""
+        while self._offline:
+            key = self._offline[0]
+            name = key[2]
+            if self._keys.get(name) != key:
+                heapq.heappop(self._offline)  # removed generator
+            elif self.clock - self._switched_at[name] < self._units[name].min_down_time_hours:
+                deferred.append(heapq.heappop(self._offline))
+            else:
+                return key
+        return None
+
+    def _commit(self, required_kw: float) -> float:
+        """Start units until required_kw is covered, and cheaper units in place of dearer ones"""
+        # Stop units that are not needed first, so a cheaper unit is only started in place
+        # of one that is
+        self._decommit(required_kw)
+        startup_cost = 0.0
+        deferred = []
+        while True:
+            key = self._next_available(deferred)
+            if key is None:
+                break
+            short = self.online_capacity < required_kw
+            # Start a cheaper unit if it lets a dearer one that is free to stop be replaced
+            cheaper = (self._online and key[0] < self._online[-1][0] and self._can_stop(self._online[-1][2]) and
+                       self.online_capacity - self._units[self._online[-1][2]].rated_power +
+                       self._units[key[2]].rated_power >= required_kw)
+            if not (short or cheaper):
+                break
+            heapq.heappop(self._offline)
+            generator = self._units[key[2]]
+            insort(self._online, key)
+            self.online_capacity += generator.rated_power
+            self._online_min_load += generator.rated_power * generator.min_load_fraction
+            self._switched_at[generator.name] = self.clock
+            startup_cost += generator.startup_cost
+            if not short:
+                self._decommit(required_kw)
+        for key in deferred:
+            heapq.heappush(self._offline, key)
+        return startup_cost
+
+    def _decommit(self, required_kw: float):
+        """Stop the least efficient running units while the rest still cover required_kw"""
+        while self._online:
+            name = self._online[-1][2]
+            generator = self._units[name]
+            if self.online_capacity - generator.rated_power < required_kw or not self._can_stop(name):
+                break
+            self._online.pop()
+            self._take_offline(generator)
+
+    def dispatch(self, required_kw: float, timestep_hours: float) -> tuple:
+        """
+        Commit units for required_kw (kW) and load them in merit order above their minimum
+        loads. Returns (generation kW, fuel L/h, start-up cost $) for the step. Running units
+        held on by minimum up time or minimum load can generate more than required_kw.
+        """
+        required_kw = max(0.0, required_kw)
+        startup_cost = self._commit(required_kw)
+        self._decommit(required_kw)
+
+        remaining = max(0.0, required_kw - self._online_min_load)
+        generation = fuel = 0.0
+        for usage, _, name in self._online:
+            generator = self._units[name]
+            min_load = generator.rated_power * generator.min_load_fraction
+            extra = min(generator.rated_power - min_load, remaining)
+            remaining -= extra
+            generator.power_output = min_load + extra
+            generation += generator.power_output
+            fuel += generator.power_output * usage
+
+        self.clock += timestep_hours
+        self.last_startup_cost = startup_cost
+        self.total_startup_cost += startup_cost
+        return generation, fuel, startup_cost